@@ -0,0 +1,69 @@
+from __future__ import absolute_import, print_function, division
+import threading
+from collections import OrderedDict
+
+__all__ = ['ByteLRUCache']
+
+
+class ByteLRUCache(object):
+  '''Thread-safe LRU cache, bounded by the total size of its values.
+
+  Values must support len() (e.g. bytes), unless a `sizeof` function
+  is provided to measure them.
+  '''
+  def __init__(self, max_bytes, sizeof=len):
+    self.max_bytes = max_bytes
+    self.sizeof = sizeof
+    self.num_bytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self._data = OrderedDict()
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return len(self._data)
+
+  def __contains__(self, key):
+    return key in self._data
+
+  def get(self, key, default=None):
+    with self._lock:
+      if key not in self._data:
+        self.misses += 1
+        return default
+      self.hits += 1
+      # move to the most-recently-used end
+      value, size = self._data.pop(key)
+      self._data[key] = (value, size)
+      return value
+
+  def put(self, key, value):
+    size = self.sizeof(value)
+    with self._lock:
+      if key in self._data:
+        self.num_bytes -= self._data.pop(key)[1]
+      if size > self.max_bytes:
+        # too big to cache at all
+        return
+      self._data[key] = (value, size)
+      self.num_bytes += size
+      while self.num_bytes > self.max_bytes:
+        _, (_, old_size) = self._data.popitem(last=False)
+        self.num_bytes -= old_size
+        self.evictions += 1
+
+  def discard(self, key):
+    with self._lock:
+      if key in self._data:
+        self.num_bytes -= self._data.pop(key)[1]
+
+  def clear(self):
+    with self._lock:
+      self._data.clear()
+      self.num_bytes = 0
+
+  def stats(self):
+    return dict(num_entries=len(self._data), num_bytes=self.num_bytes,
+                max_bytes=self.max_bytes, hits=self.hits, misses=self.misses,
+                evictions=self.evictions)
@@ -0,0 +1,102 @@
+from __future__ import absolute_import, print_function, division
+import numpy as np
+
+from superman.dataset import BooleanMetadata, LookupMetadata
+from superman.dataset._search import parse_query
+
+__all__ = [
+    'CompactLookupMetadata', 'PackedBooleanMetadata', 'compact_metadata',
+    'categorical_codes'
+]
+
+
+class CompactLookupMetadata(LookupMetadata):
+  '''LookupMetadata with labels stored in the smallest unsigned int dtype
+  that fits the number of distinct values.'''
+  def __init__(self, arr, display_name=None, labels=None):
+    LookupMetadata.__init__(self, arr, display_name=display_name,
+                            labels=labels)
+    self.labels = self.labels.astype(_code_dtype(len(self.uniques)),
+                                     copy=False)
+
+  def filter(self, filt_dict):
+    values = filt_dict['select']
+    if values:
+      values = np.char.decode(values, 'utf8')
+      keep = np.isin(self.uniques, values, assume_unique=True)
+      return self._label_mask(keep)
+    query = filt_dict['search']
+    if query:
+      query_fn = parse_query(query)
+      return self._label_mask(
+          np.array([query_fn(x) for x in self.uniques], dtype=bool))
+    return True
+
+  def _label_mask(self, keep):
+    # keep is indexed by label, so this never touches the strings
+    return keep[self.labels]
+
+  def codes(self, mask=Ellipsis):
+    '''Returns (labels, uniques) for the rows selected by mask.'''
+    return self.labels[mask], self.uniques
+
+
+class PackedBooleanMetadata(BooleanMetadata):
+  '''BooleanMetadata stored as one bit per row.'''
+  @property
+  def arr(self):
+    return np.unpackbits(self.bits)[:self.num_bits].astype(bool)
+
+  @arr.setter
+  def arr(self, arr):
+    arr = np.asarray(arr, dtype=bool)
+    self.num_bits = arr.shape[0]
+    self.bits = np.packbits(arr)
+
+  def get_index(self, idx):
+    i = idx % self.num_bits
+    return bool((self.bits[i >> 3] >> (7 - (i & 7))) & 1)
+
+  def size(self):
+    return self.num_bits * self.num_repeats
+
+
+def compact_metadata(metadata):
+  '''Returns a copy of the metadata dict, with lookup columns stored as
+  small integer codes and boolean columns packed into bits.
+  Tag columns are already stored as bitsets, so they're left alone.'''
+  return {key: _compact(m) for key, m in metadata.items()}
+
+
+def _compact(m):
+  if type(m) is LookupMetadata:
+    return CompactLookupMetadata(m.uniques, display_name=m._display_name,
+                                 labels=m.labels)
+  if type(m) is BooleanMetadata:
+    return PackedBooleanMetadata(m.arr, display_name=m._display_name,
+                                 repeats=m.num_repeats)
+  return m
+
+
+def categorical_codes(ds_views, meta_key):
+  '''Returns (codes, label, tick names) for a lookup column across dataset
+  views, matching np.unique(values, return_inverse=True) without building
+  the per-row strings. Returns None if any view's column isn't coded.'''
+  parts, label = [], None
+  for dv in ds_views.ds_views:
+    m, lbl = dv.ds.find_metadata(meta_key)
+    if not isinstance(m, CompactLookupMetadata):
+      return None
+    if label is not None and lbl != label:
+      raise ValueError('Mismatching metadata labels: %r != %r' % (label, lbl))
+    label = lbl
+    parts.append(m.codes(dv.mask))
+  names = np.unique(np.concatenate([uniques for _, uniques in parts]))
+  codes = [np.searchsorted(names, uniques)[labels] for labels, uniques in parts]
+  # drop values that none of the selected rows have
+  used, codes = np.unique(np.concatenate(codes), return_inverse=True)
+  return codes, label, names[used]
+
+
+def _code_dtype(num_values):
+  return np.min_scalar_type(max(num_values - 1, 0))
@@ -11,12 +11,26 @@ from superman.dataset import (
     NumericMetadata, PrimaryKeyMetadata, CompositionMetadata, DateMetadata)
 
 from . import web_datasets
-from .web_datasets import WebLIBSDataset, WebVectorDataset, WebTrajDataset
+from .lazy_arrays import LazyMatrix
+from .loading import LOADER
+from .packed_trajs import (
+    PACKED_DATA, PACKED_OFFSETS, PackedTrajectories, pack, read_packed)
+from .web_datasets import (
+    WebLIBSDataset, WebVectorDataset, WebTrajDataset, storage_dtypes)
 
 
 def load_datasets(config_fh, custom_loaders, public_only=False, user_added=False):
   config = yaml.safe_load(config_fh)
 
+  # queue every entry before starting any, so they load by priority
+  LOADER.pause()
+  try:
+    _add_datasets(config, custom_loaders, public_only, user_added)
+  finally:
+    LOADER.start()
+
+
+def _add_datasets(config, custom_loaders, public_only, user_added):
   for kind, entries in config.items():
     if entries:
       for name, info in entries.items():
@@ -38,16 +52,26 @@ def load_datasets(config_fh, custom_loaders, public_only=False, user_added=False
           meta_mapping = [(k, getattr(web_datasets, cls), mname)
                           for k, cls, mname in info.get('metadata', [])]
           if info.get('vector', False):
-            loader_fn = _generic_vector_loader(meta_mapping)
+            loader_fn = _generic_vector_loader(
+                meta_mapping, lazy=info.get('lazy', False),
+                spectra_file=info.get('spectra_file', None),
+                dtype=info.get('dtype', None),
+                append_only=info.get('append_only', False))
           else:
-            loader_fn = _generic_traj_loader(meta_mapping)
+            loader_fn = _generic_traj_loader(
+                meta_mapping, dtype=info.get('dtype', None),
+                append_only=info.get('append_only', False))
 
+        priority = info.get('priority', 0)
         if kind == 'LIBS':
-          ds = WebLIBSDataset(name, loader_fn, *files)
+          ds = WebLIBSDataset(name, loader_fn, *files, priority=priority,
+                              config=info)
         elif info.get('vector', False):
-          ds = WebVectorDataset(name, kind, loader_fn, *files)
+          ds = WebVectorDataset(name, kind, loader_fn, *files,
+                                priority=priority, config=info)
         else:
-          ds = WebTrajDataset(name, kind, loader_fn, *files)
+          ds = WebTrajDataset(name, kind, loader_fn, *files, priority=priority,
+                              config=info)
 
         if 'description' in info:
           ds.description = info['description']
@@ -73,63 +97,247 @@ def try_load(filepath, data_name):
     return None
 
 
-def _generic_traj_loader(meta_mapping):
+def _generic_traj_loader(meta_mapping, dtype=None, append_only=False):
   """Creates a loader function for a standard HDF5 file representing a
   trajectory dataset. The HDF5 structure is expected to be:
    - /meta/pkey : an array of keys, used to address individual spectra
    - /spectra/[pkey] : a (n,2) trajectory spectrum
    - /meta/foobar : (optional) metadata, specified by the meta_mapping
+
+  Or, in the packed layout (see packed_trajs.py and pack_trajectories.py),
+  which loads much faster:
+   - /spectra_data : all trajectories, concatenated in /meta/pkey order
+   - /spectra_offsets : where each trajectory starts, plus the total length
+
+  Packed trajectories are read into memory. So are the others, if a dtype
+  (float64, float32 or float16) is given; they're stored as that type,
+  but at least float32 (see storage_dtypes).
+
+  With append_only=True, the file's existing spectra are assumed never to
+  change, so reloading just adds any new ones. Only a few of the existing
+  spectra are checked; if any of those changed, the file is reloaded.
   """
+  _, traj_dtype = storage_dtypes(dtype)
+
+  def _get_traj(traj):
+    if traj_dtype is None:
+      return traj.__getitem__
+    return lambda key: np.asarray(traj[key], dtype=traj_dtype)
+
   def _load(ds, filepath):
     data = try_load(filepath, str(ds))
     if data is None:
       return False
     meta = data['/meta']
-    kwargs = {}
-    for key, cls, display_name in meta_mapping:
-      if key not in meta:
-        continue
-      m = meta[key]
-      if cls is DateMetadata:
-        m = pd.to_datetime(np.array(m))
-      elif cls is PrimaryKeyMetadata:
-        assert key == 'pkey'
-        continue
-      safe_key = re.sub(r'[^a-z0-9_-]', '', key, flags=re.I)
-      kwargs[safe_key] = cls(m, display_name=display_name)
-    ds.set_data(meta['pkey'], data['/spectra'], **kwargs)
+    keys = _as_unicode(meta['pkey'])
+    if PACKED_DATA in data:
+      traj = read_packed(data, keys, dtype=traj_dtype)
+    elif traj_dtype is not None:
+      traj = pack(keys, map(_get_traj(data['/spectra']), keys))
+    else:
+      traj = data['/spectra']
+    ds.set_data(keys, traj, **_traj_metadata(meta, meta_mapping))
+    if append_only:
+      ds.row_samples = _row_samples(keys, traj.__getitem__)
     return True
+
+  def _append(ds, filepath):
+    data = try_load(filepath, str(ds))
+    if data is None:
+      return False
+    meta = data['/meta']
+    keys = _as_unicode(meta['pkey'])
+    packed = PACKED_DATA in data
+    if packed:
+      # read from the file only as needed, like /spectra
+      traj = PackedTrajectories(keys, data[PACKED_DATA],
+                                data[PACKED_OFFSETS][()])
+    else:
+      traj = data['/spectra']
+    get_traj = _get_traj(traj)
+    n_old = _num_unchanged(ds, keys, len(keys), get_traj)
+    if n_old is None:
+      return False
+    # keep the old trajectories, which the current snapshot shares
+    if packed:
+      # one contiguous read of just the new trajectories
+      new = read_packed(data, keys[n_old:], dtype=traj_dtype, start=n_old)
+      traj = ds.traj.extend(new.keys_array, new.values())
+    elif traj_dtype is not None:
+      traj = ds.traj.extend(keys[n_old:], map(get_traj, keys[n_old:]))
+    ds.extend_data(traj, keys[n_old:], **_traj_metadata(meta, meta_mapping))
+    ds.row_samples = _row_samples(keys, traj.__getitem__)
+    return True
+
+  if append_only:
+    _load.append = _append
   return _load
 
 
-def _generic_vector_loader(meta_mapping):
+def _traj_metadata(meta, meta_mapping):
+  kwargs = {}
+  for key, cls, display_name in meta_mapping:
+    if key not in meta:
+      continue
+    m = meta[key]
+    if cls is DateMetadata:
+      m = pd.to_datetime(np.array(m))
+    elif cls is PrimaryKeyMetadata:
+      assert key == 'pkey'
+      continue
+    safe_key = re.sub(r'[^a-z0-9_-]', '', key, flags=re.I)
+    kwargs[safe_key] = cls(m, display_name=display_name)
+  return kwargs
+
+
+def _generic_vector_loader(meta_mapping, lazy=False, spectra_file=None,
+                           dtype=None, append_only=False):
   """Creates a loader function for a standard HDF5 file representing a
   vector dataset. The HDF5 structure is expected to be:
    - /meta/waves : length-d array of wavelengths
    - /spectra : (n,d) array of spectra
    - /meta/foobar : (optional) metadata, specified by the meta_mapping
    - /composition/[name] : (optional) composition metadata
+
+  With lazy=True, spectra stay on disk and are read in cached blocks of rows
+  (see lazy_arrays.py). They're read from /spectra, unless spectra_file
+  names a .npy file to memory-map instead.
+
+  With a dtype (float64, float32 or float16), spectra are stored as that
+  type: in memory, or in the block cache when lazy. The wavelengths are
+  kept at least float32 (see storage_dtypes).
+
+  With append_only=True, the file's existing rows are assumed never to
+  change, so reloading just adds any new ones. Only a few of the existing
+  rows are checked; if any of those changed, the file is reloaded.
   """
+  pkey_names = [k for k, cls, _ in meta_mapping if cls is PrimaryKeyMetadata]
+  pkey_name = pkey_names[0] if pkey_names else None
+  spectra_dtype, bands_dtype = storage_dtypes(dtype)
+
+  def _source(data):
+    if spectra_file is not None:
+      return np.load(spectra_file, mmap_mode='r')
+    return data['/spectra']
+
+  def _spectra(source):
+    if lazy:
+      return LazyMatrix(source, dtype=spectra_dtype)
+    if spectra_dtype is not None:
+      return np.asarray(source, dtype=spectra_dtype)
+    return source
+
+  def _get_row(source):
+    if spectra_dtype is None:
+      return source.__getitem__
+    return lambda i: np.asarray(source[i], dtype=spectra_dtype)
+
+  def _bands(meta):
+    if bands_dtype is None:
+      return meta['waves']
+    return np.asarray(meta['waves'], dtype=bands_dtype)
+
   def _load(ds, filepath):
     data = try_load(filepath, str(ds))
     if data is None:
       return False
     meta = data['/meta']
-    kwargs = {}
-    for key, cls, display_name in meta_mapping:
-      if key not in meta:
-        continue
-      if cls is PrimaryKeyMetadata:
-        kwargs['pkey'] = cls(meta[key])
-      elif cls is DateMetadata:
-        kwargs[key] = cls(pd.to_datetime(np.array(meta[key])),
-                          display_name=display_name)
-      else:
-        kwargs[key] = cls(meta[key], display_name=display_name)
-    if '/composition' in data:
-      comp_meta = {name: NumericMetadata(arr, display_name=name) for name, arr
-                   in data['/composition'].items()}
-      kwargs['Composition'] = CompositionMetadata(comp_meta)
-    ds.set_data(meta['waves'], data['/spectra'], **kwargs)
+    kwargs = _vector_metadata(data, meta_mapping)
+    if pkey_name is not None and pkey_name in meta:
+      # building the key -> index mapping is slow for big datasets
+      kwargs['pkey'] = ds.cached(
+          'pkey', lambda: PrimaryKeyMetadata(meta[pkey_name]))
+    spectra = _spectra(_source(data))
+    ds.set_data(_bands(meta), spectra, **kwargs)
+    if append_only:
+      ds.row_samples = _row_samples(np.arange(len(spectra)),
+                                    spectra.__getitem__)
+    return True
+
+  def _append(ds, filepath):
+    data = try_load(filepath, str(ds))
+    if data is None:
+      return False
+    meta = data['/meta']
+    if not np.array_equal(_bands(meta), ds.bands):
+      return False
+    source = _source(data)
+    keys = None
+    if pkey_name is not None and pkey_name in meta:
+      keys = _as_unicode(meta[pkey_name])
+    n_old = _num_unchanged(ds, keys, len(source), _get_row(source))
+    if n_old is None:
+      return False
+    if lazy or spectra_dtype is None:
+      spectra = _spectra(source)
+    else:
+      # only read (and convert) the new rows
+      spectra = np.concatenate((ds.intensities, _spectra(source[n_old:])))
+    new_keys = None if keys is None else keys[n_old:]
+    ds.extend_data(spectra, new_keys=new_keys,
+                   **_vector_metadata(data, meta_mapping))
+    ds.row_samples = _row_samples(np.arange(len(spectra)), spectra.__getitem__)
     return True
+
+  if append_only:
+    _load.append = _append
+  # read by the loader, but not passed to it
+  _load.sources = () if spectra_file is None else (spectra_file,)
   return _load
+
+
+def _vector_metadata(data, meta_mapping):
+  meta = data['/meta']
+  kwargs = {}
+  for key, cls, display_name in meta_mapping:
+    if key not in meta or cls is PrimaryKeyMetadata:
+      continue
+    if cls is DateMetadata:
+      kwargs[key] = cls(pd.to_datetime(np.array(meta[key])),
+                        display_name=display_name)
+    else:
+      kwargs[key] = cls(meta[key], display_name=display_name)
+  if '/composition' in data:
+    comp_meta = {name: NumericMetadata(arr, display_name=name) for name, arr
+                 in data['/composition'].items()}
+    kwargs['Composition'] = CompositionMetadata(comp_meta)
+  return kwargs
+
+
+def _row_samples(addrs, get_row, num_samples=8):
+  """Copies a few evenly spaced rows (or trajectories), which are checked
+  on reload to see whether existing data has changed."""
+  if len(addrs) == 0:
+    return []
+  idx = np.unique(np.linspace(0, len(addrs) - 1, num_samples).astype(int))
+  return [(addrs[i], np.array(get_row(addrs[i]))) for i in idx]
+
+
+def _num_unchanged(ds, keys, num_rows, get_row):
+  """Returns the number of spectra ds had when it was loaded, if the file
+  still starts with them. Returns None if any of them changed."""
+  samples = getattr(ds, 'row_samples', None)
+  if samples is None or (keys is None) != (ds.pkey is None):
+    return None
+  n_old = ds.num_spectra()
+  if num_rows < n_old:
+    return None
+  if keys is not None and not np.array_equal(keys[:n_old], ds.pkey.keys):
+    return None
+  for addr, row in samples:
+    try:
+      if not np.array_equal(get_row(addr), row):
+        return None
+    except KeyError:
+      return None
+  return n_old
+
+
+def _as_unicode(arr):
+  # the same coercion as PrimaryKeyMetadata
+  arr = np.array(arr)
+  if arr.dtype.char not in 'US':
+    arr = arr.astype('S')
+  if arr.dtype.char == 'S':
+    arr = np.char.decode(arr, 'utf8')
+  return arr
@@ -0,0 +1,115 @@
+from __future__ import absolute_import, print_function, division
+import numpy as np
+
+__all__ = ['decimate', 'plot_decimated', 'track_collection', 'full_data']
+
+
+def decimate(traj, xlim, num_columns):
+  '''Reduces an (n,2) trajectory to the points that matter at a given
+  resolution: for each of `num_columns` pixel columns spanning `xlim`,
+  keeps only the min and max points (plus any NaN gaps).
+  Points outside xlim are dropped, except for one on either side.
+  The result looks the same as the full trajectory when drawn at that size.
+  '''
+  x = traj[:,0]
+  n = len(x)
+  if n <= 2 * num_columns:
+    return traj
+  if x[0] > x[-1]:
+    return decimate(traj[::-1], xlim, num_columns)[::-1]
+  dx = np.diff(x)
+  if not (dx >= 0).all():
+    # we can only handle trajectories that are sorted by x
+    return traj
+
+  # restrict to the visible region
+  xmin, xmax = sorted(xlim)
+  start = max(0, np.searchsorted(x, xmin, side='left') - 1)
+  stop = min(n, np.searchsorted(x, xmax, side='right') + 1)
+  traj = traj[start:stop]
+  if len(traj) <= 2 * num_columns:
+    return traj
+  x, y = traj.T
+
+  # assign each point to a pixel column (which is sorted, because x is)
+  scale = num_columns / max(xmax - xmin, np.finfo(float).tiny)
+  col = np.clip(((x - xmin) * scale).astype(int), -1, num_columns)
+  is_nan = np.isnan(y)
+  starts = np.flatnonzero(np.diff(col)) + 1
+  ends = np.append(starts, len(col)) - 1
+  starts = np.insert(starts, 0, 0)
+  # sort by (column, y), so the min/max of each column are at its ends
+  mins = np.lexsort((np.where(is_nan, np.inf, y), col))[starts]
+  maxs = np.lexsort((np.where(is_nan, -np.inf, y), col))[ends]
+
+  keep = np.zeros(len(traj), dtype=bool)
+  keep[mins] = True
+  keep[maxs] = True
+  keep |= is_nan
+  return traj[keep]
+
+
+def plot_decimated(ax, x, y, *args, **kwargs):
+  '''Like ax.plot(x, y, ...) for a single line, but only draws as many
+  points as can be seen. The line is re-decimated when the x limits change.'''
+  line, = ax.plot(x, y, *args, **kwargs)
+  line._superman_full = np.column_stack((x, y))
+  _watch_axes(ax)
+  _decimate_artist(line, ax.get_xlim(), _num_columns(ax))
+  return line
+
+
+def track_collection(ax, collection, trajs):
+  '''Decimates the segments of a LineCollection made from trajs,
+  which should already be added to the axes.'''
+  collection._superman_full = trajs
+  _watch_axes(ax)
+  _decimate_artist(collection, ax.get_xlim(), _num_columns(ax))
+
+
+def full_data(artist):
+  '''Returns the undecimated data for a Line2D or LineCollection.'''
+  full = getattr(artist, '_superman_full', None)
+  if full is not None:
+    return full
+  if hasattr(artist, 'get_xydata'):
+    return artist.get_xydata()
+  return artist.get_segments()
+
+
+def _num_columns(ax):
+  # the whole figure width is a safe upper bound for the axes width
+  return max(1, int(ax.figure.bbox.width))
+
+
+def _decimate_artist(artist, xlim, num_columns):
+  full = artist._superman_full
+  if hasattr(artist, 'set_data'):
+    artist.set_data(*decimate(full, xlim, num_columns).T)
+  else:
+    artist.set_segments([decimate(t, xlim, num_columns) for t in full])
+
+
+def _on_xlim_changed(ax):
+  xlim = ax.get_xlim()
+  num_columns = _num_columns(ax)
+  for artist in list(ax.lines) + list(ax.collections):
+    if hasattr(artist, '_superman_full'):
+      _decimate_artist(artist, xlim, num_columns)
+
+
+def _on_resize(event):
+  for ax in event.canvas.figure.axes:
+    _on_xlim_changed(ax)
+
+
+def _watch_axes(ax):
+  # Axes.cla() replaces the callback registry, so check against it directly.
+  if getattr(ax, '_superman_decimate_cbs', None) is not ax.callbacks:
+    ax.callbacks.connect('xlim_changed', _on_xlim_changed)
+    ax._superman_decimate_cbs = ax.callbacks
+  # the browser resizes figures to fit the page, which changes num_columns
+  canvas = ax.figure.canvas
+  if canvas is not None and not getattr(canvas, '_superman_decimate', False):
+    canvas.mpl_connect('resize_event', _on_resize)
+    canvas._superman_decimate = True
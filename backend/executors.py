@@ -0,0 +1,119 @@
+from __future__ import absolute_import, print_function, division
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .profiling import PROFILER
+
+__all__ = ['POOLS', 'run_in_pool', 'configure_pools', 'pool_stats']
+
+
+class MeteredPool(object):
+  '''A named, fixed-size thread pool that keeps track of its queue.
+
+  submit() returns a concurrent.futures.Future, which coroutines can yield.
+  '''
+  def __init__(self, name, num_threads):
+    self.name = name
+    self.num_threads = num_threads
+    self._executor = None
+    self._lock = threading.Lock()
+    # metrics
+    self.queue_length = 0
+    self.active = 0
+    self.num_tasks = 0
+    self.total_wait_time = 0.
+    self.max_wait_time = 0.
+    self.total_run_time = 0.
+
+  def resize(self, num_threads):
+    if self._executor is not None:
+      raise RuntimeError('Pool %r is already running' % self.name)
+    self.num_threads = num_threads
+
+  def submit(self, fn, *args, **kwargs):
+    return self.submit_unprofiled(PROFILER.wrap(fn), *args, **kwargs)
+
+  def submit_unprofiled(self, fn, *args, **kwargs):
+    '''Like submit, for jobs that are already wrapped by the profiler (or
+    that run jobs which are, like RenderPool._run_queue).'''
+    with self._lock:
+      if self._executor is None:
+        self._executor = ThreadPoolExecutor(self.num_threads)
+      self.queue_length += 1
+    return self._executor.submit(self._run, time.time(), fn, args, kwargs)
+
+  def _run(self, submit_time, fn, args, kwargs):
+    start = time.time()
+    wait = start - submit_time
+    with self._lock:
+      self.queue_length -= 1
+      self.active += 1
+      self.total_wait_time += wait
+      self.max_wait_time = max(self.max_wait_time, wait)
+    try:
+      return fn(*args, **kwargs)
+    finally:
+      with self._lock:
+        self.active -= 1
+        self.num_tasks += 1
+        self.total_run_time += time.time() - start
+
+  def reset(self):
+    '''Forgets the executor and any queued work. For forked children, which
+    inherit the executor (and maybe a held lock) but none of its threads.'''
+    self._executor = None
+    self._lock = threading.Lock()
+    self.queue_length = 0
+    self.active = 0
+
+  def stats(self):
+    num_tasks = max(1, self.num_tasks)
+    return dict(num_threads=self.num_threads, queue_length=self.queue_length,
+                active=self.active, num_tasks=self.num_tasks,
+                mean_wait_time=self.total_wait_time / num_tasks,
+                max_wait_time=self.max_wait_time,
+                mean_run_time=self.total_run_time / num_tasks)
+
+
+# Shared pools for all work that shouldn't block the IOLoop:
+#  cpu: numeric work, like model fitting and spectrum matching
+#  io: reading and writing dataset files
+#  load: loading datasets at startup (see loading.py)
+#  draw: matplotlib drawing (see render.py)
+POOLS = dict(
+    cpu=MeteredPool('cpu', multiprocessing.cpu_count()),
+    io=MeteredPool('io', 4),
+    load=MeteredPool('load', 4),
+    draw=MeteredPool('draw', 2),
+)
+
+
+def run_in_pool(pool_name, fn, *args, **kwargs):
+  '''Calls fn(*args, **kwargs) on a thread from the named pool.
+  Returns a Future, so coroutines can do: result = yield run_in_pool(...)'''
+  return POOLS[pool_name].submit(fn, *args, **kwargs)
+
+
+def configure_pools(sizes):
+  '''Sets pool sizes from a {pool_name: num_threads} mapping.
+  Must be called before any pool is used.'''
+  for name, num_threads in sizes.items():
+    POOLS[name].resize(int(num_threads))
+
+
+def pool_stats():
+  return {name: pool.stats() for name, pool in POOLS.items()}
+
+
+def _reset_pools():
+  for pool in POOLS.values():
+    pool.reset()
+
+
+# Without this, pools used before a fork (like load and cpu, by startup
+# loading in --workers mode) hang on every submit in the child.
+if hasattr(os, 'register_at_fork'):
+  os.register_at_fork(after_in_child=_reset_pools)
@@ -0,0 +1,151 @@
+from __future__ import absolute_import, print_function, division
+import logging
+import numpy as np
+import time
+from collections import Counter, OrderedDict
+
+__all__ = ['FigureRegistry']
+
+
+class FigureRegistry(object):
+  '''Bounded mapping of figure number -> FigData.
+
+  Figures are discarded when:
+   * their websocket closes (the normal case),
+   * they haven't been used for `idle_ttl` seconds and have no open sockets,
+   * the registry holds more than `max_figures` figures, or
+   * the (approximate) memory held by all figures exceeds `max_bytes`.
+  The last two cases evict in least-recently-used order,
+  preferring figures without an open websocket.
+  '''
+  def __init__(self, max_figures=500, max_bytes=1024 * 2**20, idle_ttl=3600):
+    self.max_figures = max_figures
+    self.max_bytes = max_bytes
+    self.idle_ttl = idle_ttl
+    # fignum -> FigData, ordered from least to most recently used
+    self._figures = OrderedDict()
+    self._last_used = {}
+    # eviction reason -> count
+    self.evictions = Counter()
+    self.total_registered = 0
+
+  def __len__(self):
+    return len(self._figures)
+
+  def __contains__(self, fignum):
+    return fignum in self._figures
+
+  def __iter__(self):
+    return iter(self._figures)
+
+  def __getitem__(self, fignum):
+    fig_data = self._figures[fignum]
+    self.touch(fignum)
+    return fig_data
+
+  def __setitem__(self, fignum, fig_data):
+    self._figures.pop(fignum, None)
+    self._figures[fignum] = fig_data
+    self._last_used[fignum] = time.time()
+    self.total_registered += 1
+    self.enforce_limits()
+
+  def get(self, fignum, default=None):
+    if fignum not in self._figures:
+      return default
+    return self[fignum]
+
+  def items(self):
+    # Doesn't count as a use of each figure.
+    return list(self._figures.items())
+
+  def touch(self, fignum):
+    # move to the most-recently-used end
+    self._figures[fignum] = self._figures.pop(fignum)
+    self._last_used[fignum] = time.time()
+
+  def pop(self, fignum, *default):
+    '''Removes a figure whose websocket has closed.'''
+    if fignum not in self._figures:
+      if default:
+        return default[0]
+      raise KeyError(fignum)
+    self.evictions['closed'] += 1
+    self._last_used.pop(fignum, None)
+    return self._figures.pop(fignum)
+
+  def idle_seconds(self, fignum):
+    return time.time() - self._last_used[fignum]
+
+  def memory_usage(self):
+    return sum(fd.nbytes() for fd in self._figures.values())
+
+  def sweep(self):
+    '''Evicts idle figures, then enforces the size and memory caps.
+    Called periodically from the IOLoop.'''
+    if self.idle_ttl:
+      cutoff = time.time() - self.idle_ttl
+      for fignum, fig_data in list(self._figures.items()):
+        if self._last_used[fignum] > cutoff:
+          # all remaining figures have been used more recently
+          break
+        if not _has_sockets(fig_data):
+          self._evict(fignum, 'idle')
+    self.enforce_limits()
+
+  def enforce_limits(self):
+    if self.max_figures:
+      while len(self._figures) > self.max_figures:
+        self._evict(self._lru_victim(), 'lru')
+    if self.max_bytes:
+      sizes = OrderedDict((k, fd.nbytes()) for k, fd in self._figures.items())
+      total = sum(sizes.values())
+      # always leave the most recently used figure alone
+      while total > self.max_bytes and len(sizes) > 1:
+        fignum = self._lru_victim()
+        total -= sizes.pop(fignum)
+        self._evict(fignum, 'memory')
+
+  def stats(self):
+    return dict(num_figures=len(self._figures),
+                total_registered=self.total_registered,
+                memory_bytes=self.memory_usage(),
+                max_figures=self.max_figures, max_bytes=self.max_bytes,
+                idle_ttl=self.idle_ttl, evictions=dict(self.evictions))
+
+  def _lru_victim(self):
+    # never the most recently used figure, which may have just been
+    # registered (and so can't have a socket yet)
+    candidates = list(self._figures.items())[:-1]
+    for fignum, fig_data in candidates:
+      if not _has_sockets(fig_data):
+        return fignum
+    return candidates[0][0]
+
+  def _evict(self, fignum, reason):
+    fig_data = self._figures.pop(fignum)
+    self._last_used.pop(fignum, None)
+    self.evictions[reason] += 1
+    logging.info('Evicting figure %d (%s)', fignum, reason)
+    # Closing the sockets lets the browser know this figure is gone.
+    for ws in list(getattr(fig_data.manager, 'web_sockets', ())):
+      ws.close()
+
+
+def _has_sockets(fig_data):
+  return bool(getattr(fig_data.manager, 'web_sockets', None))
+
+
+def estimate_nbytes(obj, _depth=0):
+  '''Rough count of the bytes held by numpy arrays inside obj.'''
+  if isinstance(obj, np.ndarray):
+    return obj.nbytes
+  if _depth > 3 or obj is None:
+    return 0
+  if isinstance(obj, dict):
+    return sum(estimate_nbytes(v, _depth + 1) for v in obj.values())
+  if isinstance(obj, (list, tuple)):
+    return sum(estimate_nbytes(v, _depth + 1) for v in obj)
+  if hasattr(obj, '__dict__') and not isinstance(obj, type):
+    return sum(estimate_nbytes(v, _depth + 1) for v in vars(obj).values())
+  return 0
@@ -9,6 +9,7 @@ from .figure import routes as figure_routes
 from .filterplots import routes as filterplot_routes
 from .generic_models import routes as model_routes
 from .matching import routes as matching_routes
+from .metrics import routes as metrics_routes
 from .peakfit import routes as peak_routes
 from .predictions import routes as predict_routes
 from .search import routes as search_routes
@@ -20,5 +21,5 @@ all_routes = list(itertools.chain(
     page_routes, dataset_routes, matching_routes, explorer_routes,
     figure_routes, spectrum_routes, filterplot_routes, peak_routes,
     composition_routes, predict_routes, upload_routes, model_routes,
-    classify_routes, search_routes
+    classify_routes, search_routes, metrics_routes
 ))
@@ -7,6 +7,7 @@ from tornado import gen
 
 from .generic_models import GenericModelHandler, async_crossval
 from ..models import CLASSIFICATION_MODELS, KNN
+from ..render import RENDERER
 
 
 class ClassificationModelHandler(GenericModelHandler):
@@ -113,8 +114,8 @@ class ClassificationModelHandler(GenericModelHandler):
         plot_kwargs['logx'] = True
 
       # run the cross validation
-      yield gen.Task(async_crossval, fig_data, model_cls, len(variables),
-                     cv_args, cv_kwargs, **plot_kwargs)
+      yield async_crossval(fig_data, model_cls, len(variables), cv_args,
+                           cv_kwargs, **plot_kwargs)
       return
 
     if bool(int(do_train)):
@@ -154,8 +155,8 @@ class ClassificationModelHandler(GenericModelHandler):
     preds = model.predict(X, variables)
 
     # plot
-    stats = _plot_confusion(preds, fig_data.figure, variables)
-    fig_data.manager.canvas.draw()
+    stats = yield RENDERER.draw(fig_data, _plot_confusion, preds,
+                                fig_data.figure, variables)
     fig_data.last_plot = 'classify_preds'
 
     res = dict(stats=stats, info=fig_data.classify_model.info_html())
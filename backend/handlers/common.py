@@ -2,6 +2,8 @@ from __future__ import absolute_import, print_function, division
 import ast
 import logging
 import numpy as np
+import time
+import tornado.gen
 import tornado.web
 from superman.baseline import BL_CLASSES
 from superman.baseline.common import Baseline
@@ -13,9 +15,13 @@ try:
 except ImportError:
     from itertools import zip_longest
 
+from ..memory import MEMORY
+from ..metrics import METRICS
+from ..profiling import PROFILER
 from ..web_datasets import DATASETS
 
-__all__ = ['BLR_KWARGS', 'BaseHandler', 'MultiDatasetHandler']
+__all__ = ['BLR_KWARGS', 'BaseHandler', 'DatasetLoading',
+           'MultiDatasetHandler']
 
 
 def _make_blr_kwargs():
@@ -35,9 +41,88 @@ def _make_blr_kwargs():
 BLR_KWARGS = _make_blr_kwargs()
 
 
+# Pairs of request arguments that name datasets. BaseHandler.prepare loads
+# these datasets again, if they were unloaded to save memory.
+DATASET_ARGS = [('ds_kind', 'ds_name'), ('ds_kind[]', 'ds_name[]'),
+                ('kind', 'name'), ('kind[]', 'name[]'),
+                ('target_kind', 'target_name')]
+
+
+class DatasetLoading(tornado.web.HTTPError):
+    '''Raised for requests that need a dataset which is still loading.'''
+    RETRY_SECONDS = 2
+
+    def __init__(self, ds):
+        tornado.web.HTTPError.__init__(
+            self, 503, 'Dataset %s is loading, try again shortly', ds.name)
+
+
 class BaseHandler(tornado.web.RequestHandler):
     is_private = True
 
+    def prepare(self):
+        # Time spent so far (reading the request, waiting in the IOLoop).
+        self._timings = dict(render=0., write=0.)
+        self._timings['prepare'] = time.time() - self.request._start_time
+        self._profile = PROFILER.start(type(self).__name__,
+                                       self.request.method, self.request.uri)
+        return self._warm_requested_datasets()
+
+    @tornado.gen.coroutine
+    def _warm_requested_datasets(self):
+        # (kind, name) -> snapshot loaded for this request, see get_dataset
+        self._warmed = {}
+        pending = {}
+        for kind_arg, name_arg in DATASET_ARGS:
+            for key in zip(self.get_arguments(kind_arg),
+                           self.get_arguments(name_arg)):
+                ds = DATASETS.get(key[0], {}).get(key[1])
+                if (ds is not None and ds.cold and key not in pending and
+                        (ds.is_public or self._include_private_datasets())):
+                    pending[key] = ds.warm_async()
+        # the loads run in the background, without blocking the IOLoop
+        for key, future in pending.items():
+            self._warmed[key] = yield future
+
+    def render_string(self, template_name, **kwargs):
+        start = time.time()
+        try:
+            return super(BaseHandler, self).render_string(template_name,
+                                                          **kwargs)
+        finally:
+            if hasattr(self, '_timings'):
+                self._timings['render'] += time.time() - start
+
+    def flush(self, *args, **kwargs):
+        start = time.time()
+        try:
+            return super(BaseHandler, self).flush(*args, **kwargs)
+        finally:
+            if hasattr(self, '_timings'):
+                self._timings['write'] += time.time() - start
+
+    def on_finish(self):
+        timings = getattr(self, '_timings', None)
+        if timings is None:
+            # prepare() never ran, e.g. because of a 405 error
+            return
+        if self._profile is not None:
+            PROFILER.finish(self._profile)
+        route = type(self).__name__
+        method = self.request.method
+        total = self.request.request_time()
+        timings['total'] = total
+        timings['handler'] = max(0., total - timings['prepare'] -
+                                 timings['render'] - timings['write'])
+        for phase, seconds in timings.items():
+            METRICS.observe(route, method, phase, seconds)
+
+        threshold = self.application.settings.get('slow_request_seconds')
+        if threshold and total > threshold:
+            logging.warning('Slow request (%.2fs): %s %s %s args=%s', total,
+                            method, self.request.path, self._status_code,
+                            _loggable_args(self.request.arguments))
+
     def get_fig_data(self, fignum=None):
         if fignum is None:
             fignum = int(self.get_argument('fignum', 0))
@@ -63,9 +148,19 @@ class BaseHandler(tornado.web.RequestHandler):
 
     def get_dataset(self, ds_kind, ds_name):
         ds = DATASETS[ds_kind].get(ds_name, None)
-        if ds is None or ds.is_public or self._include_private_datasets():
-            return ds
-        return None
+        if ds is None or not (ds.is_public or
+                              self._include_private_datasets()):
+            return None
+        if ds.cold and (ds_kind, ds_name) in getattr(self, '_warmed', {}):
+            # loaded again by prepare() (None if that failed)
+            ds = self._warmed[ds_kind, ds_name]
+        elif ds.cold:
+            # not named in the request's arguments, so prepare() missed it
+            ds.warm_async()
+            raise DatasetLoading(ds)
+        if ds is not None:
+            MEMORY.touch(ds)
+        return ds
 
     def dataset_kinds(self):
         return DATASETS.keys()
@@ -79,6 +174,13 @@ class BaseHandler(tornado.web.RequestHandler):
                              zip(self.get_arguments(kind_arg),
                                  self.get_arguments(name_arg))])
 
+    def write_error(self, status_code, **kwargs):
+        exc = kwargs.get('exc_info', (None, None))[1]
+        if isinstance(exc, DatasetLoading):
+            self.set_header('Retry-After', DatasetLoading.RETRY_SECONDS)
+            return self.finish("Error: " + exc.log_message % exc.args)
+        return super(BaseHandler, self).write_error(status_code, **kwargs)
+
     def visible_error(self, status, msg, *log_args):
         if not log_args:
             logging.error(msg)
@@ -141,7 +243,7 @@ class MultiDatasetHandler(BaseHandler):
                          **extra_view_kwargs):
         all_ds = self.request_many_ds()
         trans = self.ds_view_kwargs(**extra_view_kwargs)
-        all_ds_views = [ds.view(mask=fig_data.filter_mask[ds], **trans)
+        all_ds_views = [ds.view(mask=fig_data.filter_mask[ds.kind, ds.name], **trans)
                         for ds in all_ds]
         mdv = MultiDatasetView(all_ds_views)
 
@@ -152,6 +254,19 @@ class MultiDatasetHandler(BaseHandler):
             return None
 
 
+def _loggable_args(arguments, max_len=200):
+    args = {}
+    for key, values in arguments.items():
+        if 'password' in key:
+            values = ['***']
+        text = ','.join(v.decode('utf8', 'replace') if isinstance(v, bytes)
+                        else v for v in values)
+        if len(text) > max_len:
+            text = text[:max_len] + '...'
+        args[key] = text
+    return args
+
+
 # A do-nothing baseline, for consistency
 class _NullBaseline(Baseline):
     def _fit_many(self, bands, intensities):
@@ -4,8 +4,10 @@ import logging
 import numpy as np
 import scipy.stats
 from scipy import odr
+from tornado import gen
 
 from .common import BaseHandler
+from ..render import RENDERER
 
 
 class CompositionPlotHandler(BaseHandler):
@@ -40,7 +42,7 @@ class CompositionPlotHandler(BaseHandler):
       return
 
     # TODO: remove ChemCam-specific stuff here
-    mask = fig_data.filter_mask[ds]
+    mask = fig_data.filter_mask[ds.kind, ds.name]
     sols = ds.metadata['sol'].get_array(mask)
     locs = ds.metadata['loc'].get_array(mask)
     shots = ds.metadata['shot'].get_array(mask)
@@ -63,15 +65,18 @@ class CompositionPlotHandler(BaseHandler):
         self.write('%s,%s,%s,%s,%s\n' % (t, sols[i], locs[i], shots[i], vals))
     self.finish()
 
+  @gen.coroutine
   def post(self):
     fig_data = self.get_fig_data()
     if fig_data is None:
-      return self.visible_error(403, 'Broken connection to server.')
+      self.visible_error(403, 'Broken connection to server.')
+      return
 
     ds = self.get_dataset(self.get_argument('ds_kind'),
                           self.get_argument('ds_name'))
     if ds is None:
-      return self.visible_error(404, 'Failed to look up dataset.')
+      self.visible_error(404, 'Failed to look up dataset.')
+      return
 
     do_fit = bool(int(self.get_argument('do_fit')))
     use_mols = bool(int(self.get_argument('use_mols')))
@@ -86,16 +91,18 @@ class CompositionPlotHandler(BaseHandler):
     y_keys = [k.split('$',1) for k in y_input.split('+')] if y_input else []
     use_group_name = len(set(k[0] for k in (x_keys + y_keys))) > 1
     do_sum = x_keys and y_keys
-    mask = fig_data.filter_mask[ds]
+    mask = fig_data.filter_mask[ds.kind, ds.name]
     x_data, x_labels = comps_with_labels(ds, mask, x_keys, use_group_name,
                                          use_mols, do_sum)
     y_data, y_labels = comps_with_labels(ds, mask, y_keys, use_group_name,
                                          use_mols, do_sum)
     # error handling
     if x_data is None:
-      return self.visible_error(403, x_labels)
+      self.visible_error(403, x_labels)
+      return
     if y_data is None:
-      return self.visible_error(403, y_labels)
+      self.visible_error(403, y_labels)
+      return
 
     if do_fit:
       # handle NaNs
@@ -126,9 +133,6 @@ class CompositionPlotHandler(BaseHandler):
     else:
       results = {}
 
-    fig_data.figure.clf(keep_observers=True)
-    ax = fig_data.figure.gca()
-
     # setup plot options
     if bool(int(self.get_argument('legend'))):
       legend_loc = 'best'
@@ -139,54 +143,60 @@ class CompositionPlotHandler(BaseHandler):
         alpha=float(self.get_argument('alpha')),
         cmap=(cmap if cmap != '_auto' else None),
         s=20*float(self.get_argument('line_width')))
-
-    # set plot title (if needed)
-    if not use_group_name:
-      key, _ = (x_keys if x_keys else y_keys)[0]
-      ax.set_title(ds.metadata[key].display_name(key))
-
-    if do_sum:
-      # scatter plot: x vs y
-      color_key = self.get_argument('color_by')
-      color_meta = ds.metadata.get(color_key, None)
-      if color_meta is not None:
-        colors = color_meta.get_array(mask)
-        sc = ax.scatter(x_data, y_data, c=colors, **scatter_kwargs)
-        cbar = fig_data.figure.colorbar(sc)
-        cbar.set_label(color_meta.display_name(color_key))
+    color_key = self.get_argument('color_by') if do_sum else None
+
+    def plot():
+      fig_data.figure.clf(keep_observers=True)
+      ax = fig_data.figure.gca()
+
+      # set plot title (if needed)
+      if not use_group_name:
+        key, _ = (x_keys if x_keys else y_keys)[0]
+        ax.set_title(ds.metadata[key].display_name(key))
+
+      if do_sum:
+        # scatter plot: x vs y
+        color_meta = ds.metadata.get(color_key, None)
+        if color_meta is not None:
+          colors = color_meta.get_array(mask)
+          sc = ax.scatter(x_data, y_data, c=colors, **scatter_kwargs)
+          cbar = fig_data.figure.colorbar(sc)
+          cbar.set_label(color_meta.display_name(color_key))
+        else:
+          ax.scatter(x_data, y_data, **scatter_kwargs)
+        suffix = ' (moles)' if use_mols else ''
+        ax.set_xlabel(' + '.join(x_labels) + suffix)
+        ax.set_ylabel(' + '.join(y_labels) + suffix)
+      elif x_keys:
+        # histogram along x
+        ax.hist(x_data, bins='auto', orientation='vertical', label=x_labels)
+        fig_data.hist_data = x_data
+        ax.legend(loc=legend_loc)
       else:
-        ax.scatter(x_data, y_data, **scatter_kwargs)
-      suffix = ' (moles)' if use_mols else ''
-      ax.set_xlabel(' + '.join(x_labels) + suffix)
-      ax.set_ylabel(' + '.join(y_labels) + suffix)
-    elif x_keys:
-      # histogram along x
-      ax.hist(x_data, bins='auto', orientation='vertical', label=x_labels)
-      fig_data.hist_data = x_data
-      ax.legend(loc=legend_loc)
-    else:
-      # histogram along y
-      ax.hist(y_data, bins='auto', orientation='horizontal', label=y_labels)
-      fig_data.hist_data = y_data
-      ax.legend(loc=legend_loc)
+        # histogram along y
+        ax.hist(y_data, bins='auto', orientation='horizontal', label=y_labels)
+        fig_data.hist_data = y_data
+        ax.legend(loc=legend_loc)
 
-    # get the plot bounds
-    ax.autoscale_view()
-    xlim, ylim = ax.get_xlim(), ax.get_ylim()
+      # get the plot bounds
+      ax.autoscale_view()
+      xlim, ylim = ax.get_xlim(), ax.get_ylim()
 
-    # plot the best fit line (optionally)
-    if do_fit:
-      ax.plot(fit_x, fit_y, 'k--')
-      ax.set_xlim(xlim)
-      ax.set_ylim(ylim)
+      # plot the best fit line (optionally)
+      if do_fit:
+        ax.plot(fit_x, fit_y, 'k--')
+        ax.set_xlim(xlim)
+        ax.set_ylim(ylim)
+
+      return xlim, ylim
 
     # draw!
-    fig_data.manager.canvas.draw()
+    xlim, ylim = yield RENDERER.draw(fig_data, plot)
     fig_data.last_plot = 'compositions'
 
     # respond with fit parameters and zoom info
     results['zoom'] = (xlim[0], xlim[1], ylim[0], ylim[1])
-    return self.write_json(results)
+    self.write_json(results)
 
 """
 class CompositionBatchHandler(BaseHandler):
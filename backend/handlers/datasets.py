@@ -4,9 +4,9 @@ import os
 import tornado.web
 import yaml
 from tornado import gen
-from threading import Thread
 
 from .common import BaseHandler
+from ..watcher import WATCHER
 from ..web_datasets import DATASETS
 
 
@@ -20,16 +20,9 @@ class RefreshHandler(BaseHandler):
   @gen.coroutine
   def post(self):
     logging.info('Refreshing datasets')
-    for ds in self.all_datasets():
-      yield gen.Task(RefreshHandler._reload, ds)
+    yield WATCHER.refresh(self.all_datasets(), 'manual')
     self.redirect('/datasets')
 
-  @staticmethod
-  def _reload(ds, callback=None):
-    t = Thread(target=lambda: callback(ds.reload()))
-    t.daemon = True
-    t.start()
-
 
 class RemovalHandler(BaseHandler):
   def post(self):
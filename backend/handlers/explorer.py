@@ -1,9 +1,12 @@
 from __future__ import absolute_import, print_function, division
 import ast
+import hashlib
 import logging
 import numpy as np
+from tornado import gen
 
 from .common import BaseHandler, BLR_KWARGS
+from ..executors import run_in_pool
 from ..web_datasets import (
     DATASETS, CompositionMetadata, NumericMetadata, LookupMetadata,
     BooleanMetadata
@@ -25,6 +28,57 @@ class FilterBoxHandler(BaseHandler):
                            init_js=init_js, collect_js=collect_js)
 
 
+class HistogramHandler(BaseHandler):
+    @gen.coroutine
+    def get(self):
+        ds = self.request_one_ds('kind', 'name')
+        if ds is None:
+            self.visible_error(404, 'Dataset not found.')
+            return
+        key = self.get_argument('key')
+        # URLs include the dataset's load time, so they're safe to cache
+        etag = hashlib.sha1(repr((str(ds), ds.load_time, key)).encode('utf8'))
+        self.set_header('Etag', '"%s"' % etag.hexdigest())
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+        try:
+            png = yield run_in_pool('cpu', ds.histogram_png, key)
+        except KeyError:
+            self.clear_header('Etag')
+            self.visible_error(404, 'No histogram for %r in %s' % (key, ds))
+            return
+        self.set_header('Content-Type', 'image/png')
+        self.set_header('Cache-Control', '%s, max-age=31536000' % (
+            'public' if ds.is_public else 'private'))
+        self.write(png)
+
+
+class FilterOptionsHandler(BaseHandler):
+    '''Pages of options for select filters, in select2's ajax format.'''
+    page_size = 50
+
+    @gen.coroutine
+    def get(self):
+        ds = self.request_one_ds('kind', 'name')
+        if ds is None:
+            self.visible_error(404, 'Dataset not found.')
+            return
+        key = self.get_argument('key')
+        query = self.get_argument('q', '')
+        page = max(1, int(self.get_argument('page', 1)))
+        try:
+            # the index is built on first use, which can be slow
+            index = yield run_in_pool('cpu', ds.value_index, key)
+        except KeyError:
+            self.visible_error(404, 'No options for %r in %s' % (key, ds))
+            return
+        values, more = index.search(query, offset=(page - 1) * self.page_size,
+                                    limit=self.page_size)
+        self.write(dict(results=[dict(id=v, text=v) for v in values],
+                        pagination=dict(more=more)))
+
+
 class FilterHandler(BaseHandler):
     def post(self):
         fig_data = self.get_fig_data()
@@ -46,7 +100,7 @@ class FilterHandler(BaseHandler):
         logging.info('Filtering %s with args: %s', ds, params)
 
         mask = ds.filter_metadata(params)
-        fig_data.filter_mask[ds] = mask
+        fig_data.filter_mask[ds.kind, ds.name] = mask
         num_spectra = np.count_nonzero(mask)
         logging.info('Filtered to %d spectra', num_spectra)
 
@@ -133,6 +187,8 @@ class MatchOptionsHandler(BaseHandler):
 routes = [
     (r'/_filter', FilterHandler),
     (r'/_dataset_filterer', FilterBoxHandler),
+    (r'/_histogram', HistogramHandler),
+    (r'/_filter_options', FilterOptionsHandler),
     (r'/_plot_options', PlotOptionsHandler),
     (r'/_comp_options', CompositionOptionsHandler),
     (r'/_pred_options', PredictionOptionsHandler),
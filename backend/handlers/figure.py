@@ -1,21 +1,31 @@
 from __future__ import absolute_import, print_function, division
+from tornado import gen
+
 from .common import BaseHandler
+from ..render import RENDERER
 
 
 class ZoomFigureHandler(BaseHandler):
+  @gen.coroutine
   def post(self):
     fig_data = self.get_fig_data()
     if fig_data is None:
-      return self.visible_error(403, 'Broken connection to server.')
+      self.visible_error(403, 'Broken connection to server.')
+      return
 
     xmin = float(self.get_argument('xmin'))
     xmax = float(self.get_argument('xmax'))
     ymin = float(self.get_argument('ymin'))
     ymax = float(self.get_argument('ymax'))
-    ax = fig_data.figure.axes[0]
-    ax.set_xlim((xmin,xmax))
-    ax.set_ylim((ymin,ymax))
-    fig_data.manager.canvas.draw()
+    yield RENDERER.draw(fig_data, _zoom, fig_data.figure, (xmin,xmax),
+                        (ymin,ymax))
+
+
+def _zoom(fig, xlim, ylim):
+  # Changing the x limits also re-decimates any long lines (see decimate.py).
+  ax = fig.axes[0]
+  ax.set_xlim(xlim)
+  ax.set_ylim(ylim)
 
 
 routes = [
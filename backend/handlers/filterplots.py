@@ -1,5 +1,6 @@
 from __future__ import absolute_import, print_function, division
 import ast
+import json
 import logging
 import numpy as np
 import os
@@ -9,12 +10,14 @@ from matplotlib import rcParams
 from matplotlib.collections import LineCollection
 from matplotlib.gridspec import GridSpec
 from matplotlib.patches import Patch
-from six import text_type
+from six import string_types, text_type
 from six.moves import xrange
-from threading import Thread
 from tornado import gen
 
 from .common import MultiDatasetHandler
+from ..compact_metadata import categorical_codes
+from ..decimate import track_collection
+from ..render import RENDERER
 
 # old matplotlib used a different key
 if 'axes.prop_cycle' not in rcParams:
@@ -135,10 +138,28 @@ class FilterPlotHandler(MultiDatasetHandler):
 
   @gen.coroutine
   def post(self):
+    res = self._prepare_plot()
+    if res is None:
+      return
+    fig_data, plot_data, color_data, pkeys, plot_kwargs = res
+
+    # generate, decorate, and draw the plot
+    do_legend = bool(int(self.get_argument('legend')))
+    ax = yield RENDERER.draw(fig_data, _draw_plot, fig_data, plot_data,
+                             color_data, plot_kwargs, do_legend, pkeys)
+    # return the axis limits
+    xmin,xmax = ax.get_xlim()
+    ymin,ymax = ax.get_ylim()
+    self.write_json([xmin,xmax,ymin,ymax])
+
+  def _prepare_plot(self):
+    """Computes (or fetches from cache) everything needed to make a plot.
+    Returns (fig_data, plot_data, color_data, pkeys, plot_kwargs),
+    or None if there's nothing to plot (the response has been written)."""
     fig_data = self.get_fig_data()
     if fig_data is None:
       self.visible_error(403, "Broken connection to server.")
-      return
+      return None
 
     # parse plot information from request arguments
     xaxis = self._get_axis_info('x')
@@ -154,7 +175,7 @@ class FilterPlotHandler(MultiDatasetHandler):
     if ds_views is None:
       # not an error, just nothing to do
       self.write('{}')
-      return
+      return None
 
     # check to see if anything changed since the last view we had
     view_params = [(k, self.get_argument(k)) for k in self.request.arguments
@@ -176,7 +197,7 @@ class FilterPlotHandler(MultiDatasetHandler):
       plot_data = self._get_plot_data(ds_views, xaxis, yaxis)
       if plot_data is None:
         # self.visible_error has already been called by _get_plot_data
-        return
+        return None
       fig_data.explorer_xaxis = xaxis
       fig_data.explorer_yaxis = yaxis
       fig_data.explorer_data = plot_data
@@ -191,17 +212,7 @@ class FilterPlotHandler(MultiDatasetHandler):
     else:
       color_data = fig_data.explorer_color
 
-    # prepare the figure
-    fig_data.figure.clf(keep_observers=True)
-
-    # generate, decorate, and draw the plot
-    do_legend = bool(int(self.get_argument('legend')))
-    ax = yield gen.Task(_async_draw_plot, fig_data, plot_data, color_data,
-                        plot_kwargs, do_legend, pkeys)
-    # return the axis limits
-    xmin,xmax = ax.get_xlim()
-    ymin,ymax = ax.get_ylim()
-    self.write_json([xmin,xmax,ymin,ymax])
+    return fig_data, plot_data, color_data, pkeys, plot_kwargs
 
   def _get_axis_info(self, ax_char):
     atype = self.get_argument(ax_char + 'axis')
@@ -264,22 +275,81 @@ class FilterPlotHandler(MultiDatasetHandler):
                     xticks=xticks, yticks=yticks)
 
 
-def _async_draw_plot(fig_data, plot_data, color_data, plot_kwargs, do_legend,
-                     pkeys, callback=None):
-  fig = fig_data.figure
+class FilterPlotDataHandler(FilterPlotHandler):
+  def post(self):
+    """Returns the data for a plot as a binary payload, for API clients that
+    draw plots themselves (the explorer page still uses /_filterplot).
+    See encode_plot_data for the layout."""
+    res = self._prepare_plot()
+    if res is None:
+      return
+    _, plot_data, color_data, pkeys, plot_kwargs = res
+    self.set_header('Content-Type', 'application/octet-stream')
+    self.write(encode_plot_data(plot_data, color_data, pkeys, **plot_kwargs))
+
+
+def encode_plot_data(plot_data, color_data, pkeys, **plot_kwargs):
+  """Packs plot data into bytes, all little-endian:
+   - uint32: length of the JSON header, in bytes
+   - JSON header (utf-8), space-padded to a multiple of 4 bytes
+   - float32[num_points, 2]: (x, y) pairs for all trajectories, concatenated
+   - uint32[num_trajs + 1]: offsets (in points) of each trajectory
+   - float32[num_colors]: numeric color values (only if header.color.kind is
+     'values'), one per trajectory or scatter point
+  Scatter plots are a single trajectory of points."""
+  trajs = plot_data.trajs
+  offsets = np.zeros(len(trajs) + 1, dtype='<u4')
+  np.cumsum([len(t) for t in trajs], out=offsets[1:])
+  xy = np.empty((offsets[-1], 2), dtype='<f4')
+  for i, t in enumerate(trajs):
+    xy[offsets[i]:offsets[i+1]] = t
+
+  colors = color_data.color
+  color_info = dict(label=color_data.label, names=_tolist(color_data.names),
+                    needs_cbar=color_data.needs_cbar,
+                    is_categorical=color_data.is_categorical)
+  color_values = None
+  if hasattr(colors, 'dtype') and np.issubdtype(colors.dtype, np.number):
+    color_info['kind'] = 'values'
+    color_values = np.asarray(colors, dtype='<f4')
+  elif isinstance(colors, string_types):
+    color_info['kind'] = 'fixed'
+    color_info['color'] = colors
+  else:
+    color_info['kind'] = 'cycle'
+    color_info['colors'] = list(colors)
+
+  header = dict(scatter=plot_data.scatter, num_trajs=len(trajs),
+                num_points=int(offsets[-1]), xlabel=plot_data.xlabel,
+                ylabel=plot_data.ylabel, xticks=_tolist(plot_data.xticks),
+                yticks=_tolist(plot_data.yticks), color=color_info,
+                color_cycle=list(COLOR_CYCLE), labels=_tolist(pkeys),
+                **plot_kwargs)
+  header = json.dumps(header).encode('utf8')
+  header += b' ' * (-len(header) % 4)
+
+  parts = [np.array([len(header)], dtype='<u4').tobytes(), header,
+           xy.tobytes(), offsets.tobytes()]
+  if color_values is not None:
+    parts.append(color_values.tobytes())
+  return b''.join(parts)
 
-  def helper():
-    ax = fig.gca()
-    artist = _add_plot(fig, ax, plot_data, color_data, pkeys, **plot_kwargs)
-    _decorate_plot(fig, ax, artist, plot_data, color_data,
-                   do_legend, plot_kwargs['cmap'])
-    fig_data.manager.canvas.draw()
-    fig_data.last_plot = 'filterplot'
-    callback(ax)
 
-  t = Thread(target=helper)
-  t.daemon = True
-  t.start()
+def _tolist(arr):
+  if arr is None:
+    return None
+  return [text_type(x) for x in arr]
+
+
+def _draw_plot(fig_data, plot_data, color_data, plot_kwargs, do_legend, pkeys):
+  fig = fig_data.figure
+  fig.clf(keep_observers=True)
+  ax = fig.gca()
+  artist = _add_plot(fig, ax, plot_data, color_data, pkeys, **plot_kwargs)
+  _decorate_plot(fig, ax, artist, plot_data, color_data,
+                 do_legend, plot_kwargs['cmap'])
+  fig_data.last_plot = 'filterplot'
+  return ax
 
 
 def _get_color_data(ds_views, caxis):
@@ -315,7 +385,8 @@ def _add_plot(fig, ax, plot_data, color_data, pkeys, lw=1, cmap='_auto',
       artist = LineCollection(trajs, linewidths=lw, cmap=cmap)
       artist.set_array(colors)
     else:
-      artist = LineCollection(plot_data.trajs, linewidths=lw, cmap=cmap)
+      trajs = plot_data.trajs
+      artist = LineCollection(trajs, linewidths=lw, cmap=cmap)
       artist.set_color(colors)
     artist.set_alpha(alpha)
     artist.set_picker(True)
@@ -324,6 +395,8 @@ def _add_plot(fig, ax, plot_data, color_data, pkeys, lw=1, cmap='_auto',
     ax.autoscale_view()
     # Force ymin -> 0
     ax.set_ylim((0, ax.get_ylim()[1]))
+    # only draw as many points as there are pixels
+    track_collection(ax, artist, trajs)
 
   def on_pick(event):
     if event.artist is not artist:
@@ -410,6 +483,10 @@ def _get_all_metadata(ds_views, meta_key):
     data = ds_views.dataset_name_metadata()
     label = 'Dataset'
   else:
+    coded = categorical_codes(ds_views, meta_key)
+    if coded is not None:
+      # lookup columns are already coded, so skip the strings entirely
+      return coded
     data, label = ds_views.get_metadata(meta_key)
 
   if not np.issubdtype(data.dtype, np.number):
@@ -446,5 +523,6 @@ def _compute_expr(ds_views, expr):
 
 routes = [
     (r'/_filterplot', FilterPlotHandler),
+    (r'/_filterplot_data', FilterPlotDataHandler),
     (r'/([0-9]+)/(spectra|metadata)\.csv', FilterPlotHandler),
 ]
@@ -3,10 +3,12 @@ import logging
 import numpy as np
 import os
 from io import BytesIO
-from threading import Thread
+from tornado import gen
 
 from .common import BaseHandler, MultiDatasetHandler
+from ..executors import run_in_pool
 from ..models import GenericModel, REGRESSION_MODELS
+from ..render import RENDERER
 
 __all__ = [
     'GenericModelHandler', 'async_crossval', 'axes_grid'
@@ -117,6 +119,8 @@ class GenericModelHandler(MultiDatasetHandler):
   def collect_trajectories(self, ds_views):
     '''collect traj-format data from all datasets.'''
     trajs = ds_views.get_trajectories(avoid_nan_gap=True)
+    # spectra may be stored at lower precision than models need
+    trajs = [np.asarray(t, dtype=np.float64) for t in trajs]
     return ds_views.ds_kind, trajs
 
   def collect_spectra(self, ds_views):
@@ -127,6 +131,8 @@ class GenericModelHandler(MultiDatasetHandler):
       logging.exception("Failed to get vector data from %s", ds_views.ds_views)
       self.visible_error(400, e.message)
       return None, None, None
+    # spectra may be stored at lower precision than models need
+    X = np.asarray(X, dtype=np.float64)
     return ds_views.ds_kind, wave, X
 
   @classmethod
@@ -141,39 +147,43 @@ class GenericModelHandler(MultiDatasetHandler):
     return ds_views.get_metadata(meta_key)
 
 
+@gen.coroutine
 def async_crossval(fig_data, model_cls, num_vars, cv_args, cv_kwargs,
-                   xlabel='param', ylabel='MSE', logx=False, callback=None):
-  '''Wrap cross-validation calls in a Thread to avoid hanging the server.'''
-  def helper():
-    fig_data.figure.clf(keep_observers=True)
-    axes = axes_grid(fig_data.figure, num_vars, xlabel, ylabel)
-    if logx:
-      for ax in axes:
-        ax.set_xscale('log')
-
-    cv_gen = model_cls.cross_validate(*cv_args, **cv_kwargs)
-    for i, (name, x, y, yerr) in enumerate(cv_gen):
-      axes[i].set_title(name)
-      axes[i].errorbar(x, y, yerr=yerr, lw=2, fmt='k-', ecolor='r',
-                       elinewidth=1, capsize=0)
-      if ylabel == 'MSE':
-        idx = np.argmin(y)
-        axes[i].annotate('RMSE: %.3f' % np.sqrt(y[idx]), xy=(x[idx], y[idx]),
-                         xycoords='data', xytext=(0.5, 0.95),
-                         textcoords='axes fraction',
-                         horizontalalignment='center',
-                         verticalalignment='top',
-                         arrowprops=dict(
-                             arrowstyle='->',
-                             connectionstyle='arc3'))
-
-    fig_data.manager.canvas.draw()
-    fig_data.last_plot = '%s_crossval' % model_cls.__name__
-    callback()
-
-  t = Thread(target=helper)
-  t.daemon = True
-  t.start()
+                   xlabel='param', ylabel='MSE', logx=False):
+  '''Runs cross-validation on the cpu pool to avoid hanging the server,
+  then plots the results.'''
+  cv_results = yield run_in_pool('cpu', _cross_validate, model_cls, cv_args,
+                                 cv_kwargs)
+  yield RENDERER.draw(fig_data, _plot_crossval, fig_data.figure, num_vars,
+                      cv_results, xlabel, ylabel, logx)
+  fig_data.last_plot = '%s_crossval' % model_cls.__name__
+
+
+def _cross_validate(model_cls, cv_args, cv_kwargs):
+  return list(model_cls.cross_validate(*cv_args, **cv_kwargs))
+
+
+def _plot_crossval(fig, num_vars, cv_results, xlabel, ylabel, logx):
+  fig.clf(keep_observers=True)
+  axes = axes_grid(fig, num_vars, xlabel, ylabel)
+  if logx:
+    for ax in axes:
+      ax.set_xscale('log')
+
+  for i, (name, x, y, yerr) in enumerate(cv_results):
+    axes[i].set_title(name)
+    axes[i].errorbar(x, y, yerr=yerr, lw=2, fmt='k-', ecolor='r',
+                     elinewidth=1, capsize=0)
+    if ylabel == 'MSE':
+      idx = np.argmin(y)
+      axes[i].annotate('RMSE: %.3f' % np.sqrt(y[idx]), xy=(x[idx], y[idx]),
+                       xycoords='data', xytext=(0.5, 0.95),
+                       textcoords='axes fraction',
+                       horizontalalignment='center',
+                       verticalalignment='top',
+                       arrowprops=dict(
+                           arrowstyle='->',
+                           connectionstyle='arc3'))
 
 
 def axes_grid(fig, n, xlabel, ylabel):
@@ -7,9 +7,11 @@ from collections import defaultdict
 from superman.preprocess import preprocess
 from superman.dataset import LookupMetadata
 from tornado import gen
-from threading import Thread
 
 from .common import BaseHandler, MultiDatasetHandler
+from ..decimate import full_data, plot_decimated
+from ..executors import run_in_pool
+from ..render import RENDERER
 
 
 class SpectrumMatchingHandler(MultiDatasetHandler):
@@ -56,7 +58,8 @@ class SpectrumMatchingHandler(MultiDatasetHandler):
       return
 
     try:
-      top_names, top_sim = yield gen.Task(_async_wsm, ds_views, query, kwargs)
+      top_names, top_sim = yield run_in_pool(
+          'cpu', ds_views.whole_spectrum_search, query, **kwargs)
     except ValueError as e:
       logging.error('During whole_spectrum_search: %s', str(e))
       return
@@ -101,13 +104,6 @@ class SpectrumMatchingHandler(MultiDatasetHandler):
                 query_name=query_name, query_meta=query_meta)
 
 
-def _async_wsm(ds_views, query, wsm_kwargs, callback=None):
-  t = Thread(target=lambda: callback(
-      ds_views.whole_spectrum_search(query, **wsm_kwargs)))
-  t.daemon = True
-  t.start()
-
-
 def _lookup_metas(ds_view):
   for key, m in ds_view.ds.metadata.items():
     if isinstance(m, LookupMetadata):
@@ -123,7 +119,7 @@ class CompareHandler(BaseHandler):
       return
 
     ax = fig_data.figure.gca()
-    lines = [l.get_xydata() for l in ax.lines]
+    lines = [full_data(l) for l in ax.lines]
     if ax.legend_ is not None:
       names = [t.get_text() for t in ax.legend_.get_texts()]
     else:
@@ -142,6 +138,7 @@ class CompareHandler(BaseHandler):
       self.write('\n')
     self.finish()
 
+  @gen.coroutine
   def post(self):
     fig_data = self.get_fig_data()
     ds = self.request_one_ds('target_kind', 'target_name')
@@ -160,14 +157,16 @@ class CompareHandler(BaseHandler):
     else:
       mask = np.array([int(n.rsplit(' ', 1)[1]) for n in names], dtype=int)
     ds_view = ds.view(mask=mask, **trans)
+    yield RENDERER.draw(fig_data, _plot_comparison, fig_data, ds_view, names)
 
-    fig_data.figure.clf(keep_observers=True)
-    fig_data.plot()
-    ax = fig_data.figure.gca()
-    for comp in ds_view.get_trajectories():
-      ax.plot(comp[:,0], comp[:,1], '-')
-    ax.legend([fig_data.title] + names)
-    fig_data.manager.canvas.draw()
+
+def _plot_comparison(fig_data, ds_view, names):
+  fig_data.figure.clf(keep_observers=True)
+  fig_data.plot()
+  ax = fig_data.figure.gca()
+  for comp in ds_view.get_trajectories():
+    plot_decimated(ax, comp[:,0], comp[:,1], '-')
+  ax.legend([fig_data.title] + names)
 
 
 routes = [
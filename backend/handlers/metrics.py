@@ -0,0 +1,45 @@
+from __future__ import absolute_import, print_function, division
+
+from .common import BaseHandler
+from ..executors import pool_stats
+from ..loading import LOADER
+from ..metrics import METRICS
+
+
+class MetricsHandler(BaseHandler):
+  '''Exposes server metrics in the Prometheus text format.'''
+  def get(self):
+    lines = [METRICS.prometheus_text()]
+    lines.append('# TYPE superman_figures gauge')
+    lines.append('superman_figures %d' % len(self.application.figure_data))
+    for stat in ('queue_length', 'active'):
+      lines.append('# TYPE superman_pool_%s gauge' % stat)
+      for name, stats in sorted(pool_stats().items()):
+        lines.append('superman_pool_%s{pool="%s"} %d' % (stat, name,
+                                                          stats[stat]))
+    lines.append('# TYPE superman_datasets gauge')
+    states = [p['state'] for p in LOADER.progress()]
+    for state in ('queued', 'loading', 'ready', 'failed'):
+      lines.append('superman_datasets{state="%s"} %d' % (state,
+                                                          states.count(state)))
+    self.set_header('Content-Type', 'text/plain; version=0.0.4')
+    self.write('\n'.join(lines) + '\n')
+
+
+class ReadyHandler(BaseHandler):
+  '''Readiness check for load balancers: responds 503 until all datasets
+  with priority >= min_priority have finished loading.'''
+  def get(self):
+    default = self.application.settings.get('ready_min_priority', 0)
+    min_priority = float(self.get_argument('min_priority', default))
+    ready = LOADER.is_ready(min_priority)
+    if not ready:
+      self.set_status(503)
+    self.write(dict(ready=ready, min_priority=min_priority,
+                    datasets=LOADER.progress()))
+
+
+routes = [
+    (r'/metrics', MetricsHandler),
+    (r'/ready', ReadyHandler),
+]
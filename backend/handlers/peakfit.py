@@ -4,10 +4,13 @@ import numpy as np
 import os
 import scipy.integrate
 from superman.peaks.bump_fit import fit_single_peak, fit_composite_peak
-from threading import Thread, Lock
+from threading import Lock
 from tornado import gen
 
 from .common import BaseHandler
+from ..decimate import plot_decimated
+from ..executors import run_in_pool
+from ..render import RENDERER
 
 # leastsq is not thread-safe, so we have to lock it.
 leastsq_lock = Lock()
@@ -57,7 +60,7 @@ class PeakHandler(BaseHandler):
                                log_fn=id, band_resolution=xres,
                                loc_fixed=loc_fixed)[-1]
 
-    mask = fig_data.filter_mask[ds]
+    mask = fig_data.filter_mask[ds.kind, ds.name]
     trans = fig_data.get_trans()
     trans['nan_gap'] = None  # make sure we're not inserting NaNs anywhere
     ds_view = ds.view(mask=mask, **trans)
@@ -88,13 +91,8 @@ class PeakHandler(BaseHandler):
       return
     spectrum = fig_data.get_trajectory()
 
-    # set up for plotted overlay(s)
-    ax = fig_data.figure.gca()
-    xlim = ax.get_xlim()
-    ylim = ax.get_ylim()
-    ax.cla()
-    ax.plot(spectrum[:,0], spectrum[:,1], '-')
-    ax.set_title(fig_data.title)
+    # (axes method, args, kwargs) for each plotted overlay
+    overlays = []
 
     # re-fill NaN-gapped values (semi-hack)
     nan_inds, = np.where(np.isnan(spectrum[:,1]))
@@ -108,24 +106,27 @@ class PeakHandler(BaseHandler):
       lb = float(self.get_argument('lb'))
       ub = float(self.get_argument('ub'))
       bounds = sorted((lb,ub))
-      peak_x, peak_y, base, peak_data = yield gen.Task(
-          _async_peakfit, _manual_peak_area, spectrum, bounds, base_type)
+      peak_x, peak_y, base, peak_data = yield run_in_pool(
+          'cpu', _locked_peakfit, _manual_peak_area, spectrum, bounds,
+          base_type)
       # show the area we integrated
-      ax.fill_between(peak_x, base, peak_y, facecolor='gray', alpha=0.5)
+      overlays.append(('fill_between', (peak_x, base, peak_y),
+                       dict(facecolor='gray', alpha=0.5)))
     elif alg == 'fit':
       kind = self.get_argument('fitkind')
       loc = float(self.get_argument('fitloc'))
       xres = float(self.get_argument('xres'))
       loc_fixed = bool(int(self.get_argument('locfixed')))
       bands, ints = spectrum.T
-      peak_mask, peak_y, peak_data = yield gen.Task(
-          _async_peakfit, fit_single_peak, bands, ints, loc,
+      peak_mask, peak_y, peak_data = yield run_in_pool(
+          'cpu', _locked_peakfit, fit_single_peak, bands, ints, loc,
           fit_kind=kind, log_fn=logging.info,
           band_resolution=xres, loc_fixed=loc_fixed)
       peak_x = bands[peak_mask]
 
       # show the fitted peak
-      ax.plot(peak_x, peak_y, 'k-', linewidth=2, alpha=0.75)
+      overlays.append(('plot', (peak_x, peak_y, 'k-'),
+                       dict(linewidth=2, alpha=0.75)))
     elif alg == 'composite':
       num_peaks = int(self.get_argument('numpeaks'))
       kinds = self.get_arguments('fitkind[]')
@@ -135,43 +136,52 @@ class PeakHandler(BaseHandler):
         self.visible_error(403, "Peak locations don't match # peaks")
         return
       bands, ints = spectrum.T
-      peak_mask, peak_ys, peak_data = yield gen.Task(
-          _async_peakfit, fit_composite_peak, bands, ints, locs,
+      peak_mask, peak_ys, peak_data = yield run_in_pool(
+          'cpu', _locked_peakfit, fit_composite_peak, bands, ints, locs,
           num_peaks=num_peaks, fit_kinds=kinds,
           log_fn=logging.info, band_resolution=xres)
       peak_x = bands[peak_mask]
 
       # show the fitted feature and component peaks
-      ax.plot(peak_x, peak_ys[0], 'k-', linewidth=2, alpha=0.75)
+      overlays.append(('plot', (peak_x, peak_ys[0], 'k-'),
+                       dict(linewidth=2, alpha=0.75)))
       for y in peak_ys[1:]:
-        ax.plot(peak_x, y, 'k--', linewidth=1, alpha=0.75)
+        overlays.append(('plot', (peak_x, y, 'k--'),
+                         dict(linewidth=1, alpha=0.75)))
     else:
       self.visible_error(403, 'Algorithm %s is not supported' % alg)
       return
 
     # Finish plotting
-    if len(peak_x) > 0:
-      xpad = (peak_x[-1] - peak_x[0]) / 3.
-      xlim = (max(xlim[0], peak_x[0] - xpad),
-              min(xlim[1], peak_x[-1] + xpad))
-    ax.set_xlim(xlim)
-    ax.set_ylim(ylim)
-    fig_data.manager.canvas.draw()
+    peak_data['axis_limits'] = yield RENDERER.draw(
+        fig_data, _plot_peaks, fig_data, spectrum, peak_x, overlays)
 
     # write the peak data as a response
-    peak_data['axis_limits'] = [xlim[0], xlim[1], ylim[0], ylim[1]]
     self.write_json(peak_data)
 
 
-def _async_peakfit(func, *args, **kwargs):
-  callback = kwargs.pop('callback')
+def _plot_peaks(fig_data, spectrum, peak_x, overlays):
+  ax = fig_data.figure.gca()
+  xlim = ax.get_xlim()
+  ylim = ax.get_ylim()
+  ax.cla()
+  plot_decimated(ax, spectrum[:,0], spectrum[:,1], '-')
+  ax.set_title(fig_data.title)
+  for method, args, kwargs in overlays:
+    getattr(ax, method)(*args, **kwargs)
+  if len(peak_x) > 0:
+    xpad = (peak_x[-1] - peak_x[0]) / 3.
+    xlim = (max(xlim[0], peak_x[0] - xpad),
+            min(xlim[1], peak_x[-1] + xpad))
+  ax.set_xlim(xlim)
+  ax.set_ylim(ylim)
+  return [xlim[0], xlim[1], ylim[0], ylim[1]]
+
+
+def _locked_peakfit(func, *args, **kwargs):
   # Ensure all async peakfit calls have the global leastsq lock.
-  def helper():
-    with leastsq_lock:
-      return callback(func(*args, **kwargs))
-  t = Thread(target=helper)
-  t.daemon = True
-  t.start()
+  with leastsq_lock:
+    return func(*args, **kwargs)
 
 
 def _manual_peak_area(spectrum, bounds, base_type='region'):
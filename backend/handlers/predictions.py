@@ -6,6 +6,7 @@ from tornado import gen
 
 from .generic_models import GenericModelHandler, async_crossval, axes_grid
 from ..models import REGRESSION_MODELS
+from ..render import RENDERER
 
 
 class RegressionModelHandler(GenericModelHandler):
@@ -27,7 +28,7 @@ class RegressionModelHandler(GenericModelHandler):
     # collect primary keys for row labels
     all_pkeys = []
     for ds in all_ds:
-      dv = ds.view(mask=fig_data.filter_mask[ds])
+      dv = ds.view(mask=fig_data.filter_mask[ds.kind, ds.name])
       all_pkeys.extend(dv.get_primary_keys())
 
     # get data from the scatterplots
@@ -120,8 +121,8 @@ class RegressionModelHandler(GenericModelHandler):
         plot_kwargs = dict(xlabel='# channels')
 
       # run the cross validation
-      yield gen.Task(async_crossval, fig_data, model_cls, num_vars, cv_args,
-                     cv_kwargs, **plot_kwargs)
+      yield async_crossval(fig_data, model_cls, num_vars, cv_args, cv_kwargs,
+                           **plot_kwargs)
       return
 
     if bool(int(do_train)):
@@ -160,8 +161,8 @@ class RegressionModelHandler(GenericModelHandler):
     preds, stats = model.predict(X, variables)
 
     # plot
-    _plot_actual_vs_predicted(preds, stats, fig_data.figure, variables)
-    fig_data.manager.canvas.draw()
+    yield RENDERER.draw(fig_data, _plot_actual_vs_predicted, preds, stats,
+                        fig_data.figure, variables)
     fig_data.last_plot = 'regression_preds'
 
     res = dict(stats=stats, info=fig_data.pred_model.info_html())
@@ -169,30 +170,36 @@ class RegressionModelHandler(GenericModelHandler):
 
 
 class ModelPlottingHandler(GenericModelHandler):
+  @gen.coroutine
   def post(self):
     res = self.validate_inputs()
     if res is None:
       return
     fig_data, all_ds_views, ds_kind, wave, X = res
     model = fig_data.pred_model
-    all_bands, all_coefs = model.coefficients()
-
-    # Do the plot
-    fig_data.figure.clf(keep_observers=True)
-    ax1 = fig_data.figure.gca()
-    ax1.plot(wave, X.T, 'k-', alpha=0.5, lw=1)
-    ax2 = ax1.twinx()
-    ax2.axhline(lw=1, ls='--', color='gray')
     size = 20 * float(self.get_argument('line_width'))
     alpha = float(self.get_argument('alpha'))
-    for name, x, y in zip(model.var_names, all_bands, all_coefs):
-      ax2.scatter(x, y, label=name, s=size, alpha=alpha)
-    if bool(int(self.get_argument('legend'))) and len(model.var_names) > 1:
-      ax2.legend()
-    fig_data.manager.canvas.draw()
+    legend = bool(int(self.get_argument('legend')))
+
+    # Do the plot
+    yield RENDERER.draw(fig_data, _plot_coefficients, model, fig_data.figure,
+                        wave, X, size, alpha, legend)
     fig_data.last_plot = 'regression_coefs'
 
 
+def _plot_coefficients(model, fig, wave, X, size, alpha, legend):
+  all_bands, all_coefs = model.coefficients()
+  fig.clf(keep_observers=True)
+  ax1 = fig.gca()
+  ax1.plot(wave, X.T, 'k-', alpha=0.5, lw=1)
+  ax2 = ax1.twinx()
+  ax2.axhline(lw=1, ls='--', color='gray')
+  for name, x, y in zip(model.var_names, all_bands, all_coefs):
+    ax2.scatter(x, y, label=name, s=size, alpha=alpha)
+  if legend and len(model.var_names) > 1:
+    ax2.legend()
+
+
 def _plot_actual_vs_predicted(preds, stats, fig, variables):
   fig.clf(keep_observers=True)
   axes = axes_grid(fig, len(preds), 'Actual', 'Predicted')
@@ -1,10 +1,12 @@
 from __future__ import absolute_import, print_function, division
 import logging
+from tornado import gen
 
 from .common import BaseHandler
 
 
 class SearchMetadataHandler(BaseHandler):
+  @gen.coroutine
   def post(self):
     ds_kinds = self.get_arguments('ds_kind[]')
     case_sensitive = bool(int(self.get_argument('case_sensitive')))
@@ -22,8 +24,13 @@ class SearchMetadataHandler(BaseHandler):
 
     results = []
     for ds in datasets:
-      res = ds.search_metadata(query_str, full_text=full_text,
-                               case_sensitive=case_sensitive)
+      # unloaded datasets have no metadata to search, so load them again,
+      # one at a time (the result only needs the dataset's name)
+      data = (yield ds.warm_async()) if ds.cold else ds
+      if data is None:
+        continue
+      res = data.search_metadata(query_str, full_text=full_text,
+                                 case_sensitive=case_sensitive)
       if res:
         results.append((ds, res))
 
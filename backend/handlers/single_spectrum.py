@@ -2,8 +2,12 @@ from __future__ import absolute_import, print_function, division
 import logging
 import numpy as np
 import os
+from tornado import gen
 
 from .common import BaseHandler
+from ..decimate import plot_decimated
+from ..executors import run_in_pool
+from ..render import RENDERER
 
 
 class SelectorHandler(BaseHandler):
@@ -15,42 +19,71 @@ class SelectorHandler(BaseHandler):
     return self.render('_spectrum_selector.html', ds=ds)
 
 
+class SpectrumKeysHandler(BaseHandler):
+  '''Pages of primary keys with a given prefix, in select2's ajax format.'''
+  page_size = 50
+
+  @gen.coroutine
+  def get(self):
+    ds = self.request_one_ds('kind', 'name')
+    if ds is None or ds.pkey is None:
+      self.visible_error(404, 'Dataset not found.')
+      return
+    prefix = self.get_argument('q', '')
+    page = max(1, int(self.get_argument('page', 1)))
+    # the sorted keys are usually ready, unless the dataset just loaded
+    keys, more = yield run_in_pool('cpu', ds.keys_with_prefix, prefix,
+                                   offset=(page - 1) * self.page_size,
+                                   limit=self.page_size)
+    self.write(dict(results=[dict(id=k, text=k) for k in keys],
+                    pagination=dict(more=more)))
+
+
 class SelectHandler(BaseHandler):
+  @gen.coroutine
   def post(self):
     fig_data = self.get_fig_data()
     if fig_data is None:
-      return self.visible_error(403, 'Broken connection to server.')
+      self.visible_error(403, 'Broken connection to server.')
+      return
 
     ds = self.request_one_ds()
     if ds is None:
-      return self.visible_error(404, 'Dataset not found.')
+      self.visible_error(404, 'Dataset not found.')
+      return
 
     name = self.get_argument('name', None)
     if name is None:
       idx = int(self.get_argument('idx'))
       if not (0 <= idx < ds.num_spectra()):
-        return self.visible_error(403, 'Invalid spectrum number.',
-                                  'Index %d out of bounds in dataset %s',
-                                  idx, ds)
+        self.visible_error(403, 'Invalid spectrum number.',
+                           'Index %d out of bounds in dataset %s', idx, ds)
+        return
       name = 'Spectrum %d' % idx
     else:
-      idx = ds.pkey.key2index(name)
+      try:
+        idx = ds.pkey.key2index(name)
+      except KeyError:
+        self.visible_error(404, 'No spectrum named %r in %s' % (name, ds))
+        return
 
-    fig_data.set_selected(ds.view(mask=[idx]), title=name)
-    axlimits = fig_data.plot()
-    return self.write_json(axlimits)
+    axlimits = yield RENDERER.draw(fig_data, select_and_plot, fig_data,
+                                   ds.view(mask=[idx]), name)
+    self.write_json(axlimits)
 
 
 class PreprocessHandler(BaseHandler):
+  @gen.coroutine
   def post(self):
     fig_data = self.get_fig_data()
     if fig_data is None:
-      return self.visible_error(403, 'Broken connection to server.')
+      self.visible_error(403, 'Broken connection to server.')
+      return
 
     pp = self.get_argument('pp')
-    fig_data.add_transform('pp', pp=pp)
-    axlimits = fig_data.plot('pp')
-    return self.write_json(axlimits)
+    axlimits = yield RENDERER.draw(fig_data, _preprocess_and_plot, fig_data,
+                                   pp)
+    self.write_json(axlimits)
 
 
 class BaselineHandler(BaseHandler):
@@ -69,6 +102,7 @@ class BaselineHandler(BaseHandler):
       self.write('%g\t%g\t%g\t%g\n' % (x, y + b, b, y))
     self.finish()
 
+  @gen.coroutine
   def post(self):
     # Check arguments first to fail fast.
     fig_data = self.get_fig_data()
@@ -79,34 +113,56 @@ class BaselineHandler(BaseHandler):
     del trans['pp']
     del trans['chan_mask']
 
-    fig_data.add_transform('baseline-corrected', **trans)
     logging.info('Running BLR: %r', trans)
     try:
-      bands, corrected = fig_data.get_trajectory('baseline-corrected').T
-    except Exception:
+      yield RENDERER.draw(fig_data, _baseline_and_plot, fig_data, trans)
+    except _BaselineFailure:
       logging.exception('BLR failed.')
-      return self.visible_error(400, 'Baseline correction failed.')
-
-    if len(fig_data.figure.axes) == 2:
-      # comparison view for the baseline page
-      ax1, ax2 = fig_data.figure.axes
-      fig_data.plot('upload', ax=ax1)
-      baseline = trans['blr_obj'].baseline.ravel()
-      fig_data.baseline = baseline
-      ax1.plot(bands, baseline, 'r-')
-      ax2.plot(bands, corrected, 'k-')
-      ax2.set_title('Corrected')
-    else:
-      # regular old plot of the corrected spectrum
-      ax = fig_data.figure.gca()
-      ax.clear()
-      ax.plot(bands, corrected, '-')
-      ax.set_title(fig_data.title)
-    fig_data.manager.canvas.draw()
+      self.visible_error(400, 'Baseline correction failed.')
+
+
+class _BaselineFailure(Exception):
+  pass
+
+
+def select_and_plot(fig_data, ds_view, name):
+  '''Render job for showing a newly-selected spectrum.'''
+  fig_data.set_selected(ds_view, title=name)
+  return fig_data.plot()
+
+
+def _preprocess_and_plot(fig_data, pp):
+  fig_data.add_transform('pp', pp=pp)
+  return fig_data.plot('pp')
+
+
+def _baseline_and_plot(fig_data, trans):
+  fig_data.add_transform('baseline-corrected', **trans)
+  try:
+    bands, corrected = fig_data.get_trajectory('baseline-corrected').T
+  except Exception as e:
+    raise _BaselineFailure(e)
+
+  if len(fig_data.figure.axes) == 2:
+    # comparison view for the baseline page
+    ax1, ax2 = fig_data.figure.axes
+    fig_data.plot('upload', ax=ax1)
+    baseline = trans['blr_obj'].baseline.ravel()
+    fig_data.baseline = baseline
+    plot_decimated(ax1, bands, baseline, 'r-')
+    plot_decimated(ax2, bands, corrected, 'k-')
+    ax2.set_title('Corrected')
+  else:
+    # regular old plot of the corrected spectrum
+    ax = fig_data.figure.gca()
+    ax.clear()
+    plot_decimated(ax, bands, corrected, '-')
+    ax.set_title(fig_data.title)
 
 
 routes = [
     (r'/_spectrum_selector', SelectorHandler),
+    (r'/_spectrum_keys', SpectrumKeysHandler),
     (r'/_select', SelectHandler),
     (r'/_pp', PreprocessHandler),
     (r'/_baseline', BaselineHandler),
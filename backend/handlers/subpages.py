@@ -7,6 +7,15 @@ from collections import defaultdict
 from matplotlib import cm, rcParams
 
 from .common import BaseHandler, BLR_KWARGS
+from ..executors import pool_stats
+from ..lazy_arrays import BLOCK_CACHE
+from ..memory import MEMORY
+from ..metrics import METRICS
+from ..profiling import PROFILER
+from ..render import RENDERER
+from ..registry_snapshot import REGISTRY_SNAPSHOT
+from ..sidecar import SIDECAR
+from ..watcher import WATCHER
 
 MPL_JS = sorted(os.listdir(os.path.join(matplotlib.__path__[0],
                                         'backends/web_backend/jquery/js')))
@@ -70,8 +79,9 @@ class DatasetsPage(Subpage):
   description = 'Browse all spectroscopy datasets.'
 
   def get(self):
-    self.render(dt=datetime.datetime.fromtimestamp,
-                datasets=self.all_datasets())
+    datasets = self.all_datasets()
+    self.render(dt=datetime.datetime.fromtimestamp, datasets=datasets,
+                memory=MEMORY.stats(datasets), watcher=WATCHER)
 
 
 class DataExplorerPage(Subpage):
@@ -148,7 +158,40 @@ class DebugPage(BaseHandler):
   @tornado.web.authenticated
   def get(self):
     self.render('debug.html', page_title='Debug View', mpl_js=[],
-                figure_data=self.application.figure_data)
+                dt=datetime.datetime.fromtimestamp,
+                figure_data=self.application.figure_data,
+                render_stats=RENDERER.stats(), pool_stats=pool_stats(),
+                download_stats=self.application.download_cache.stats(),
+                lazy_cache_stats=BLOCK_CACHE.stats(),
+                sidecar_stats=SIDECAR.stats(),
+                snapshot_stats=REGISTRY_SNAPSHOT.stats(),
+                memory_stats=MEMORY.stats(self.all_datasets()),
+                route_metrics=METRICS.summary(), profiler=PROFILER)
+
+
+class ProfilerHandler(BaseHandler):
+  @tornado.web.authenticated
+  def post(self):
+    routes = [r.strip() for r in self.get_argument('routes', '').split(',')]
+    try:
+      sample_rate = float(self.get_argument('sample_rate', '0') or 0)
+    except ValueError:
+      return self.visible_error(400, 'Invalid sample rate.')
+    PROFILER.configure(routes=filter(None, routes),
+                       sample_rate=min(1., max(0., sample_rate)))
+    self.redirect('/debug')
+
+
+class ProfileDownloadHandler(BaseHandler):
+  @tornado.web.authenticated
+  def get(self, filename):
+    path = os.path.join(PROFILER.outdir, os.path.basename(filename))
+    if not os.path.isfile(path):
+      raise tornado.web.HTTPError(404)
+    self.set_header('Content-Type', 'application/octet-stream')
+    self.set_header('Content-Disposition', 'attachment; filename='+filename)
+    with open(path, 'rb') as fh:
+      self.write(fh.read())
 
 
 # Define the routes for each page.
@@ -162,4 +205,6 @@ routes = [
     (r'/import', DatasetImportPage),
     (r'/search', SearchPage),
     (r'/debug', DebugPage),
+    (r'/debug/profiler', ProfilerHandler),
+    (r'/debug/profiles/([^/]+\.pstats)', ProfileDownloadHandler),
 ]
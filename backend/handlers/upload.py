@@ -9,26 +9,33 @@ import yaml
 from io import BytesIO, StringIO
 from six.moves import xrange
 from superman.file_io import parse_spectrum
-from threading import Thread
 from tornado import gen
 from tornado.escape import url_escape
 from zipfile import is_zipfile, ZipFile
 
 from .common import BaseHandler
+from .single_spectrum import select_and_plot
+from ..executors import run_in_pool
+from ..packed_trajs import pack, write_packed
+from ..render import RENDERER
 from ..web_datasets import (
     UploadedSpectrumDataset,
     WebTrajDataset, WebVectorDataset, WebLIBSDataset, DATASETS,
-    PrimaryKeyMetadata, NumericMetadata, BooleanMetadata, LookupMetadata)
+    PrimaryKeyMetadata, NumericMetadata, BooleanMetadata, LookupMetadata,
+    storage_dtypes)
 
 
 class SpectrumUploadHandler(BaseHandler):
+    @gen.coroutine
     def post(self):
         fig_data = self.get_fig_data()
         if fig_data is None:
-            return self.visible_error(403, 'Broken connection to server.')
+            self.visible_error(403, 'Broken connection to server.')
+            return
 
         if not self.request.files:
-            return self.visible_error(403, 'No file uploaded.')
+            self.visible_error(403, 'No file uploaded.')
+            return
 
         f = self.request.files['query'][0]
         fname = f['filename']
@@ -45,12 +52,13 @@ class SpectrumUploadHandler(BaseHandler):
                 logging.exception('Spectrum parse failed.')
                 # XXX: save failed uploads for debugging purposes
                 open('logs/badupload-' + fname, 'w').write(f['body'])
-                return self.visible_error(415, 'Spectrum upload failed.')
+                self.visible_error(415, 'Spectrum upload failed.')
+                return
 
         ds = UploadedSpectrumDataset(fname, query)
-        fig_data.set_selected(ds.view(), title=fname)
-        axlimits = fig_data.plot()
-        return self.write_json(axlimits)
+        axlimits = yield RENDERER.draw(fig_data, select_and_plot, fig_data,
+                                       ds.view(), fname)
+        self.write_json(axlimits)
 
 
 class DatasetUploadHandler(BaseHandler):
@@ -64,6 +72,12 @@ class DatasetUploadHandler(BaseHandler):
         if not any(resample):
             resample = None
 
+        try:
+            dtypes = storage_dtypes(self.get_argument('dtype', '') or None)
+        except ValueError as e:
+            self.visible_error(400, str(e))
+            return
+
         if ds_kind not in DATASETS:
             self.visible_error(400, 'Invalid dataset kind.', 'Invalid ds_kind: %r', ds_kind)
             return
@@ -80,8 +94,8 @@ class DatasetUploadHandler(BaseHandler):
         meta_file, = self.request.files.get('metadata', [None])
         spectra_file, = self.request.files['spectra']
 
-        # TODO: gen.Task is removed from modern Tornado implementation, fix this
-        err = yield gen.Task(_async_ds_upload, meta_file, spectra_file, ds_name, ds_kind, resample, description)
+        err = yield run_in_pool('io', _ds_upload, meta_file, spectra_file, ds_name, ds_kind, resample, description,
+                                dtypes)
         if err:
             self.visible_error(*err)
             return
@@ -90,32 +104,24 @@ class DatasetUploadHandler(BaseHandler):
         self.write('/explorer?ds_kind=%s&ds_name=%s' % (
             ds_kind, url_escape(ds_name, plus=False)))
 
-        # Kick off a background thread to save this new dataset to disk.
-        t = Thread(target=_save_ds, args=(ds_kind, ds_name))
-        t.daemon = True
-        t.start()
-
-
-def _async_ds_upload(meta_file, spectra_file, ds_name, ds_kind, resample, description, callback=None):
-    def helper():
-        meta_kwargs, meta_pkeys, err = _load_metadata_csv(meta_file)
+        # Save this new dataset to disk in the background.
+        run_in_pool('io', _save_ds, ds_kind, ds_name)
 
-        if err is None:
-            fh = BytesIO(spectra_file['body'])
-            if is_zipfile(fh):
-                # interpret this as a ZIP of csv files
-                fh.seek(0)
-                err = _traj_ds(fh, ds_name, ds_kind, meta_kwargs, meta_pkeys, resample, description)
-            else:
-                # this is one single csv file with all spectra in it
-                fh.seek(0)
-                err = _vector_ds(fh, ds_name, ds_kind, meta_kwargs, meta_pkeys, resample, description)
 
-        callback(err)
+def _ds_upload(meta_file, spectra_file, ds_name, ds_kind, resample, description,
+               dtypes=(None, None)):
+    meta_kwargs, meta_pkeys, err = _load_metadata_csv(meta_file)
+    if err is not None:
+        return err
 
-    t = Thread(target=helper)
-    t.daemon = True
-    t.start()
+    fh = BytesIO(spectra_file['body'])
+    if is_zipfile(fh):
+        # interpret this as a ZIP of csv files
+        fh.seek(0)
+        return _traj_ds(fh, ds_name, ds_kind, meta_kwargs, meta_pkeys, resample, description, dtypes)
+    # this is one single csv file with all spectra in it
+    fh.seek(0)
+    return _vector_ds(fh, ds_name, ds_kind, meta_kwargs, meta_pkeys, resample, description, dtypes)
 
 
 def _load_metadata_csv(f=None):
@@ -154,7 +160,7 @@ def _load_metadata_csv(f=None):
 
 
 def _traj_ds(fh, ds_name, ds_kind, meta_kwargs, meta_pkeys, resample,
-             description):
+             description, dtypes=(None, None)):
     # sanity check before doing the hard work
     if resample is None and ds_kind == 'LIBS':
         return 415, 'Failed: LIBS data must be sampled on a common x-axis'
@@ -178,6 +184,11 @@ def _traj_ds(fh, ds_name, ds_kind, meta_kwargs, meta_pkeys, resample,
             logging.exception('bad spectrum subfile: ' + fname)
             return 415, 'Unable to parse spectrum file: %s' % fname
 
+    spectra_dtype, bands_dtype = dtypes
+    if bands_dtype is not None:
+        for key, traj in traj_data.items():
+            traj_data[key] = traj.astype(bands_dtype, copy=False)
+
     num_meta = len(meta_pkeys)
     num_traj = len(traj_data)
 
@@ -210,6 +221,8 @@ def _traj_ds(fh, ds_name, ds_kind, meta_kwargs, meta_pkeys, resample,
         for i, key in enumerate(meta_pkeys):
             traj = traj_data[key]
             spectra[i] = np.interp(wave, traj[:, 0], traj[:, 1])
+        if spectra_dtype is not None:
+            spectra = spectra.astype(spectra_dtype, copy=False)
         pkey = PrimaryKeyMetadata(meta_pkeys)
 
         _load = _make_loader_function(description, wave, spectra, pkey=pkey,
@@ -219,7 +232,7 @@ def _traj_ds(fh, ds_name, ds_kind, meta_kwargs, meta_pkeys, resample,
     return None
 
 
-def _vector_ds(fh, ds_name, ds_kind, meta_kwargs, meta_pkeys, resample, description):
+def _vector_ds(fh, ds_name, ds_kind, meta_kwargs, meta_pkeys, resample, description, dtypes=(None, None)):
     # I'm not 100% sure what is happening here, but I assume we want to check to make sure we can properly import the
     #  data in the correct order
     try:
@@ -288,6 +301,11 @@ def _vector_ds(fh, ds_name, ds_kind, meta_kwargs, meta_pkeys, resample, descript
             spectra = spectra[:, lb_idx:ub_idx]
             wave = wave[lb_idx:ub_idx]
 
+    spectra_dtype, bands_dtype = dtypes
+    if spectra_dtype is not None:
+        spectra = spectra.astype(spectra_dtype, copy=False)
+        wave = wave.astype(bands_dtype, copy=False)
+
     # async loading machinery automatically registers us with DATASETS
     _load = _make_loader_function(description, wave, spectra, pkey=pkey, **meta_kwargs)
 
@@ -341,14 +359,18 @@ def _save_ds(ds_kind, ds_name):
         description=ds.description,
         public=ds.is_public,
         metadata=[])
+    if entry['vector'] and ds.intensities.dtype.name in ('float32', 'float16'):
+        # keep the same storage type when it's loaded again
+        entry['dtype'] = ds.intensities.dtype.name
     # TODO: move this logic to superman.dataset
     with h5py.File(outname, 'w') as fh:
         if entry['vector']:
             fh['/spectra'] = ds.intensities
             fh['/meta/waves'] = ds.bands
         else:
-            for key, traj in ds.traj.items():
-                fh['/spectra/' + key] = traj
+            # the packed layout, which loads faster than one dataset per key
+            keys = ds.pkey.keys
+            write_packed(fh, pack(keys, [ds.traj[key] for key in keys]))
         if ds.pkey is not None:
             fh['/meta/pkey'] = np.char.encode(ds.pkey.keys, 'utf8')
             entry['metadata'].append(('pkey', 'PrimaryKeyMetadata', None))
@@ -0,0 +1,103 @@
+from __future__ import absolute_import, print_function, division
+import itertools
+import numpy as np
+
+from .cache import ByteLRUCache
+
+__all__ = ['LazyMatrix', 'BLOCK_CACHE']
+
+# Row blocks of all lazy matrices share this cache, which bounds their memory.
+BLOCK_CACHE = ByteLRUCache(256 * 2**20, sizeof=lambda arr: arr.nbytes)
+
+_ids = itertools.count()
+
+
+class LazyMatrix(object):
+  '''Read-only (n,d) matrix that stays on disk until rows are requested.
+
+  Wraps an HDF5 dataset or a memory-mapped array, and reads it in blocks
+  of rows which are cached in BLOCK_CACHE. Supports the indexing that
+  superman's VectorDataset uses: an int, slice, boolean mask, or index array
+  for the rows, optionally followed by any numpy index for the columns.
+  Blocks are converted to dtype (if given) as they're read.
+  '''
+  def __init__(self, store, block_bytes=2**20, dtype=None):
+    if len(store.shape) != 2:
+      raise ValueError('LazyMatrix needs a 2d array, got shape %s' %
+                       (store.shape,))
+    self.store = store
+    self.shape = tuple(store.shape)
+    self.dtype = np.dtype(store.dtype if dtype is None else dtype)
+    self.ndim = 2
+    row_bytes = max(1, self.shape[1] * self.dtype.itemsize)
+    self.block_rows = max(1, block_bytes // row_bytes)
+    # align blocks with HDF5 chunks, so each chunk is read only once
+    chunks = getattr(store, 'chunks', None)
+    if chunks:
+      self.block_rows = max(1, self.block_rows // chunks[0]) * chunks[0]
+    self._id = next(_ids)
+
+  def __len__(self):
+    return self.shape[0]
+
+  @property
+  def nbytes(self):
+    '''Size of the full matrix, most of which is (usually) not in memory.'''
+    return self.shape[0] * self.shape[1] * self.dtype.itemsize
+
+  def __array__(self, dtype=None):
+    arr = self[:]
+    return arr if dtype is None else arr.astype(dtype)
+
+  def __getitem__(self, key):
+    if not isinstance(key, tuple):
+      key = (key,)
+    rows, cols = key[0], key[1:]
+    if isinstance(rows, (int, np.integer)):
+      return self._read_rows(np.array([rows]), cols)[0]
+    if isinstance(rows, slice):
+      rows = np.arange(*rows.indices(self.shape[0]))
+    else:
+      rows = np.asarray(rows)
+      if rows.dtype == bool:
+        rows, = np.nonzero(rows)
+    return self._read_rows(rows.ravel(), cols)
+
+  def _read_rows(self, rows, cols):
+    rows = np.where(rows < 0, rows + self.shape[0], rows)
+    blocks = rows // self.block_rows
+    # Big scans would just flush the cache, so they skip it.
+    num_blocks = len(np.unique(blocks))
+    use_cache = (num_blocks * self.block_rows * self.shape[1] *
+                 self.dtype.itemsize) < BLOCK_CACHE.max_bytes // 2
+    out = None
+    order = np.argsort(blocks, kind='mergesort')
+    starts = np.flatnonzero(np.diff(blocks[order])) + 1
+    for idx in np.split(order, starts):
+      if len(idx) == 0:
+        continue
+      b = blocks[idx[0]]
+      block = self._get_block(b, use_cache)
+      part = block[rows[idx] - b * self.block_rows]
+      if cols:
+        part = part[(slice(None),) + cols]
+      if out is None:
+        out = np.empty((len(rows),) + part.shape[1:], dtype=part.dtype)
+      out[idx] = part
+    if out is None:
+      # no rows requested
+      out = np.empty((0, self.shape[1]), dtype=self.dtype)
+      if cols:
+        out = out[(slice(None),) + cols]
+    return out
+
+  def _get_block(self, b, use_cache):
+    key = (self._id, b)
+    block = BLOCK_CACHE.get(key) if use_cache else None
+    if block is None:
+      start = b * self.block_rows
+      block = np.asarray(self.store[start:start + self.block_rows],
+                         dtype=self.dtype)
+      if use_cache:
+        BLOCK_CACHE.put(key, block)
+    return block
@@ -0,0 +1,147 @@
+from __future__ import absolute_import, print_function, division
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from six import string_types
+
+from .executors import POOLS
+
+__all__ = ['LOADER', 'DatasetLoader']
+
+
+class LoadStatus(object):
+  def __init__(self, name, kind, priority):
+    self.name = name
+    self.kind = kind
+    self.priority = priority
+    self.state = 'queued'
+    self.queued_time = time.time()
+    self.start_time = None
+    self.end_time = None
+    self.num_bytes = 0
+
+  def finished(self):
+    return self.state in ('ready', 'failed')
+
+  def as_dict(self):
+    now = time.time()
+    load_time = wait_time = None
+    if self.start_time is not None:
+      load_time = (self.end_time or now) - self.start_time
+      wait_time = self.start_time - self.queued_time
+    return dict(name=self.name, kind=self.kind, priority=self.priority,
+                state=self.state, bytes=self.num_bytes, load_time=load_time,
+                wait_time=wait_time)
+
+
+class DatasetLoader(object):
+  '''Loads datasets on a bounded thread pool, highest priority first.
+
+  Each dataset's progress is tracked, so callers can tell when the
+  important datasets are ready to use (see ReadyHandler).
+  '''
+  def __init__(self, pool_name='load'):
+    self.pool = POOLS[pool_name]
+    self._heap = []
+    self._seq = itertools.count()
+    self._cond = threading.Condition()
+    self._num_pending = 0
+    # while paused, loads are queued but not started (see pause)
+    self._paused = False
+    self._num_held = 0
+    # str(ds) -> LoadStatus, for the most recent load of each dataset
+    self._status = {}
+
+  def submit(self, ds, priority=0):
+    '''Queues ds.reload() to run on the pool.'''
+    status = LoadStatus(ds.name, ds.kind, priority)
+    with self._cond:
+      self._status[str(ds)] = status
+      heapq.heappush(self._heap, (-priority, next(self._seq), ds, status))
+      self._num_pending += 1
+      if self._paused:
+        self._num_held += 1
+        return
+    # Each job runs whichever load has the highest priority at the time.
+    self.pool.submit(self._load_next)
+
+  def pause(self):
+    '''Holds new loads in the queue until start() is called, so that a
+    batch of datasets loads in priority order, not the order it's queued.'''
+    with self._cond:
+      self._paused = True
+
+  def start(self):
+    '''Starts the loads held since pause().'''
+    with self._cond:
+      self._paused = False
+      num_held, self._num_held = self._num_held, 0
+    for _ in range(num_held):
+      self.pool.submit(self._load_next)
+
+  def restored(self, ds, priority=0):
+    '''Records that ds was restored from a snapshot, instead of loaded.'''
+    status = LoadStatus(ds.name, ds.kind, priority)
+    status.start_time = status.end_time = time.time()
+    status.state = 'ready'
+    with self._cond:
+      self._status[str(ds)] = status
+
+  def _load_next(self):
+    with self._cond:
+      _, _, ds, status = heapq.heappop(self._heap)
+      status.state = 'loading'
+      status.start_time = time.time()
+    ok = False
+    try:
+      ok = ds.reload()
+    except Exception:
+      logging.exception('Failed to load %s', ds)
+    finally:
+      status.num_bytes = _file_bytes(ds.loader_args)
+      status.end_time = time.time()
+      status.state = 'ready' if ok else 'failed'
+      with self._cond:
+        self._num_pending -= 1
+        self._cond.notify_all()
+    logging.info('Loaded %s in %.1fs (%s)', ds,
+                 status.end_time - status.start_time, status.state)
+
+  def wait(self):
+    '''Blocks until all queued loads have finished.'''
+    with self._cond:
+      while self._num_pending:
+        self._cond.wait()
+
+  def is_ready(self, min_priority=0):
+    '''True when every dataset with at least min_priority has finished
+    loading (successfully or not).'''
+    with self._cond:
+      return all(s.finished() for s in self._status.values()
+                 if s.priority >= min_priority)
+
+  def progress(self):
+    '''Status dicts for each dataset, highest priority first.'''
+    with self._cond:
+      statuses = list(self._status.values())
+    statuses.sort(key=lambda s: (-s.priority, s.queued_time))
+    return [s.as_dict() for s in statuses]
+
+
+def _file_bytes(paths):
+  total = 0
+  for path in paths:
+    if not isinstance(path, string_types):
+      continue
+    try:
+      total += os.path.getsize(path)
+    except OSError:
+      pass
+  return total
+
+
+# Singleton that loads all datasets.
+LOADER = DatasetLoader()
@@ -0,0 +1,113 @@
+from __future__ import absolute_import, print_function, division
+import itertools
+import logging
+import mmap
+import numpy as np
+import sys
+import threading
+import time
+
+__all__ = ['MEMORY', 'MemoryBudget', 'nbytes']
+
+# Containers bigger than this are sized from a sample of their items.
+SAMPLE_SIZE = 1000
+
+
+class MemoryBudget(object):
+  '''Keeps the datasets' memory use under max_bytes (if positive) by
+  unloading the least recently used ones, which are loaded again when
+  they're next requested.'''
+  def __init__(self, max_bytes=0):
+    self.max_bytes = max_bytes
+    self.num_unloads = 0
+    self._last_used = {}
+    self._lock = threading.Lock()
+
+  def touch(self, ds, now=None):
+    self._last_used[(ds.kind, ds.name)] = now or time.time()
+
+  def last_used(self, ds):
+    return self._last_used.get((ds.kind, ds.name))
+
+  def enforce(self, datasets, keep=None):
+    '''Unloads datasets, oldest first, until the rest fit in the budget.
+    The dataset `keep` stays loaded, even if it doesn't fit by itself.'''
+    if self.max_bytes <= 0:
+      return
+    with self._lock:
+      loaded = [ds for ds in datasets if not ds.cold]
+      total = sum(ds.memory_usage()['total'] for ds in loaded)
+      loaded.sort(key=lambda ds: self._last_used.get((ds.kind, ds.name), 0))
+      for ds in loaded:
+        if total <= self.max_bytes:
+          break
+        if ds == keep or not ds.can_unload():
+          continue
+        size = ds.memory_usage()['total']
+        if ds.unload():
+          total -= size
+          self.num_unloads += 1
+      if total > self.max_bytes:
+        logging.warning('Datasets use %.1f MB, over the %.1f MB budget',
+                        total / 2.**20, self.max_bytes / 2.**20)
+
+  def stats(self, datasets):
+    '''Totals, and (dataset, memory usage, idle seconds) for each dataset,
+    biggest first.'''
+    now = time.time()
+    usage = []
+    for ds in datasets:
+      last_used = self.last_used(ds)
+      idle = None if last_used is None else now - last_used
+      usage.append((ds, ds.memory_usage(), idle))
+    usage.sort(key=lambda t: -t[1]['total'])
+    return dict(max_bytes=self.max_bytes, num_unloads=self.num_unloads,
+                total=sum(u['total'] for _, u, _ in usage),
+                num_cold=sum(1 for ds, _, _ in usage if ds.cold),
+                datasets=usage)
+
+
+def nbytes(obj, seen=None):
+  '''Estimates the memory held by obj: its numpy arrays, containers and
+  strings, following the attributes of other objects. Things shared with
+  objects already in `seen` (a set of ids) aren't counted again, and data
+  backed by files (memory maps, HDF5, lazy matrices) counts as zero.'''
+  if seen is None:
+    seen = set()
+  if obj is None or id(obj) in seen:
+    return 0
+  seen.add(id(obj))
+  if isinstance(obj, np.ndarray):
+    if isinstance(obj, np.memmap):
+      return 0
+    if obj.base is not None:
+      # count the memory behind views just once
+      return nbytes(obj.base, seen)
+    return obj.nbytes
+  if isinstance(obj, mmap.mmap):
+    return 0
+  if isinstance(obj, (bytes, str, type(u''), int, float)):
+    return sys.getsizeof(obj)
+  if isinstance(obj, dict):
+    return sys.getsizeof(obj) + _sampled(
+        obj.items(), len(obj), lambda kv: nbytes(kv[0], seen) +
+        nbytes(kv[1], seen))
+  if isinstance(obj, (list, tuple, set, frozenset)):
+    return sys.getsizeof(obj) + _sampled(
+        obj, len(obj), lambda x: nbytes(x, seen))
+  if type(obj).__module__.split('.')[0] == 'h5py' or not hasattr(
+      obj, '__dict__'):
+    # HDF5 objects read from disk on demand
+    return 0
+  return nbytes(vars(obj), seen)
+
+
+def _sampled(items, n, size_fn):
+  if n <= SAMPLE_SIZE:
+    return sum(size_fn(x) for x in items)
+  sample = itertools.islice(items, SAMPLE_SIZE)
+  return int(sum(size_fn(x) for x in sample) * n / SAMPLE_SIZE)
+
+
+# Singleton, configured by memory_budget_mb in config.yml.
+MEMORY = MemoryBudget()
@@ -0,0 +1,101 @@
+from __future__ import absolute_import, print_function, division
+import bisect
+import threading
+from collections import OrderedDict
+
+__all__ = ['METRICS', 'LatencyHistogram', 'RouteMetrics']
+
+# Histogram bucket upper bounds, in seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                   30, 60)
+
+# Phases of handling a request, in order.
+PHASES = ('prepare', 'handler', 'render', 'write', 'total')
+
+
+class LatencyHistogram(object):
+  def __init__(self, buckets=DEFAULT_BUCKETS):
+    self.buckets = buckets
+    # one count per bucket, plus one for +Inf
+    self.counts = [0] * (len(buckets) + 1)
+    self.count = 0
+    self.sum = 0.
+    self.max = 0.
+
+  def observe(self, seconds):
+    self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+    self.count += 1
+    self.sum += seconds
+    self.max = max(self.max, seconds)
+
+  def quantile(self, q):
+    '''Estimates a quantile as the upper bound of the bucket containing it.'''
+    if self.count == 0:
+      return 0.
+    target = q * self.count
+    running = 0
+    for bound, count in zip(self.buckets, self.counts):
+      running += count
+      if running >= target:
+        return min(bound, self.max)
+    return self.max
+
+  def mean(self):
+    return self.sum / max(1, self.count)
+
+
+class RouteMetrics(object):
+  '''Latency histograms, keyed by (route, method, phase).'''
+  def __init__(self, buckets=DEFAULT_BUCKETS):
+    self.buckets = buckets
+    self._hists = {}
+    self._lock = threading.Lock()
+
+  def observe(self, route, method, phase, seconds):
+    key = (route, method, phase)
+    with self._lock:
+      hist = self._hists.get(key)
+      if hist is None:
+        hist = self._hists[key] = LatencyHistogram(self.buckets)
+      hist.observe(seconds)
+
+  def clear(self):
+    with self._lock:
+      self._hists.clear()
+
+  def summary(self):
+    '''Rows of (route, method, {phase: histogram}), slowest routes first.'''
+    routes = OrderedDict()
+    with self._lock:
+      for (route, method, phase), hist in sorted(self._hists.items()):
+        routes.setdefault((route, method), {})[phase] = hist
+    rows = [(route, method, hists) for (route, method), hists in routes.items()]
+    rows.sort(key=_total_time, reverse=True)
+    return rows
+
+  def prometheus_text(self, name='superman_request_seconds'):
+    '''Formats all histograms in the Prometheus text exposition format.'''
+    lines = ['# HELP %s Time spent handling requests, by phase.' % name,
+             '# TYPE %s histogram' % name]
+    with self._lock:
+      items = sorted(self._hists.items())
+    for (route, method, phase), hist in items:
+      labels = 'route="%s",method="%s",phase="%s"' % (route, method, phase)
+      running = 0
+      for bound, count in zip(hist.buckets, hist.counts):
+        running += count
+        lines.append('%s_bucket{%s,le="%g"} %d' % (name, labels, bound,
+                                                    running))
+      lines.append('%s_bucket{%s,le="+Inf"} %d' % (name, labels, hist.count))
+      lines.append('%s_sum{%s} %f' % (name, labels, hist.sum))
+      lines.append('%s_count{%s} %d' % (name, labels, hist.count))
+    return '\n'.join(lines) + '\n'
+
+
+def _total_time(row):
+  hist = row[2].get('total')
+  return 0 if hist is None else hist.sum
+
+
+# Singleton shared by all handlers.
+METRICS = RouteMetrics()
@@ -4,13 +4,22 @@ matplotlib.use('WebAgg')
 matplotlib.rc('axes', facecolor='none')
 matplotlib.rc('legend', facecolor='w')
 import io
+import itertools
 import json
 import socket
+import time
 import tornado.httpserver
 import tornado.ioloop
 import tornado.web
 import tornado.websocket
+from collections import Counter, deque
 from matplotlib.figure import Figure
+from tornado import gen
+
+from .cache import ByteLRUCache
+from .decimate import plot_decimated
+from .figure_registry import FigureRegistry, estimate_nbytes
+from .render import RENDERER
 
 try:
   from matplotlib.backends.backend_webagg_core import (
@@ -35,6 +44,10 @@ class FigData(object):
     self.last_plot = None
     self._ds_view = None
     self._transformations = [None, None, None]
+    # bumped whenever the figure may have changed (see RenderPool.draw)
+    self.version = 0
+    # outbound websocket traffic: frames_sent, frames_dropped, bytes_sent
+    self.ws_stats = Counter()
     # HACK: cache keys/data for the explorer page
     self.clear_explorer_cache()
 
@@ -46,6 +59,16 @@ class FigData(object):
     self.explorer_color = None
     self.explorer_view_params = None
 
+  def nbytes(self):
+    '''Approximate memory held by this figure and its cached data.'''
+    # Agg pixel buffer, plus the copy WebAgg keeps for diffing
+    w, h = self.figure.bbox.size
+    total = int(8 * w * h)
+    for attr in ('explorer_data', 'explorer_color', 'hist_data', 'baseline',
+                 'pred_model', 'classify_model'):
+      total += estimate_nbytes(getattr(self, attr, None))
+    return total
+
   def set_selected(self, ds_view, title=''):
     self.title = title
     self._ds_view = ds_view
@@ -71,6 +94,8 @@ class FigData(object):
     return traj
 
   def plot(self, key='pp', ax=None):
+    '''Plots the selected trajectory, without drawing the figure.
+    Call via RENDERER.draw(fig_data, fig_data.plot) to render it.'''
     bands, ints = self.get_trajectory(key=key).T
 
     for _ax in self.figure.axes:
@@ -81,15 +106,27 @@ class FigData(object):
       else:
         ax = self.figure.gca()
 
-    ax.plot(bands, ints, '-')
+    plot_decimated(ax, bands, ints, '-')
     ax.set_title(self.title)
-    self.manager.canvas.draw()
     # return the axis limits
     xmin,xmax = ax.get_xlim()
     ymin,ymax = ax.get_ylim()
     return [xmin, xmax, ymin, ymax]
 
 
+def _handle_events(fig_data, events):
+  for event in events:
+    fig_data.manager.handle_json(event)
+  # events like zooming and resizing can change the figure
+  fig_data.version += 1
+
+
+def _print_figure(fig_data, fmt):
+  buff = io.BytesIO()
+  fig_data.manager.canvas.print_figure(buff, format=fmt)
+  return fig_data.version, buff.getvalue()
+
+
 class MatplotlibServer(tornado.web.Application):
   class MplJs(tornado.web.RequestHandler):
     """
@@ -105,9 +142,11 @@ class MatplotlibServer(tornado.web.Application):
     """
     Handles downloading of the figure in various file formats.
     """
+    @gen.coroutine
     def get(self, fignum, fmt):
-      fignum = int(fignum)
-      manager = self.application.figure_data[fignum].manager
+      fig_data = self.application.figure_data.get(int(fignum))
+      if fig_data is None:
+        raise tornado.web.HTTPError(404, 'Figure %s has expired', fignum)
       mimetypes = {
           'ps': 'application/postscript',
           'eps': 'application/postscript',
@@ -119,10 +158,26 @@ class MatplotlibServer(tornado.web.Application):
           'emf': 'application/emf'
       }
       self.set_header('Content-Type', mimetypes.get(fmt, 'binary'))
-      # write the file
-      buff = io.BytesIO()
-      manager.canvas.print_figure(buff, format=fmt)
-      self.write(buff.getvalue())
+      # browsers should check back, in case the figure has changed
+      self.set_header('Cache-Control', 'no-cache')
+      cache = self.application.download_cache
+
+      # check for an unchanged figure before doing any work
+      version = fig_data.version
+      self._set_etag(fignum, version, fmt)
+      if self.check_etag_header():
+        self.set_status(304)
+        return
+      data = cache.get((fignum, version, fmt))
+      if data is None:
+        version, data = yield RENDERER.submit(fig_data, _print_figure,
+                                              fig_data, fmt)
+        cache.put((fignum, version, fmt), data)
+        self._set_etag(fignum, version, fmt)
+      self.write(data)
+
+    def _set_etag(self, fignum, version, fmt):
+      self.set_header('Etag', '"%s-%d-%s"' % (fignum, version, fmt))
 
   class WebSocket(tornado.websocket.WebSocketHandler):
     """
@@ -143,43 +198,163 @@ class MatplotlibServer(tornado.web.Application):
     """
     supports_binary = True
 
+    def get_compression_options(self):
+      # permessage-deflate, if enabled (None disables it)
+      return self.application.ws_compression
+
     def open(self, fignum):
       self.fignum = int(fignum)
+      # Figures are drawn on render threads, so sends have to be passed
+      # back to this IOLoop, where they wait in a queue.
+      self.io_loop = tornado.ioloop.IOLoop.current()
+      self._queue = deque()
+      self._image_mode = 'full'
+      self._last_frame_time = 0
+      self._flush_handle = None
+      self._pending_write = None
+      # Inbound events are batched, and dispatched once per event_interval.
+      # This is set up even for evicted figures, because messages can
+      # still arrive before the close handshake finishes.
+      self._events = []
+      self._dispatch_handle = None
+      self.event_counts = Counter()
+      self._rate_start = time.time()
+      self._rate_count = 0
+      self._event_rate = 0.
+      fig_data = self.application.figure_data.get(self.fignum)
+      if fig_data is None:
+        # This figure has been evicted, so there's nothing to talk to.
+        self.close()
+        return
+      self.ws_stats = fig_data.ws_stats
       # Register the websocket with the FigureManager.
-      manager = self.application.figure_data[self.fignum].manager
-      manager.add_web_socket(self)
+      fig_data.manager.add_web_socket(self)
       if hasattr(self, 'set_nodelay'):
         self.set_nodelay(True)
 
     def on_close(self):
       # When the socket is closed, deregister the websocket with
       # the FigureManager.
-      manager = self.application.figure_data.pop(self.fignum).manager
-      manager.remove_web_socket(self)
+      # The figure may have been evicted already.
+      fig_data = self.application.figure_data.pop(self.fignum, None)
+      if fig_data is not None:
+        fig_data.manager.remove_web_socket(self)
 
     def on_message(self, message):
       # Every message has a "type" and a "figure_id".
       message = json.loads(message)
-      # if not message['type'] == 'motion_notify':
-      #     print('got message', message)
+      self._count_event()
       if message['type'] == 'supports_binary':
         self.supports_binary = message['value']
+        return
+      if (message['type'] == 'motion_notify' and self._events and
+          self._events[-1]['type'] == 'motion_notify'):
+        # only the latest position matters
+        self._events[-1] = message
+        self.event_counts['coalesced'] += 1
       else:
-        manager = self.application.figure_data[self.fignum].manager
-        manager.handle_json(message)
+        self._events.append(message)
+      if self._dispatch_handle is None:
+        self._dispatch_handle = self.io_loop.call_later(
+            self.application.ws_event_interval, self._dispatch_events)
+
+    def _dispatch_events(self):
+      self._dispatch_handle = None
+      events, self._events = self._events, []
+      fig_data = self.application.figure_data.get(self.fignum)
+      if fig_data is None or not events:
+        return
+      self.event_counts['dispatched'] += len(events)
+      # events may trigger a redraw, so they go through the renderer
+      RENDERER.submit(fig_data, _handle_events, fig_data, events)
+
+    def _count_event(self):
+      self.event_counts['received'] += 1
+      now = time.time()
+      if now - self._rate_start >= 1:
+        self._event_rate = self._rate_count / (now - self._rate_start)
+        self._rate_start = now
+        self._rate_count = 0
+      self._rate_count += 1
+
+    def event_stats(self):
+      stats = dict(self.event_counts)
+      # the rate is measured over the last full second of activity
+      stats['rate'] = (self._event_rate if time.time() - self._rate_start < 2
+                       else 0.)
+      return stats
 
     def send_json(self, content):
-      self.write_message(json.dumps(content))
+      self.io_loop.add_callback(self._enqueue_json, content)
 
     def send_binary(self, blob):
       if self.supports_binary:
-        self.write_message(blob, binary=True)
+        self.io_loop.add_callback(self._enqueue_frame, blob, True)
       else:
         data_uri = "data:image/png;base64,{0}".format(
             blob.encode('base64').replace('\n', ''))
-        self.write_message(data_uri)
+        self.io_loop.add_callback(self._enqueue_frame, data_uri, False)
+
+    def _enqueue_json(self, content):
+      if content.get('type') == 'image_mode':
+        self._image_mode = content['mode']
+      self._queue.append((json.dumps(content), False, False))
+      self._maybe_flush()
+
+    def _enqueue_frame(self, frame, binary):
+      if self._image_mode == 'full':
+        # A full frame replaces the whole image, so any frames still waiting
+        # to be sent are stale.
+        num_queued = len(self._queue)
+        self._queue = deque(m for m in self._queue if not m[2])
+        self.ws_stats['frames_dropped'] += num_queued - len(self._queue)
+      self._queue.append((frame, binary, True))
+      self._maybe_flush()
+
+    def _maybe_flush(self):
+      # If a flush is scheduled or a frame is still being written,
+      # the queue will be flushed later.
+      if self._flush_handle is None and self._pending_write is None:
+        self._flush()
+
+    def _flush(self):
+      self._flush_handle = None
+      self._pending_write = None
+      while self._queue:
+        if self.ws_connection is None:
+          # the socket has closed
+          self._queue.clear()
+          return
+        message, binary, is_frame = self._queue[0]
+        if is_frame:
+          max_fps = self.application.ws_max_fps
+          delay = (self._last_frame_time + 1. / max_fps - time.time()
+                   if max_fps else 0)
+          if delay > 0:
+            self._flush_handle = self.io_loop.call_later(delay, self._flush)
+            return
+        self._queue.popleft()
+        try:
+          future = self.write_message(message, binary=binary)
+        except tornado.websocket.WebSocketClosedError:
+          self._queue.clear()
+          return
+        self.ws_stats['bytes_sent'] += len(message)
+        if is_frame:
+          self.ws_stats['frames_sent'] += 1
+          self._last_frame_time = time.time()
+          # Wait for slow clients to receive this frame before sending
+          # another, so newer frames can replace queued ones meanwhile.
+          if future is not None and not future.done():
+            self._pending_write = future
+            self.io_loop.add_future(future, lambda f: self._flush())
+            return
 
-  def __init__(self, handlers, password=None, **kwargs):
+  def __init__(self, handlers, password=None, max_figures=500,
+               max_figure_bytes=1024 * 2**20, figure_ttl=3600,
+               worker_index=0, num_workers=1, ws_max_fps=30,
+               ws_compression=None, ws_event_interval=0.03,
+               download_cache_bytes=64 * 2**20, **kwargs):
     handlers = [
         (r'/_static/(.*)',
          tornado.web.StaticFileHandler,
@@ -189,19 +364,36 @@ class MatplotlibServer(tornado.web.Application):
         (r'/([0-9]+)/download.([a-z0-9.]+)', self.Download),
     ] + list(handlers)
     super(MatplotlibServer, self).__init__(handlers, **kwargs)
-    self.figure_data = {}  # id -> FigData
+    # id -> FigData
+    self.figure_data = FigureRegistry(max_figures=max_figures,
+                                      max_bytes=max_figure_bytes,
+                                      idle_ttl=figure_ttl)
     self.login_password = str(password)
+    # limits on websocket traffic
+    self.ws_max_fps = ws_max_fps
+    self.ws_compression = ws_compression
+    self.ws_event_interval = ws_event_interval
+    # (fignum, version, format) -> bytes of the exported figure
+    self.download_cache = ByteLRUCache(download_cache_bytes)
+    # Figure numbers encode the worker index (see backend/workers.py),
+    # and start from the current time to avoid reusing numbers across restarts.
+    self.worker_index = worker_index
+    self.num_workers = num_workers
+    self._fig_counter = itertools.count(int(time.time() * 1000))
 
-  def run_forever(self, port):
-    self.listen(port)
-    print('Running at http://%s:%d/' % (socket.gethostname(), port))
-    print('Press Ctrl+C to quit')
+  def run_forever(self, port, address=''):
+    self.listen(port, address=address)
+    if self.num_workers == 1:
+      print('Running at http://%s:%d/' % (socket.gethostname(), port))
+      print('Press Ctrl+C to quit')
+    # periodically discard figures that nobody is looking at anymore
+    tornado.ioloop.PeriodicCallback(self.figure_data.sweep, 60 * 1000).start()
     tornado.ioloop.IOLoop.instance().start()
 
   def register_new_figure(self, size):
     fig = Figure(figsize=size, facecolor='none', edgecolor='none',
                  frameon=False, tight_layout=True, dpi=80)
-    fignum = id(fig)
+    fignum = next(self._fig_counter) * self.num_workers + self.worker_index
     manager = new_figure_manager_given_figure(fignum, fig)
     self.figure_data[fignum] = FigData(fig, manager)
     return fignum
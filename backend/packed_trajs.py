@@ -0,0 +1,133 @@
+from __future__ import absolute_import, print_function, division
+import h5py
+import numpy as np
+
+__all__ = [
+    'PackedTrajectories', 'pack', 'read_packed', 'write_packed', 'pack_file',
+    'PACKED_DATA', 'PACKED_OFFSETS'
+]
+
+# HDF5 paths for the packed layout, next to the usual /meta/pkey.
+PACKED_DATA = '/spectra_data'
+PACKED_OFFSETS = '/spectra_offsets'
+
+
+class PackedTrajectories(object):
+  '''Read-only mapping from key to (n,2) trajectory, with all trajectories
+  concatenated into one array: the i'th is data[offsets[i]:offsets[i+1]].
+
+  Trajectories are views of that array, so nothing is allocated per
+  spectrum. Keys are found by binary search, instead of a dict.
+  '''
+  def __init__(self, keys, data, offsets):
+    self.keys_array = np.asarray(keys)
+    self.data = data
+    self.offsets = np.asarray(offsets, dtype=np.int64)
+    if len(self.offsets) != len(self.keys_array) + 1:
+      raise ValueError('Expected %d offsets, got %d' % (
+          len(self.keys_array) + 1, len(self.offsets)))
+    self._order = np.argsort(self.keys_array, kind='mergesort')
+    self._sorted_keys = self.keys_array[self._order]
+
+  def __len__(self):
+    return len(self.keys_array)
+
+  def __iter__(self):
+    return iter(self.keys_array)
+
+  def __contains__(self, key):
+    try:
+      self.positions([key])
+    except KeyError:
+      return False
+    return True
+
+  def __getitem__(self, key):
+    return self.at(self.positions([key])[0])
+
+  def keys(self):
+    return self.keys_array.tolist()
+
+  def values(self):
+    return [self.at(i) for i in range(len(self))]
+
+  def items(self):
+    return zip(self.keys(), self.values())
+
+  def at(self, i):
+    '''The i'th trajectory, in the order of the keys.'''
+    return self.data[self.offsets[i]:self.offsets[i+1]]
+
+  def positions(self, keys):
+    '''Indices of the given keys. Raises KeyError for unknown keys.'''
+    keys = np.asarray(keys)
+    if len(self) == 0:
+      if len(keys):
+        raise KeyError(keys[0])
+      return np.zeros(0, dtype=np.intp)
+    idx = np.searchsorted(self._sorted_keys, keys)
+    idx[idx == len(self)] = 0
+    found = self._sorted_keys[idx] == keys
+    if not np.all(found):
+      raise KeyError(keys[~found][0])
+    return self._order[idx]
+
+  def backwards(self):
+    '''Keys of trajectories that aren't in increasing order
+    (by their first two bands), or that have fewer than two points.'''
+    starts = self.offsets[:-1]
+    ok = np.diff(self.offsets) >= 2
+    ok[ok] = (self.data[starts[ok], 0] <= self.data[starts[ok] + 1, 0])
+    return self.keys_array[~ok]
+
+  def extend(self, new_keys, new_trajs):
+    '''Returns a new PackedTrajectories with these trajectories appended.'''
+    more = pack(new_keys, new_trajs, dtype=self.data.dtype)
+    return PackedTrajectories(
+        np.concatenate((self.keys_array, more.keys_array)),
+        np.concatenate((self.data, more.data)),
+        np.concatenate((self.offsets, more.offsets[1:] + self.offsets[-1])))
+
+
+def pack(keys, trajs, dtype=None):
+  '''Packs a sequence of (n,2) trajectories, in the same order as keys.'''
+  trajs = [np.asarray(t, dtype=dtype) for t in trajs]
+  offsets = np.zeros(len(trajs) + 1, dtype=np.int64)
+  np.cumsum([len(t) for t in trajs], out=offsets[1:])
+  if trajs:
+    data = np.concatenate(trajs)
+  else:
+    data = np.zeros((0, 2), dtype=dtype or float)
+  return PackedTrajectories(keys, data, offsets)
+
+
+def read_packed(fh, keys, dtype=None, start=0):
+  '''Reads the packed layout from an open HDF5 file, from the start'th
+  trajectory on (so keys should start there too).'''
+  offsets = fh[PACKED_OFFSETS][start:]
+  data = np.asarray(fh[PACKED_DATA][offsets[0]:], dtype=dtype)
+  return PackedTrajectories(keys, data, offsets - offsets[0])
+
+
+def write_packed(fh, packed):
+  '''Writes the packed layout to an open HDF5 file, resizable so that
+  trajectories can be appended. The keys belong in /meta/pkey, which this
+  doesn't write.'''
+  fh.create_dataset(PACKED_DATA, data=packed.data, maxshape=(None, 2))
+  fh.create_dataset(PACKED_OFFSETS, data=packed.offsets, maxshape=(None,))
+
+
+def pack_file(in_path, out_path, dtype=None):
+  '''Converts an HDF5 file of trajectories stored one per dataset
+  (/spectra/[pkey]) to the packed layout. Everything but /spectra is copied.
+  Returns the number of trajectories packed.'''
+  with h5py.File(in_path, 'r') as src, h5py.File(out_path, 'w') as dst:
+    for name in src:
+      if name != 'spectra':
+        src.copy(name, dst)
+    keys = np.array(src['/meta/pkey'])
+    if keys.dtype.char == 'S':
+      keys = np.char.decode(keys, 'utf8')
+    spectra = src['/spectra']
+    write_packed(dst, pack(keys, (spectra[k] for k in keys), dtype=dtype))
+  return len(keys)
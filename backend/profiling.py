@@ -0,0 +1,132 @@
+from __future__ import absolute_import, print_function, division
+import cProfile
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from functools import wraps
+from six import StringIO
+
+__all__ = ['PROFILER', 'Profiler']
+
+
+class RequestProfile(object):
+  def __init__(self, route, method, uri):
+    self.route = route
+    self.method = method
+    self.uri = uri
+    self.start_time = time.time()
+    self.duration = None
+    self.filename = None
+    self.summary = None
+    # the IOLoop thread's profile, plus one per background job
+    self.profiles = [cProfile.Profile()]
+    self.num_jobs = 0
+    self.finished = False
+
+
+class Profiler(object):
+  '''Profiles selected requests, including the work they hand off to the
+  thread pools (see executors.py and render.py).
+
+  Requests are chosen by route (handler class name) or at random,
+  and only one request is profiled at a time. Other requests running
+  concurrently on the IOLoop may still show up in its profile.
+  '''
+  def __init__(self, outdir='logs/profiles', max_recent=20, max_seconds=600):
+    self.outdir = outdir
+    self.max_seconds = max_seconds
+    self.routes = set()
+    self.sample_rate = 0.
+    self.recent = deque(maxlen=max_recent)
+    self._active = None
+    self._lock = threading.Lock()
+    self._local = threading.local()
+
+  def configure(self, routes=(), sample_rate=0.):
+    self.routes = set(routes)
+    self.sample_rate = sample_rate
+
+  def start(self, route, method, uri):
+    '''Returns a RequestProfile if this request should be profiled.'''
+    if route not in self.routes and random.random() >= self.sample_rate:
+      return None
+    with self._lock:
+      active = self._active
+      if active is not None:
+        if time.time() - active.start_time < self.max_seconds:
+          return None
+        # that request never finished, so give up on it
+        active.profiles[0].disable()
+        active.finished = True
+      prof = self._active = RequestProfile(route, method, uri)
+    prof.profiles[0].enable()
+    return prof
+
+  def finish(self, prof):
+    prof.profiles[0].disable()
+    with self._lock:
+      prof.finished = True
+      if self._active is prof:
+        self._active = None
+    prof.duration = time.time() - prof.start_time
+    try:
+      self._save(prof)
+    except Exception:
+      logging.exception('Failed to save profile for %s', prof.route)
+      return
+    self.recent.appendleft(prof)
+
+  def wrap(self, fn):
+    '''Wraps a background job so it's profiled along with the currently
+    profiled request, if there is one.'''
+    prof = self._active
+    if prof is None:
+      return fn
+
+    @wraps(fn)
+    def profiled(*args, **kwargs):
+      # cProfile can't nest, so let the outermost wrapper do the work
+      if getattr(self._local, 'busy', False):
+        return fn(*args, **kwargs)
+      self._local.busy = True
+      job_prof = cProfile.Profile()
+      try:
+        return job_prof.runcall(fn, *args, **kwargs)
+      finally:
+        self._local.busy = False
+        with self._lock:
+          if not prof.finished:
+            prof.profiles.append(job_prof)
+            prof.num_jobs += 1
+    return profiled
+
+  def _save(self, prof):
+    stats = pstats.Stats(prof.profiles[0])
+    for p in prof.profiles[1:]:
+      stats.add(p)
+    if not os.path.isdir(self.outdir):
+      os.makedirs(self.outdir)
+    basename = '%s.%03d_%s_%s' % (
+        time.strftime('%Y%m%d-%H%M%S', time.localtime(prof.start_time)),
+        prof.start_time % 1 * 1000, prof.route, prof.method)
+    prof.filename = basename + '.pstats'
+    stats.dump_stats(os.path.join(self.outdir, prof.filename))
+    # human-readable summary of the hottest functions
+    buf = StringIO()
+    stats.stream = buf
+    stats.sort_stats('cumulative').print_stats(25)
+    prof.summary = buf.getvalue()
+    with open(os.path.join(self.outdir, basename + '.txt'), 'w') as fh:
+      fh.write('%s %s (%.3fs, %d background jobs)\n' % (
+          prof.method, prof.uri, prof.duration, prof.num_jobs))
+      fh.write(prof.summary)
+    logging.info('Saved profile of %s %s to %s', prof.method, prof.uri,
+                 prof.filename)
+
+
+# Singleton shared by the handlers and thread pools.
+PROFILER = Profiler()
@@ -0,0 +1,184 @@
+from __future__ import absolute_import, print_function, division
+import h5py
+import logging
+import numpy as np
+import os
+import struct
+import time
+from io import BytesIO
+from six.moves import cPickle as pickle
+
+from .sidecar import _source_stamps
+
+__all__ = ['REGISTRY_SNAPSHOT', 'RegistrySnapshot']
+
+# Bump this when the file layout (or the saved dataset state) changes.
+FORMAT_VERSION = 1
+MAGIC = b'SMWEBSNP'
+# magic, format version, offset of the index
+HEADER = struct.Struct('<8sQQ')
+# Arrays at least this big are stored outside the pickles, to be mapped.
+MIN_MAPPED_BYTES = 4096
+ALIGNMENT = 64
+
+
+class RegistrySnapshot(object):
+  '''A single file with the data of every loaded dataset, which the server
+  can map into memory at startup instead of loading each dataset.
+
+  Big arrays are stored raw and aligned, and memory mapped (copy on write)
+  when read, so only the pages that get used are read from disk, and
+  forked workers share them. Data read from HDF5 files on demand is saved
+  as a reference, and opened again from the file.
+  A dataset is only restored if its files, and the config files,
+  haven't changed since the snapshot was written. Datasets whose data
+  can't be saved (like lazy ones) load from their files as usual.
+  '''
+  def __init__(self, path=None):
+    self.path = path
+    self.config_files = []
+    self.num_restored = 0
+    self.write_time = None
+    self._entries = {}
+    self._restored = set()
+    self._mmap = None
+    self._h5_files = {}
+
+  def read(self):
+    '''Opens the snapshot file, if there's a current one.
+    Returns the number of datasets in it.'''
+    self._entries = {}
+    if not self.path or not os.path.exists(self.path):
+      return 0
+    try:
+      with open(self.path, 'rb') as fh:
+        magic, version, index_offset = HEADER.unpack(fh.read(HEADER.size))
+        if magic != MAGIC or version != FORMAT_VERSION:
+          logging.info('Ignoring old snapshot %s', self.path)
+          return 0
+        fh.seek(index_offset)
+        config_stamps, entries = pickle.load(fh)
+    except Exception as e:
+      logging.warning('Ignoring bad snapshot %s: %s', self.path, e)
+      return 0
+    if config_stamps != _source_stamps(self.config_files):
+      logging.info('Config files changed, ignoring snapshot %s', self.path)
+      return 0
+    self._mmap = np.memmap(self.path, dtype=np.uint8, mode='c')
+    self._entries = entries
+    logging.info('Read snapshot of %d datasets from %s', len(entries),
+                 self.path)
+    return len(entries)
+
+  def take(self, ds):
+    '''Returns the saved state of ds (see snapshot_state in web_datasets.py),
+    or None if it isn't in the snapshot or its files have changed.'''
+    entry = self._entries.pop((ds.kind, ds.name), None)
+    if entry is None:
+      return None
+    sources, data = entry
+    if sources != _source_stamps(ds.source_files()):
+      logging.info('Snapshot of %s is out of date', ds)
+      return None
+    unpickler = pickle.Unpickler(BytesIO(data))
+    unpickler.persistent_load = self._persistent_load
+    try:
+      state = unpickler.load()
+    except Exception:
+      logging.exception('Failed to restore %s from snapshot', ds)
+      return None
+    self.num_restored += 1
+    self._restored.add((ds.kind, ds.name))
+    return state
+
+  def write(self, datasets):
+    '''Saves the loaded datasets, replacing the snapshot file.
+    Does nothing if they were all restored from it.'''
+    saved = [(ds, _source_stamps(ds.source_files())) for ds in datasets]
+    saved = [(ds, sources) for ds, sources in saved if sources]
+    if not self.path or all((ds.kind, ds.name) in self._restored
+                            for ds, _ in saved):
+      return
+    start = time.time()
+    tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+    try:
+      dirname = os.path.dirname(self.path)
+      if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname)
+      entries = {}
+      with open(tmp_path, 'wb') as fh:
+        fh.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0))
+        written = {}
+        for ds, sources in saved:
+          data = _pickle_state(ds, fh, written)
+          if data is not None:
+            entries[(ds.kind, ds.name)] = (sources, data)
+        index_offset = fh.tell()
+        pickle.dump((_source_stamps(self.config_files), entries), fh,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+        fh.seek(0)
+        fh.write(HEADER.pack(MAGIC, FORMAT_VERSION, index_offset))
+      # atomic, so a restarting server never sees a partial file
+      os.rename(tmp_path, self.path)
+    except (IOError, OSError) as e:
+      logging.warning('Failed to write snapshot %s: %s', self.path, e)
+      if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+      return
+    self.write_time = time.time()
+    logging.info('Wrote snapshot of %d datasets to %s in %.1fs',
+                 len(entries), self.path, self.write_time - start)
+
+  def stats(self):
+    return dict(path=self.path, num_restored=self.num_restored,
+                write_time=self.write_time)
+
+  def _persistent_load(self, pid):
+    if pid[0] == 'hdf5':
+      _, path, name = pid
+      if path not in self._h5_files:
+        self._h5_files[path] = h5py.File(path, mode='r')
+      return self._h5_files[path][name]
+    _, offset, dtype, shape = pid
+    size = dtype.itemsize * int(np.prod(shape))
+    return self._mmap[offset:offset + size].view(dtype).reshape(shape)
+
+
+def _pickle_state(ds, fh, written):
+  '''Pickles ds.snapshot_state(), writing its big arrays to fh.
+  Returns the pickle bytes, or None if ds can't be saved.'''
+  state = ds.snapshot_state()
+  if state is None:
+    return None
+  buf = BytesIO()
+  pickler = pickle.Pickler(buf, pickle.HIGHEST_PROTOCOL)
+  pickler.persistent_id = lambda obj: _persistent_id(obj, fh, written)
+  try:
+    pickler.dump(state)
+  except (IOError, OSError):
+    raise
+  except Exception as e:
+    # some data (open files, locks) can't be pickled
+    logging.info('Not saving %s in the snapshot: %s', ds, e)
+    return None
+  return buf.getvalue()
+
+
+def _persistent_id(obj, fh, written):
+  if isinstance(obj, (h5py.Dataset, h5py.Group)):
+    return ('hdf5', os.path.abspath(obj.file.filename), obj.name)
+  if (type(obj) not in (np.ndarray, np.memmap) or obj.dtype.hasobject or
+      obj.nbytes < MIN_MAPPED_BYTES):
+    return None  # pickle it as usual
+  pid = written.get(id(obj))
+  if pid is None:
+    fh.write(b'\0' * (-fh.tell() % ALIGNMENT))
+    pid = ('array', fh.tell(), obj.dtype, obj.shape)
+    np.ascontiguousarray(obj).tofile(fh)
+    # arrays shared between datasets (or snapshots) are written once
+    written[id(obj)] = pid
+  return pid
+
+
+# Singleton, used when the server is started with --snapshot.
+REGISTRY_SNAPSHOT = RegistrySnapshot()
@@ -0,0 +1,101 @@
+from __future__ import absolute_import, print_function, division
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from .executors import POOLS
+from .profiling import PROFILER
+
+__all__ = ['RENDERER', 'RenderPool']
+
+
+class RenderPool(object):
+  '''Runs figure drawing off the IOLoop thread.
+
+  Jobs for the same figure run one at a time, in the order they were
+  submitted, so matplotlib never sees concurrent access to one Figure.
+  Jobs for different figures run in parallel on the 'draw' thread pool.
+  Every method returns a Future, which handlers can yield on.
+  '''
+  def __init__(self, pool_name='draw'):
+    self.pool = POOLS[pool_name]
+    self._lock = threading.Lock()
+    # FigData -> deque of pending (fn, args, future, submit_time)
+    self._queues = {}
+    # metrics
+    self.queue_depth = 0
+    self.num_jobs = 0
+    self.num_draws = 0
+    self.total_draw_time = 0.
+    self.max_draw_time = 0.
+    self.recent_draw_time = 0.
+    self.total_wait_time = 0.
+
+  def submit(self, fig_data, fn, *args, **kwargs):
+    '''Calls fn(*args, **kwargs) with exclusive access to the figure.'''
+    future = Future()
+    job = (PROFILER.wrap(fn), args, kwargs, future, time.time())
+    with self._lock:
+      self.queue_depth += 1
+      queue = self._queues.get(fig_data)
+      if queue is not None:
+        # a worker is already busy with this figure, it'll pick this up
+        queue.append(job)
+      else:
+        self._queues[fig_data] = deque([job])
+        # each job is profiled on its own, so _run_queue isn't
+        self.pool.submit_unprofiled(self._run_queue, fig_data)
+    return future
+
+  def draw(self, fig_data, fn=None, *args, **kwargs):
+    '''Calls fn(*args, **kwargs) (if provided), then redraws the figure
+    and bumps its version. The future's result is fn's return value.'''
+    return self.submit(fig_data, self._draw_helper, fig_data, fn, args, kwargs)
+
+  def stats(self):
+    num_draws = max(1, self.num_draws)
+    return dict(num_threads=self.pool.num_threads, queue_depth=self.queue_depth,
+                active_figures=len(self._queues), num_jobs=self.num_jobs,
+                num_draws=self.num_draws,
+                mean_draw_time=self.total_draw_time / num_draws,
+                recent_draw_time=self.recent_draw_time,
+                max_draw_time=self.max_draw_time,
+                mean_wait_time=self.total_wait_time / max(1, self.num_jobs))
+
+  def _draw_helper(self, fig_data, fn, args, kwargs):
+    result = None if fn is None else fn(*args, **kwargs)
+    start = time.time()
+    fig_data.version += 1
+    fig_data.manager.canvas.draw()
+    elapsed = time.time() - start
+    with self._lock:
+      self.num_draws += 1
+      self.total_draw_time += elapsed
+      self.max_draw_time = max(self.max_draw_time, elapsed)
+      # exponentially-weighted moving average
+      self.recent_draw_time += 0.2 * (elapsed - self.recent_draw_time)
+    return result
+
+  def _run_queue(self, fig_data):
+    while True:
+      with self._lock:
+        queue = self._queues[fig_data]
+        fn, args, kwargs, future, submit_time = queue[0]
+        self.total_wait_time += time.time() - submit_time
+        self.num_jobs += 1
+      if future.set_running_or_notify_cancel():
+        try:
+          future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+          future.set_exception(e)
+      with self._lock:
+        queue.popleft()
+        self.queue_depth -= 1
+        if not queue:
+          del self._queues[fig_data]
+          return
+
+
+# Singleton shared by all handlers.
+RENDERER = RenderPool()
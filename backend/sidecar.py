@@ -0,0 +1,119 @@
+from __future__ import absolute_import, print_function, division
+import hashlib
+import json
+import logging
+import os
+import threading
+from six import string_types
+from six.moves import cPickle as pickle
+
+__all__ = ['SIDECAR', 'SidecarCache']
+
+# Bump this when the format of any cached artifact changes.
+FORMAT_VERSION = 4
+
+
+class DatasetArtifacts(object):
+  '''Derived data for one load of a dataset, backed by a pickle file.'''
+  def __init__(self, cache, path, sources, artifacts):
+    self.cache = cache
+    self.path = path
+    self.sources = sources
+    self.artifacts = artifacts
+    self._lock = threading.Lock()
+
+  def get(self, name, compute_fn):
+    '''Returns the named artifact, computing (and saving) it if needed.'''
+    if name in self.artifacts:
+      self.cache.hits += 1
+      return self.artifacts[name]
+    self.cache.misses += 1
+    value = compute_fn()
+    with self._lock:
+      self.artifacts[name] = value
+      self._save()
+    return value
+
+  def _save(self):
+    tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+    try:
+      with open(tmp_path, 'wb') as fh:
+        pickle.dump((FORMAT_VERSION, self.sources, self.artifacts), fh,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+      # atomic, so readers never see a partial file
+      os.rename(tmp_path, self.path)
+    except (IOError, OSError, pickle.PicklingError) as e:
+      logging.warning('Failed to write sidecar cache %s: %s', self.path, e)
+
+
+class SidecarCache(object):
+  '''Persists expensive, derived per-dataset data between server restarts.
+
+  Each dataset gets one file, which records the paths and mtimes of its
+  source files, and a digest of its datasets.yml entry. The cached
+  artifacts are discarded once either of those change.
+  Datasets without source files (like uploads) aren't cached.
+  '''
+  def __init__(self, cache_dir=None):
+    self.cache_dir = cache_dir
+    self.hits = 0
+    self.misses = 0
+
+  def open(self, ds):
+    '''Returns DatasetArtifacts for the current version of ds's files,
+    or None if it can't be cached.'''
+    if not self.cache_dir:
+      return None
+    stamps = _source_stamps(ds.source_files())
+    if not stamps:
+      return None
+    # artifacts also depend on the dataset's config (metadata, dtype, etc)
+    sources = (stamps, _config_digest(ds.loader_config))
+    name = ('%s/%s' % (ds.kind, ds.name)).encode('utf8')
+    path = os.path.join(self.cache_dir,
+                        hashlib.sha1(name).hexdigest() + '.pkl')
+    artifacts = {}
+    try:
+      with open(path, 'rb') as fh:
+        version, old_sources, old_artifacts = pickle.load(fh)
+      if version == FORMAT_VERSION and old_sources == sources:
+        artifacts = old_artifacts
+    except (IOError, OSError):
+      pass  # not cached yet
+    except Exception as e:
+      logging.warning('Ignoring bad sidecar cache %s: %s', path, e)
+    if not os.path.isdir(self.cache_dir):
+      try:
+        os.makedirs(self.cache_dir)
+      except OSError:
+        # another loader thread may have just made it
+        if not os.path.isdir(self.cache_dir):
+          raise
+    return DatasetArtifacts(self, path, sources, artifacts)
+
+  def stats(self):
+    return dict(cache_dir=self.cache_dir, hits=self.hits, misses=self.misses)
+
+
+def _config_digest(config):
+  if config is None:
+    return None
+  text = json.dumps(config, sort_keys=True, default=repr)
+  return hashlib.sha1(text.encode('utf8')).hexdigest()
+
+
+def _source_stamps(paths):
+  stamps = []
+  for path in paths:
+    if not isinstance(path, string_types):
+      continue
+    try:
+      mtime = os.path.getmtime(path)
+    except OSError:
+      return None
+    stamps.append((os.path.abspath(path), mtime))
+  return stamps
+
+
+# Singleton shared by all datasets. Disabled until cache_dir is set.
+SIDECAR = SidecarCache()
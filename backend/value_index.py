@@ -0,0 +1,69 @@
+from __future__ import absolute_import, print_function, division
+import numpy as np
+from collections import defaultdict
+
+__all__ = ['ValueIndex', 'prefix_range']
+
+NGRAM = 3
+_EMPTY = np.array([], dtype=np.int32)
+
+
+class ValueIndex(object):
+  '''Case-insensitive typeahead search over a column of distinct strings.
+
+  Values are kept sorted, so prefix matches are a binary search.
+  Substring matches use an index from each trigram to the values
+  containing it, and are listed after the prefix matches.
+  '''
+  def __init__(self, values):
+    values = np.asarray(values)
+    if values.dtype.char == 'S':
+      values = np.char.decode(values, 'utf8')
+    elif values.dtype.char != 'U':
+      values = values.astype('U')
+    lower = np.char.lower(values)
+    order = np.argsort(lower, kind='mergesort')
+    self.values = values[order]
+    self.lower = lower[order]
+    postings = defaultdict(list)
+    for i, v in enumerate(self.lower):
+      for gram in set(v[j:j+NGRAM] for j in range(len(v) - NGRAM + 1)):
+        postings[gram].append(i)
+    self.ngrams = {gram: np.array(idx, dtype=np.int32)
+                   for gram, idx in postings.items()}
+
+  def __len__(self):
+    return len(self.values)
+
+  def search(self, query, offset=0, limit=50):
+    '''Returns (matching values, whether there are more matches).'''
+    positions = self._matches(query.lower())
+    page = self.values[positions[offset:offset + limit]]
+    return page.tolist(), len(positions) > offset + limit
+
+  def _matches(self, q):
+    if not q:
+      return np.arange(len(self.values))
+    lo, hi = prefix_range(self.lower, q)
+    if len(q) >= NGRAM:
+      grams = [q[j:j+NGRAM] for j in range(len(q) - NGRAM + 1)]
+      lists = sorted((self.ngrams.get(g, _EMPTY) for g in grams), key=len)
+      candidates = lists[0]
+      for idx in lists[1:]:
+        candidates = np.intersect1d(candidates, idx, assume_unique=True)
+      if len(grams) > 1 and len(candidates):
+        # trigrams can match out of order, so check the actual substring
+        found = np.char.find(self.lower[candidates], q) >= 0
+        candidates = candidates[found]
+    else:
+      candidates, = np.nonzero(np.char.find(self.lower, q) >= 0)
+    # prefix matches come first
+    candidates = candidates[(candidates < lo) | (candidates >= hi)]
+    return np.concatenate((np.arange(lo, hi), candidates))
+
+
+def prefix_range(sorted_arr, prefix):
+  '''Returns (lo, hi) such that sorted_arr[lo:hi] starts with prefix.'''
+  lo = np.searchsorted(sorted_arr, prefix)
+  hi = np.searchsorted(sorted_arr, prefix + u'\uffff')
+  return lo, hi
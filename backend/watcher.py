@@ -0,0 +1,179 @@
+from __future__ import absolute_import, print_function, division
+import logging
+import os
+import time
+from collections import deque
+from tornado import gen
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.locks import Semaphore
+
+from .executors import run_in_pool
+from .web_datasets import DATASETS
+
+try:
+  # inotify (or the platform's equivalent) for prompt change notifications
+  from watchdog.events import FileSystemEventHandler
+  from watchdog.observers import Observer
+except ImportError:
+  FileSystemEventHandler = object
+  Observer = None
+
+__all__ = ['WATCHER', 'DatasetWatcher']
+
+
+class DatasetWatcher(object):
+  '''Refreshes datasets when their files change.
+
+  Files are polled for new mtimes every poll_interval seconds. When the
+  watchdog package is installed, filesystem events also trigger a poll,
+  so changes are noticed right away. A changed dataset is refreshed once
+  its files have stopped changing for `debounce` seconds.
+  '''
+  def __init__(self, poll_interval=10, debounce=5, max_concurrent=2,
+               max_history=50):
+    self.poll_interval = poll_interval
+    self.debounce = debounce
+    self.max_concurrent = max_concurrent
+    self.history = deque(maxlen=max_history)
+    self.mode = 'off'
+    self.io_loop = None
+    self._semaphore = None
+    self._observer = None
+    self._watched_dirs = set()
+    # (kind, name) -> (latest mtime, time it was first seen)
+    self._pending = {}
+    self._refreshing = set()
+    self._polling = False
+    self._poll_handle = None
+
+  def configure(self, poll_interval=10, debounce=5, max_concurrent=2):
+    self.poll_interval = poll_interval
+    self.debounce = debounce
+    self.max_concurrent = max_concurrent
+
+  def start(self):
+    '''Starts watching, on the current IOLoop. Does nothing if
+    poll_interval isn't positive.'''
+    if self.poll_interval <= 0:
+      return
+    self.io_loop = IOLoop.current()
+    PeriodicCallback(self.poll, self.poll_interval * 1000).start()
+    if Observer is not None:
+      self._observer = Observer()
+      self._observer.daemon = True
+      self._observer.start()
+      self.mode = 'inotify'
+    else:
+      self.mode = 'polling'
+    logging.info('Watching dataset files (%s)', self.mode)
+    self.io_loop.add_callback(self.poll)
+
+  def poll_soon(self, delay=0):
+    '''Schedules a poll, unless one is already scheduled.
+    Safe to call from any thread.'''
+    def schedule():
+      if self._poll_handle is None:
+        self._poll_handle = self.io_loop.call_later(delay, self.poll)
+    self.io_loop.add_callback(schedule)
+
+  @gen.coroutine
+  def poll(self):
+    self._poll_handle = None
+    if self._polling:
+      return
+    self._polling = True
+    try:
+      datasets = [ds for dd in DATASETS.values() for ds in dd.values()]
+      mtimes = yield run_in_pool('io', _latest_mtimes, datasets)
+      if self._observer is not None:
+        self._watch_dirs(datasets)
+    finally:
+      self._polling = False
+    now = time.time()
+    ready = []
+    for ds, mtime in zip(datasets, mtimes):
+      key = (ds.kind, ds.name)
+      # cold datasets will read their files when they're next used
+      if mtime <= ds.load_time or ds.cold or key in self._refreshing:
+        self._pending.pop(key, None)
+        continue
+      last_mtime, since = self._pending.get(key, (None, now))
+      if mtime != last_mtime:
+        # still changing, so wait for it to settle
+        self._pending[key] = (mtime, now)
+      elif now - since >= self.debounce:
+        del self._pending[key]
+        ready.append(ds)
+    if self._pending:
+      self.poll_soon(self.debounce)
+    if ready:
+      self.refresh(ready, 'watcher')
+
+  @gen.coroutine
+  def refresh(self, datasets, trigger):
+    '''Reloads datasets in parallel, at most max_concurrent at a time.'''
+    if self._semaphore is None:
+      self._semaphore = Semaphore(self.max_concurrent)
+    yield [self._refresh_one(ds, trigger) for ds in datasets]
+
+  @gen.coroutine
+  def _refresh_one(self, ds, trigger):
+    key = (ds.kind, ds.name)
+    with (yield self._semaphore.acquire()):
+      self._refreshing.add(key)
+      start = time.time()
+      old = DATASETS[ds.kind].get(ds.name)
+      try:
+        ok = yield run_in_pool('io', ds.reload)
+      except Exception:
+        logging.exception('Failed to refresh %s', ds)
+        ok = False
+      finally:
+        self._refreshing.discard(key)
+    if not ok:
+      result = 'failed'
+    elif DATASETS[ds.kind].get(ds.name) is old:
+      result = 'unchanged'
+    else:
+      result = 'reloaded'
+    self.history.appendleft(dict(
+        dataset=str(ds), trigger=trigger, start_time=start,
+        duration=time.time() - start, result=result))
+
+  def _watch_dirs(self, datasets):
+    dirs = set()
+    for ds in datasets:
+      for path in ds.source_files():
+        dirs.add(path if os.path.isdir(path) else os.path.dirname(path))
+    for d in dirs - self._watched_dirs:
+      try:
+        self._observer.schedule(_ChangeHandler(self), d or '.')
+      except OSError as e:
+        logging.warning('Unable to watch %s: %s', d, e)
+      self._watched_dirs.add(d)
+
+
+class _ChangeHandler(FileSystemEventHandler):
+  def __init__(self, watcher):
+    self.watcher = watcher
+
+  def on_any_event(self, event):
+    # runs on the observer's thread
+    self.watcher.poll_soon()
+
+
+def _latest_mtimes(datasets):
+  mtimes = []
+  for ds in datasets:
+    latest = -1
+    for path in ds.source_files():
+      try:
+        latest = max(latest, os.path.getmtime(path))
+      except OSError:
+        pass
+    mtimes.append(latest)
+  return mtimes
+
+
+# Singleton that refreshes all datasets.
+WATCHER = DatasetWatcher()
@@ -1,20 +1,31 @@
 from __future__ import absolute_import, print_function, division
+import copy
 import logging
 import numpy as np
 import os
+import struct
+import threading
 import time
-from base64 import b64encode
-from matplotlib.figure import Figure
-from matplotlib.ticker import NullLocator
-from matplotlib.backends.backend_agg import FigureCanvasAgg
-from threading import Thread
-from tornado.escape import xhtml_escape
-from six import BytesIO, string_types
+import zlib
+from concurrent import futures
+from tornado.escape import json_encode, xhtml_escape
+from six import string_types
+from six.moves.urllib.parse import urlencode
 
 from superman.dataset import (
     VectorDataset, TrajDataset, NumericMetadata, BooleanMetadata, DateMetadata,
     PrimaryKeyMetadata, LookupMetadata, CompositionMetadata, TagMetadata)
 
+from .compact_metadata import (
+    CompactLookupMetadata, PackedBooleanMetadata, compact_metadata)
+from .executors import run_in_pool
+from .loading import LOADER
+from .memory import MEMORY, nbytes
+from .packed_trajs import PackedTrajectories
+from .registry_snapshot import REGISTRY_SNAPSHOT
+from .sidecar import SIDECAR
+from .value_index import ValueIndex, prefix_range
+
 __all__ = [
     'WebTrajDataset', 'WebVectorDataset', 'WebLIBSDataset',
     'UploadedSpectrumDataset'
@@ -25,11 +36,29 @@ DATASETS = dict(
     Raman={}, LIBS={}, FTIR={}, NIR={}, XAS={}, XRD={}, Mossbauer={}, XRF={}
 )
 
+# Colors for slider histograms.
+HIST_COLOR = (31, 119, 180)
+HIST_BACKGROUND = (255, 255, 255)
+
+# Select filters with more options than this load them from the server.
+TYPEAHEAD_MIN_OPTIONS = 200
+
+# Storage types for spectra, chosen per dataset with the "dtype" option.
+SPECTRUM_DTYPES = ('float64', 'float32', 'float16')
+
+# Attributes that aren't saved by snapshot_state: they come from the config,
+# or only make sense in the running process.
+_UNSAVED_ATTRS = ('loader_fn', 'loader_args', 'loader_config', 'priority',
+                  'artifacts', '_memory_usage', '_reload_lock', 'description',
+                  'urls', 'is_public', 'user_added')
+
 # Ordering for filters of various metadata types.
 FILTER_ORDER = {
     PrimaryKeyMetadata: 0,
     LookupMetadata: 1,
+    CompactLookupMetadata: 1,
     BooleanMetadata: 2,
+    PackedBooleanMetadata: 2,
     TagMetadata: 3,
     DateMetadata: 4,
     NumericMetadata: 5,
@@ -37,31 +66,232 @@ FILTER_ORDER = {
 }
 
 
+# Pending warm_async() calls, by (kind, name).
+_WARMING = {}
+_WARMING_LOCK = threading.Lock()
+
+
+# Background _precompute jobs started by loads (see wait_for_datasets).
+_PRECOMPUTING = set()
+_PRECOMPUTING_LOCK = threading.Lock()
+
+
+def wait_for_datasets():
+  '''Blocks until all pending dataset loads have finished, along with the
+  derived data they compute in the background.'''
+  LOADER.wait()
+  with _PRECOMPUTING_LOCK:
+    pending = list(_PRECOMPUTING)
+  futures.wait(pending)
+
+
 class _ReloadableMixin(object):
-  def init_load(self, loader_fn, loader_args):
+  def init_load(self, loader_fn, loader_args, priority=0, config=None):
     # Machinery for on-demand data refresh
     self.load_time = -1
     self.loader_fn = loader_fn
     self.loader_args = loader_args
-    Thread(target=self.reload, name='%s loader thread' % self).start()
+    # the datasets.yml entry, if any (see SidecarCache.open)
+    self.loader_config = config
+    self.priority = priority
+    self.artifacts = None
+    self._memo = {}
+    self._value_indexes = {}
+    self._memory_usage = None
+    # unloaded to save memory (see unload)
+    self.cold = False
+    # shared by all snapshots of this dataset
+    self._reload_lock = threading.Lock()
+    state = REGISTRY_SNAPSHOT.take(self)
+    if state is not None:
+      self.restore(state)
+      LOADER.restored(self, priority=priority)
+    else:
+      LOADER.submit(self, priority=priority)
+
+  # Snapshots of the same dataset compare equal. Long-lived state (like
+  # FigData.filter_mask) is keyed by (kind, name) instead, so it doesn't keep
+  # an unloaded or replaced snapshot's data alive.
+  def __eq__(self, other):
+    return (isinstance(other, _ReloadableMixin) and
+            (self.kind, self.name) == (other.kind, other.name))
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __hash__(self):
+    return hash((self.kind, self.name))
 
   def reload(self):
-    if self.loader_args:
-      mtime = max(map(_try_get_mtime, self.loader_args))
+    '''Loads the data, if it changed since the last load.
+
+    After the first load, data is loaded into a new snapshot of the dataset,
+    which replaces the current one in DATASETS when it's complete.
+    Requests using the old snapshot keep working with the old data.
+    Returns False if the loader failed, in which case the old data is kept.
+    Cold datasets aren't loaded; they'll read the new data when warmed.'''
+    with self._reload_lock:
+      if self.load_time < 0:
+        ok = self._reload()
+      else:
+        # always start from the newest snapshot
+        current = DATASETS[self.kind].get(self.name, self)
+        ok = current.cold or current._reload()
+    MEMORY.enforce(_all_datasets(), keep=self)
+    return ok
+
+  def warm(self):
+    '''Returns the current snapshot of this dataset, first loading it again
+    if it was unloaded. Returns None if that load fails.'''
+    current = DATASETS[self.kind].get(self.name, self)
+    if current.cold:
+      with self._reload_lock:
+        current = DATASETS[self.kind].get(self.name, self)
+        if current.cold:
+          logging.info('Loading cold dataset %s', current)
+          current._reload()
+          current = DATASETS[self.kind].get(self.name, self)
+      MEMORY.enforce(_all_datasets(), keep=current)
+    MEMORY.touch(current)
+    return None if current.cold else current
+
+  def warm_async(self):
+    '''Calls warm() on the load pool, so request handlers don't block on it.
+    Returns a Future for its result, shared by concurrent callers.'''
+    key = (self.kind, self.name)
+    with _WARMING_LOCK:
+      future = _WARMING.get(key)
+      if future is None or future.done():
+        future = _WARMING[key] = run_in_pool('load', self.warm)
+    return future
+
+  def source_files(self):
+    '''Paths of the files this dataset's data comes from.'''
+    paths = [p for p in self.loader_args if isinstance(p, string_types)]
+    return paths + list(getattr(self.loader_fn, 'sources', ()))
+
+  def can_unload(self):
+    # uploaded datasets only live in memory
+    return bool(self.loader_args)
+
+  def unload(self):
+    '''Replaces the current snapshot with an empty "cold" one, which is
+    loaded again by warm(). Requests using the old snapshot keep its data
+    until they finish. Returns False if there was nothing to unload.'''
+    # don't wait on (or deadlock with) a load in progress
+    if not self._reload_lock.acquire(False):
+      return False
+    try:
+      current = DATASETS[self.kind].get(self.name)
+      if current is None or current.cold:
+        return False
+      cold = copy.copy(current)
+      cold.cold_shape = (current.num_spectra(), current.num_dimensions())
+      cold.cold = True
+      cold.clear_data()
+      cold.artifacts = None
+      cold._memo = {}
+      cold._value_indexes = {}
+      cold._memory_usage = None
+      cold.row_samples = None
+      DATASETS[self.kind][self.name] = cold
+    finally:
+      self._reload_lock.release()
+    logging.info('Unloaded %s to save memory', self)
+    return True
+
+  def snapshot_state(self):
+    '''This snapshot's data and derived indexes, to save in the registry
+    snapshot (see registry_snapshot.py). None if there's nothing to save.'''
+    if self.cold or self.load_time < 0 or not self.loader_args:
+      return None
+    state = dict(vars(self))
+    for attr in _UNSAVED_ATTRS:
+      state.pop(attr, None)
+    return state
+
+  def restore(self, state):
+    '''Uses state from snapshot_state, instead of loading the data.'''
+    self.__dict__.update(state)
+    self.artifacts = SIDECAR.open(self)
+    self._memory_usage = None
+    MEMORY.touch(self)
+    DATASETS[self.kind][self.name] = self
+    logging.info('Restored %s from snapshot', self)
+
+  def memory_usage(self):
+    '''Estimated bytes held by this snapshot: a dict of spectra, metadata,
+    derived (caches and indexes), and total.'''
+    if self.cold:
+      return dict(spectra=0, metadata=0, derived=0, total=0)
+    if self._memory_usage is None:
+      # the data doesn't change, so it only needs to be measured once
+      seen = set()
+      spectra = nbytes([getattr(self, attr, None)
+                        for attr in ('bands', 'intensities', 'traj')], seen)
+      metadata = nbytes([self.pkey, self.metadata], seen)
+      self._memory_usage = (spectra, metadata, seen)
+    spectra, metadata, seen = self._memory_usage
+    derived = nbytes([self._memo, self._value_indexes, self.artifacts,
+                      getattr(self, 'row_samples', None)], set(seen))
+    return dict(spectra=spectra, metadata=metadata, derived=derived,
+                total=spectra + metadata + derived)
+
+  def _reload(self):
+    # includes files the loader reads besides its arguments (spectra_file)
+    sources = self.source_files()
+    if sources:
+      mtime = max(map(_try_get_mtime, sources))
     else:
       mtime = 0
-    if mtime < self.load_time:
-      return
-    # release any existing data first
-    self.clear_data()
-    if not self.loader_fn(self, *self.loader_args):
-      # loader failed, remove ourselves from the registry
-      DATASETS[self.kind].pop(self.name, None)
-      return
-    self.load_time = mtime if mtime > 0 else time.time()
-    # register with the global dataset manager
-    DATASETS[self.kind][self.name] = self
-    logging.info('Successfully registered %s', self)
+    if self.load_time >= 0 and not self.cold and mtime <= self.load_time:
+      return True
+    # nobody can see us before the first load, so that can happen in place
+    snapshot = self if self.load_time < 0 else copy.copy(self)
+    snapshot.artifacts = SIDECAR.open(snapshot)
+    snapshot._memo = {}
+    snapshot._value_indexes = {}
+    snapshot._memory_usage = None
+    if snapshot._try_append():
+      logging.info('Appended new rows to %s', snapshot)
+    else:
+      # start from scratch (this doesn't touch the old snapshot's data)
+      snapshot.clear_data()
+      if not snapshot.loader_fn(snapshot, *snapshot.loader_args):
+        if snapshot is not self:
+          logging.warning('Failed to reload %s, keeping the old data', self)
+        return False
+    snapshot.load_time = mtime if mtime > 0 else time.time()
+    snapshot.cold = False
+    if MEMORY.last_used(snapshot) is None:
+      # until it's used, a dataset is as fresh as its first load
+      MEMORY.touch(snapshot)
+    # register with the global dataset manager, replacing any old snapshot
+    DATASETS[self.kind][self.name] = snapshot
+    logging.info('Successfully registered %s', snapshot)
+    # get derived data ready before anyone asks for it
+    future = run_in_pool('cpu', snapshot._precompute)
+    with _PRECOMPUTING_LOCK:
+      _PRECOMPUTING.add(future)
+    future.add_done_callback(_PRECOMPUTING.discard)
+    return True
+
+  def _try_append(self):
+    '''Picks up rows appended to the dataset's files, if the loader supports
+    it and the existing rows haven't changed. Returns False otherwise.'''
+    append_fn = getattr(self.loader_fn, 'append', None)
+    if append_fn is None or self.load_time < 0 or self.cold:
+      return False
+    try:
+      return append_fn(self, *self.loader_args)
+    except Exception:
+      logging.exception('Failed to append to %s, reloading instead', self)
+      return False
+
+  def _precompute(self):
+    self.cached('histograms', self._generate_histograms)
+    if self.pkey is not None:
+      self.sorted_keys()
 
   def x_axis_units(self):
     if self.kind in ('LIBS', 'NIR'):
@@ -76,15 +306,39 @@ class _ReloadableMixin(object):
       return 'Velocity (mm/s)'
     return 'Unknown units'
 
+  def cached(self, name, compute_fn):
+    '''Returns compute_fn(), saving it in the sidecar cache as `name`,
+    so it can be reused until the dataset's files change.'''
+    if self.artifacts is None:
+      # can't be persisted, so just keep it until the next reload
+      if name not in self._memo:
+        self._memo[name] = compute_fn()
+      return self._memo[name]
+    return self.artifacts.get(name, compute_fn)
+
   def filter_ui(self):
+    return self.cached('filter_ui', self._filter_ui)
+
+  def _filter_ui(self):
+    # point numeric filters at their histograms (see HistogramHandler)
+    for key, m in self._numeric_metadata():
+      m.hist_url = '/_histogram?' + urlencode([
+          ('kind', self.kind), ('name', self.name), ('key', key),
+          ('v', '%d' % self.load_time)])
     # get a unique string for this dataset
     ds_key = 'ds%d' % hash(str(self))
     # Get HTML+JS for filters
     metas = sorted(self.metadata.items(),
                    key=lambda t: (FILTER_ORDER[type(t[1])], t[0]))
-    # Add the primary key, unless it's massive.
-    if self.pkey is not None and self.pkey.size() < 10000:
+    if self.pkey is not None:
       metas.insert(0, ('pkey', self.pkey))
+    # big selects fetch their options as needed (see FilterOptionsHandler)
+    for key, m in metas:
+      options = _select_options(m)
+      if options is not None and len(options) > TYPEAHEAD_MIN_OPTIONS:
+        m.options_url = '/_filter_options?' + urlencode([
+            ('kind', self.kind), ('name', self.name), ('key', key),
+            ('v', '%d' % self.load_time)])
     # Collect all the fragments
     init_js, collect_js, filter_htmls = [], [], []
     for key, m in metas:
@@ -98,6 +352,51 @@ class _ReloadableMixin(object):
         filter_htmls.append(_get_filter_html(m, key, full_key))
     return filter_htmls, init_js, collect_js
 
+  def value_index(self, key):
+    '''ValueIndex over the options of a select filter
+    (lookup, tag, or primary key metadata). Raises KeyError if not found.'''
+    index = self._value_indexes.get(key)
+    if index is None:
+      m = self.pkey if key == 'pkey' else self.metadata[key]
+      values = _select_options(m)
+      if values is None:
+        raise KeyError(key)
+      index = self._value_indexes[key] = ValueIndex(values)
+    return index
+
+  def sorted_keys(self):
+    '''Sorted array of primary keys, for the spectrum selector.'''
+    return self.cached('sorted_pkeys', lambda: np.sort(self.pkey.keys))
+
+  def keys_with_prefix(self, prefix, offset=0, limit=50):
+    '''Returns (sorted primary keys starting with prefix, whether there are
+    more of them).'''
+    keys = self.sorted_keys()
+    lo, hi = prefix_range(keys, prefix)
+    start = lo + offset
+    return keys[start:min(hi, start + limit)].tolist(), start + limit < hi
+
+  def histogram_png(self, key):
+    '''PNG histogram of the numeric metadata named by key,
+    using "key$comp" for compositions. Raises KeyError if there isn't one.'''
+    return self.cached('histograms', self._generate_histograms)[key]
+
+  def _generate_histograms(self):
+    hists = {}
+    for key, m in self._numeric_metadata():
+      if not hasattr(m, 'hist_png'):
+        m.hist_png = _generate_histogram(m)
+      hists[key] = m.hist_png
+    return hists
+
+  def _numeric_metadata(self):
+    for key, m in self.metadata.items():
+      if isinstance(m, NumericMetadata):
+        yield key, m
+      elif isinstance(m, CompositionMetadata):
+        for k, mm in m.comps.items():
+          yield key + '$' + k, mm
+
   def metadata_names(self, allowed_baseclasses=(object,)):
     for key, m in self.metadata.items():
       if not isinstance(m, allowed_baseclasses):
@@ -112,23 +411,103 @@ class _ReloadableMixin(object):
 
 
 class WebTrajDataset(TrajDataset, _ReloadableMixin):
-  def __init__(self, name, spec_kind, loader_fn, *loader_args):
+  def __init__(self, name, spec_kind, loader_fn, *loader_args, **kwargs):
     TrajDataset.__init__(self, name, spec_kind)
     self.description = 'No description provided.'
     self.urls = []
     self.is_public = True
     self.user_added = False
-    self.init_load(loader_fn, loader_args)
+    self.init_load(loader_fn, loader_args, **kwargs)
+
+  def set_metadata(self, metadata_dict):
+    TrajDataset.set_metadata(self, compact_metadata(metadata_dict))
+
+  def set_data(self, keys, traj_map, **metadata):
+    if not isinstance(traj_map, PackedTrajectories):
+      return TrajDataset.set_data(self, keys, traj_map, **metadata)
+    # same as TrajDataset.set_data, checking all trajectories at once
+    self.pkey = PrimaryKeyMetadata(keys)
+    if not np.array_equal(self.pkey.keys, traj_map.keys_array):
+      raise ValueError('Packed trajectories of %s are not in pkey order' % self)
+    self.set_metadata(metadata)
+    self.traj = traj_map
+    backwards = traj_map.backwards()
+    assert len(backwards) == 0, 'Backwards bands in %s: %s' % (
+        self, backwards[0])
+    n = self.num_spectra()
+    for k, m in self.metadata.items():
+      if m.size() != n:
+        raise ValueError('Mismatching size for %s' % m.display_name(k))
+
+  def get_trajectories(self, keys, transformations=None):
+    if not isinstance(self.traj, PackedTrajectories):
+      return TrajDataset.get_trajectories(self, keys, transformations)
+    return self._get_packed(self.traj.positions(keys), transformations)
+
+  def get_trajectories_by_index(self, indices, transformations=None):
+    if not isinstance(self.traj, PackedTrajectories):
+      return TrajDataset.get_trajectories_by_index(self, indices,
+                                                   transformations)
+    # packed trajectories are in pkey order, so skip the key lookups
+    return self._get_packed(np.arange(self.num_spectra())[indices],
+                            transformations)
+
+  def _get_packed(self, positions, transformations):
+    # views into the packed array; _transform_traj copies before changing one
+    return [self._transform_traj(self.traj.at(i), transformations)
+            for i in positions]
+
+  def num_spectra(self):
+    if self.cold:
+      return self.cold_shape[0]
+    return TrajDataset.num_spectra(self)
+
+  def extend_data(self, traj_map, new_keys, **metadata):
+    '''Like set_data, after new_keys were added to the end of traj_map.
+    The metadata should cover all trajectories, old and new.'''
+    for key in new_keys:
+      s = traj_map[key]
+      assert s[0,0] <= s[1,0], 'Backwards bands in %s: %s' % (self, key)
+    pkey = self.cached('pkey', lambda: _extend_pkey(self.pkey, new_keys))
+    # same as TrajDataset.set_data, without re-checking the old trajectories
+    self.set_metadata(metadata)
+    self.traj = traj_map
+    self.pkey = pkey
+    n = self.num_spectra()
+    for k, m in self.metadata.items():
+      if m.size() != n:
+        raise ValueError('Mismatching size for %s' % m.display_name(k))
 
 
 class WebVectorDataset(VectorDataset, _ReloadableMixin):
-  def __init__(self, name, spec_kind, loader_fn, *loader_args):
+  def __init__(self, name, spec_kind, loader_fn, *loader_args, **kwargs):
     VectorDataset.__init__(self, name, spec_kind)
     self.description = 'No description provided.'
     self.urls = []
     self.is_public = True
     self.user_added = False
-    self.init_load(loader_fn, loader_args)
+    self.init_load(loader_fn, loader_args, **kwargs)
+
+  def set_metadata(self, metadata_dict):
+    VectorDataset.set_metadata(self, compact_metadata(metadata_dict))
+
+  def num_spectra(self):
+    if self.cold:
+      return self.cold_shape[0]
+    return VectorDataset.num_spectra(self)
+
+  def num_dimensions(self):
+    if self.cold:
+      return self.cold_shape[1]
+    return VectorDataset.num_dimensions(self)
+
+  def extend_data(self, spectra, new_keys=None, **metadata):
+    '''Like set_data, after rows were added to the end of spectra.
+    The metadata should cover all rows, old and new.'''
+    pkey = self.pkey
+    if pkey is not None:
+      pkey = self.cached('pkey', lambda: _extend_pkey(self.pkey, new_keys))
+    self.set_data(self.bands, spectra, pkey=pkey, **metadata)
 
 
 class WebLIBSDataset(WebVectorDataset):
@@ -137,17 +516,21 @@ class WebLIBSDataset(WebVectorDataset):
 
   def set_data(self, bands, spectra, pkey=None, **metadata):
     if 'si' not in metadata:
-      # Compute the Si ratio as a proxy for temperature
-      chan_ranges = (288., 288.5, 633., 635.5)
-      den_lo, den_hi, num_lo, num_hi = np.searchsorted(bands, chan_ranges)
-      si_ratio = np.asarray(spectra[:,num_lo:num_hi].max(axis=1) /
-                            spectra[:,den_lo:den_hi].max(axis=1))
-      np.maximum(si_ratio, 0, out=si_ratio)
+      si_ratio = self.cached('si_ratio', lambda: _si_ratio(bands, spectra))
       metadata['si'] = NumericMetadata(si_ratio, display_name='Si Ratio')
 
     # Set data as usual, with the Si ratio added
     VectorDataset.set_data(self, bands, spectra, pkey=pkey, **metadata)
 
+  def extend_data(self, spectra, new_keys=None, **metadata):
+    if 'si' not in metadata and 'si' in self.metadata:
+      # only compute the Si ratio for the new rows
+      old_si = self.metadata['si'].arr
+      si_ratio = self.cached('si_ratio', lambda: np.concatenate((
+          old_si, _si_ratio(self.bands, spectra[len(old_si):]))))
+      metadata['si'] = NumericMetadata(si_ratio, display_name='Si Ratio')
+    WebVectorDataset.extend_data(self, spectra, new_keys=new_keys, **metadata)
+
   def view(self, **kwargs):
     if 'nan_gap' not in kwargs:
       # default to inserting NaNs for LIBS data
@@ -165,6 +548,22 @@ class UploadedSpectrumDataset(TrajDataset):
     self.set_data([name], data)
 
 
+def _all_datasets():
+  return [ds for dd in DATASETS.values() for ds in dd.values()]
+
+
+def storage_dtypes(dtype):
+  '''Returns the dtypes for (intensities, wavelengths) of spectra stored
+  as dtype, or (None, None) to keep the source dtypes. Wavelengths (and so
+  trajectories) are kept at least float32, as float16 can't resolve them.'''
+  if dtype is None:
+    return None, None
+  if dtype not in SPECTRUM_DTYPES:
+    raise ValueError('Invalid spectrum dtype %r, expected one of %s' % (
+        dtype, ', '.join(SPECTRUM_DTYPES)))
+  return np.dtype(dtype), np.promote_types(dtype, np.float32)
+
+
 def _try_get_mtime(filepath):
   if not isinstance(filepath, string_types):
     return -1
@@ -174,29 +573,72 @@ def _try_get_mtime(filepath):
     return -1
 
 
-def _generate_histogram(m):
+def _extend_pkey(pkey, new_keys):
+  '''Returns a copy of pkey with new_keys appended, reusing its index.'''
+  if len(new_keys) == 0:
+    return pkey
+  new_pkey = PrimaryKeyMetadata(new_keys)
+  n = len(pkey.keys)
+  ext = copy.copy(pkey)
+  ext.keys = np.concatenate((pkey.keys, new_pkey.keys))
+  ext.index = dict(pkey.index)
+  ext.index.update((key, idx + n) for key, idx in new_pkey.index.items())
+  assert len(ext.index) == len(ext.keys), 'Primary key array not unique'
+  return ext
+
+
+def _si_ratio(bands, spectra):
+  # Compute the Si ratio as a proxy for temperature
+  chan_ranges = (288., 288.5, 633., 635.5)
+  den_lo, den_hi, num_lo, num_hi = np.searchsorted(bands, chan_ranges)
+  si_ratio = np.asarray(spectra[:,num_lo:num_hi].max(axis=1) /
+                        spectra[:,den_lo:den_hi].max(axis=1))
+  np.maximum(si_ratio, 0, out=si_ratio)
+  return si_ratio
+
+
+def _generate_histogram(m, width=350, height=32):
   # Make a 350px by 32px image for a slider background
-  fig = Figure(figsize=(3.5,0.32), dpi=100, tight_layout=False)
-  # This is required, even though we don't explicitly use the canvas.
-  canvas = FigureCanvasAgg(fig)
-  ax = fig.add_subplot(1,1,1)
+  arr = m.arr[np.isfinite(m.arr)]
   vrange = float(m.bounds[1] - m.bounds[0])
   num_bins = np.ceil(vrange / m.step) + 1
-  if np.isnan(num_bins):
-    ax.hist(m.arr)
-  elif num_bins > 300:
-    ax.hist(m.arr, 300, range=m.bounds)
+  if not np.isfinite(num_bins):
+    counts, _ = np.histogram(arr)
   else:
-    ax.hist(m.arr, int(num_bins), range=m.bounds)
-  ax.axis('off')
-  fig.subplots_adjust(top=1,bottom=0,right=1,left=0,hspace=0,wspace=0)
-  ax.margins(0, 0)
-  ax.xaxis.set_major_locator(NullLocator())
-  ax.yaxis.set_major_locator(NullLocator())
-  # save it as a base64 encoded string
-  img_data = BytesIO()
-  fig.savefig(img_data, format='png', bbox_inches='tight', pad_inches=0)
-  return b64encode(img_data.getvalue())
+    counts, _ = np.histogram(arr, int(min(num_bins, 300)), range=m.bounds)
+  # each pixel column shows the bin underneath it
+  cols = counts[np.arange(width) * len(counts) // width]
+  heights = np.ceil(cols * height / max(1., cols.max()))
+  filled = np.arange(height, 0, -1)[:,None] <= heights
+  img = np.where(filled[:,:,None], HIST_COLOR, HIST_BACKGROUND)
+  return _encode_png(img.astype(np.uint8))
+
+
+def _encode_png(img):
+  '''Encodes an (h,w,3) uint8 RGB array as a PNG.'''
+  h, w, _ = img.shape
+  # each scanline starts with a filter type byte (0 = none)
+  raw = np.zeros((h, 1 + w * 3), dtype=np.uint8)
+  raw[:,1:] = img.reshape((h, -1))
+
+  def chunk(tag, data):
+    crc = zlib.crc32(tag + data) & 0xffffffff
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', crc)
+
+  header = struct.pack('>IIBBBBB', w, h, 8, 2, 0, 0, 0)
+  return b''.join([b'\x89PNG\r\n\x1a\n', chunk(b'IHDR', header),
+                   chunk(b'IDAT', zlib.compress(raw.tobytes(), 9)),
+                   chunk(b'IEND', b'')])
+
+
+def _select_options(m):
+  if isinstance(m, PrimaryKeyMetadata):
+    return m.keys
+  if isinstance(m, TagMetadata):
+    return sorted(m.tags)
+  if isinstance(m, LookupMetadata):
+    return m.uniques
+  return None
 
 
 def _get_filter_js(m, full_key):
@@ -223,7 +665,14 @@ def _get_filter_js(m, full_key):
     return '\n'.join(init_parts), collect_js
   # only fancy selects remain (Lookup/PrimaryKey/Tag)
   # initialize the dropdown, adding some width for the scrollbar
-  init_js = '$("#%s_chooser").css("width", "+=20").select2();' % full_key
+  options_url = getattr(m, 'options_url', None)
+  if options_url is None:
+    init_js = '$("#%s_chooser").css("width", "+=20").select2();' % full_key
+  else:
+    init_js = ('$("#%s_chooser").css("width", "+=20").select2({ajax: {'
+               'url: %s, dataType: "json", delay: 250, cache: true, '
+               'data: function(p){return {q: p.term || "", page: p.page || 1};}'
+               '}});') % (full_key, json_encode(options_url))
   collect_js = 'multi_val($("#%s_chooser option:selected"))' % full_key
   if isinstance(m, (LookupMetadata, PrimaryKeyMetadata)):
     search_js = '$("#%s_search").val()' % full_key
@@ -239,27 +688,27 @@ def _get_filter_html(m, key, full_key):
             '</select>') % (disp, full_key)
   if isinstance(m, NumericMetadata):
     lb, ub = m.bounds
-    # lazy load histogram
-    if not hasattr(m, 'hist_image'):
-      m.hist_image = _generate_histogram(m)
     return ('<div>%s: <span id="%s_label">%s to %s</span></div>'
             '<div class="slider" id="%s" style="background-image: '
-            'url(data:img/png;base64,%s);"></div>') % (
-                disp, full_key, lb, ub, full_key, m.hist_image)
+            'url(\'%s\');"></div>') % (
+                disp, full_key, lb, ub, full_key, xhtml_escape(m.hist_url))
   if isinstance(m, DateMetadata):
     lb, ub = map(str, np.array(m.bounds, dtype='datetime64[D]'))
     lb_input = '<input type="date" id="%s_lb" value="%s">' % (full_key, lb)
     ub_input = '<input type="date" id="%s_ub" value="%s">' % (full_key, ub)
     return '%s:<div>%s to %s</div>' % (disp, lb_input, ub_input)
   # only fancy selects remain (Lookup/PrimaryKey/Tag)
-  html = u'%s:<select id="%s_chooser" data-placeholder="All" multiple>' % (
-      disp, full_key)
-  if isinstance(m, PrimaryKeyMetadata):
+  style = ''
+  if getattr(m, 'options_url', None) is not None:
+    # options are loaded by select2, as the user types
+    uniques = ()
+    style = ' style="width: 12em"'
+  elif isinstance(m, PrimaryKeyMetadata):
     uniques = sorted(m.keys)
-  elif isinstance(m, TagMetadata):
-    uniques = sorted(m.tags)
   else:
-    uniques = m.uniques
+    uniques = _select_options(m)
+  html = u'%s:<select id="%s_chooser" data-placeholder="All" multiple%s>' % (
+      disp, full_key, style)
   lines = (u'\n<option value="%s">%s</option>' % (x, xhtml_escape(x))
            for x in uniques)
   html += u''.join(lines) + u'\n</select>'
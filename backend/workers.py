@@ -0,0 +1,179 @@
+from __future__ import absolute_import, print_function, division
+import gc
+import itertools
+import logging
+import re
+import socket
+import tornado.gen
+import tornado.httpclient
+import tornado.ioloop
+import tornado.process
+import tornado.web
+import tornado.websocket
+
+__all__ = ['run_workers', 'worker_for_fignum']
+
+# Every per-figure route has the figure number as its first path component.
+_FIGNUM_PATH = re.compile(r'^/([0-9]+)/')
+
+# Hop-by-hop headers, which shouldn't be copied through the router.
+_SKIP_HEADERS = frozenset(('Connection', 'Content-Length', 'Keep-Alive',
+                           'Transfer-Encoding', 'Upgrade'))
+
+
+def worker_for_fignum(fignum, num_workers):
+  '''Figure numbers encode the index of the worker that owns them.
+  See MatplotlibServer.register_new_figure.'''
+  return int(fignum) % num_workers
+
+
+def run_workers(make_server, port, num_workers):
+  '''Serves on `port` with `num_workers` forked server processes.
+
+  make_server(worker_index) should return a MatplotlibServer.
+  Datasets must be fully loaded before calling this, so that their arrays are
+  shared (copy-on-write) between workers instead of being loaded N times.
+  Thread pools used while loading start over in each worker (see
+  executors.py).
+
+  An extra router process listens on `port` and forwards each request to the
+  worker that owns its figure, or to the next worker in turn for requests
+  that aren't tied to a figure. Workers listen on localhost, on the
+  `num_workers` ports after `port`.
+  '''
+  if hasattr(gc, 'freeze'):
+    # Keep the garbage collector from touching (and thus un-sharing)
+    # everything that was allocated before the fork.
+    gc.freeze()
+  # This doesn't return in the parent process, which just restarts any
+  # children that die unexpectedly.
+  task_id = tornado.process.fork_processes(num_workers + 1)
+  if task_id == num_workers:
+    router = WorkerRouter(port + 1, num_workers)
+    router.listen(port)
+    print('Running at http://%s:%d/ with %d workers' % (
+        socket.gethostname(), port, num_workers))
+    print('Press Ctrl+C to quit')
+    tornado.ioloop.IOLoop.current().start()
+  else:
+    logging.info('Starting worker %d on port %d', task_id, port + 1 + task_id)
+    server = make_server(task_id)
+    server.run_forever(port + 1 + task_id, address='127.0.0.1')
+
+
+class WorkerRouter(tornado.web.Application):
+  def __init__(self, base_port, num_workers):
+    super(WorkerRouter, self).__init__([
+        (r'/([0-9]+)/ws', _ProxyWebSocket),
+        (r'.*', _ProxyHandler),
+    ])
+    self.base_port = base_port
+    self.num_workers = num_workers
+    self._next_worker = itertools.cycle(range(num_workers))
+
+  def worker_url(self, handler, scheme='http'):
+    m = _FIGNUM_PATH.match(handler.request.path)
+    if m is not None:
+      fignum = m.group(1)
+    else:
+      fignum = handler.get_argument('fignum', None)
+    if fignum is not None and fignum.isdigit():
+      idx = worker_for_fignum(fignum, self.num_workers)
+    else:
+      idx = next(self._next_worker)
+    return '%s://127.0.0.1:%d%s' % (scheme, self.base_port + idx,
+                                   handler.request.uri)
+
+
+class _ProxyHandler(tornado.web.RequestHandler):
+  SUPPORTED_METHODS = ('GET', 'HEAD', 'POST', 'DELETE', 'PATCH', 'PUT')
+
+  @tornado.gen.coroutine
+  def _proxy(self, *args):
+    req = self.request
+    headers = req.headers.copy()
+    headers['X-Forwarded-For'] = req.remote_ip
+    body = req.body if req.method in ('POST', 'PATCH', 'PUT') else None
+    worker_req = tornado.httpclient.HTTPRequest(
+        self.application.worker_url(self), method=req.method,
+        headers=headers, body=body, follow_redirects=False,
+        decompress_response=False, request_timeout=600)
+    client = tornado.httpclient.AsyncHTTPClient()
+    resp = yield client.fetch(worker_req, raise_error=False)
+    if resp.code == 599:
+      # the worker is down (or restarting)
+      logging.error('Router failed to reach %s: %s', worker_req.url,
+                    resp.error)
+      raise tornado.web.HTTPError(502)
+    self.clear()
+    self.set_status(resp.code, resp.reason)
+    seen = set()
+    for name, value in resp.headers.get_all():
+      if name in _SKIP_HEADERS:
+        continue
+      if name in seen:
+        # repeated headers, like Set-Cookie
+        self.add_header(name, value)
+      else:
+        self.set_header(name, value)
+        seen.add(name)
+    if resp.body:
+      self.write(resp.body)
+
+  get = head = post = delete = patch = put = _proxy
+
+  def compute_etag(self):
+    # pass through the worker's ETag, if any
+    return None
+
+
+class _ProxyWebSocket(tornado.websocket.WebSocketHandler):
+  '''Relays a figure's websocket to the worker that owns the figure.'''
+  def open(self, fignum):
+    self.upstream = None
+    self.pending = []
+    tornado.ioloop.IOLoop.current().spawn_callback(self._relay)
+
+  @tornado.gen.coroutine
+  def _relay(self):
+    url = self.application.worker_url(self, scheme='ws')
+    headers = {}
+    if 'Cookie' in self.request.headers:
+      headers['Cookie'] = self.request.headers['Cookie']
+    try:
+      self.upstream = yield tornado.websocket.websocket_connect(
+          tornado.httpclient.HTTPRequest(url, headers=headers))
+    except Exception as e:
+      logging.error('Router failed to reach %s: %s', url, e)
+      self.close()
+      return
+    if self.ws_connection is None:
+      # the browser went away while we were connecting
+      self.upstream.close()
+      return
+    for message in self.pending:
+      self._send_upstream(message)
+    self.pending = None
+    while True:
+      message = yield self.upstream.read_message()
+      if message is None:
+        break
+      if self.ws_connection is None:
+        # the browser has gone away
+        self.upstream.close()
+        return
+      self.write_message(message, binary=isinstance(message, bytes))
+    self.close()
+
+  def on_message(self, message):
+    if self.upstream is None:
+      self.pending.append(message)
+    else:
+      self._send_upstream(message)
+
+  def _send_upstream(self, message):
+    self.upstream.write_message(message, binary=isinstance(message, bytes))
+
+  def on_close(self):
+    if self.upstream is not None:
+      self.upstream.close()
@@ -131,8 +131,20 @@ var SingleSpectrum = (function () {
                 $('input', selector).change(function (evt) {
                     do_select(undefined, evt.target.value)
                 });
-                // If we have a fancy <select> dropdown
-                $('select', selector).select2().change(function (evt) {
+                // If we have a fancy <select> dropdown, which loads keys
+                // matching what the user types
+                $('select', selector).select2({
+                    ajax: {
+                        url: '/_spectrum_keys', dataType: 'json', delay: 250,
+                        cache: true,
+                        data: function (params) {
+                            return {
+                                name: parts[0], kind: parts[1],
+                                q: params.term || '', page: params.page || 1
+                            };
+                        }
+                    }
+                }).change(function (evt) {
                     if (evt.target.value.length > 0) {
                         do_select(evt.target.value, undefined);
                     }
@@ -7,32 +7,37 @@ var Plot = (function() {
     }).toArray() + "]";
   }
 
+  function plot_args() {
+    var ds_info = collect_ds_info();
+    var post_data = {
+      xaxis: $("#xaxis").val(),
+      yaxis: $("#yaxis").val(),
+      color: $("#color").val(),
+      x_metadata: $("td.x.metadata").children().val(),
+      x_line_ratio: child_vals("td.x.line_ratio"),
+      x_computed: $("td.x.computed").children().val(),
+      y_metadata: $("td.y.metadata").children().val(),
+      y_line_ratio: child_vals("td.y.line_ratio"),
+      y_computed: $("td.y.computed").children().val(),
+      fixed_color: $("td.color.default").children().val(),
+      color_by: $("td.color.metadata").children().val(),
+      color_line_ratio: child_vals("td.color.line_ratio"),
+      color_computed: $("td.color.computed").children().val(),
+      chan_mask: +$("#chan_mask").is(":checked"),
+      pp: GetArgs.pp($('#pp_options')),
+      ds_kind: ds_info.kind,
+      ds_name: ds_info.name,
+      fignum: fig.id,
+    };
+    GetArgs.plot(post_data);
+    GetArgs.resample($('#resample_options'), post_data);
+    GetArgs.baseline($('#blr_options'), post_data);
+    return post_data;
+  }
+
   return {
     plot: function(btn) {
-      var ds_info = collect_ds_info();
-      var post_data = {
-        xaxis: $("#xaxis").val(),
-        yaxis: $("#yaxis").val(),
-        color: $("#color").val(),
-        x_metadata: $("td.x.metadata").children().val(),
-        x_line_ratio: child_vals("td.x.line_ratio"),
-        x_computed: $("td.x.computed").children().val(),
-        y_metadata: $("td.y.metadata").children().val(),
-        y_line_ratio: child_vals("td.y.line_ratio"),
-        y_computed: $("td.y.computed").children().val(),
-        fixed_color: $("td.color.default").children().val(),
-        color_by: $("td.color.metadata").children().val(),
-        color_line_ratio: child_vals("td.color.line_ratio"),
-        color_computed: $("td.color.computed").children().val(),
-        chan_mask: +$("#chan_mask").is(":checked"),
-        pp: GetArgs.pp($('#pp_options')),
-        ds_kind: ds_info.kind,
-        ds_name: ds_info.name,
-        fignum: fig.id,
-      };
-      GetArgs.plot(post_data);
-      GetArgs.resample($('#resample_options'), post_data);
-      GetArgs.baseline($('#blr_options'), post_data);
+      var post_data = plot_args();
 
       var err_span = $(btn).next('.err_msg');
       var wait = $('.wait', btn).show();
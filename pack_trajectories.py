@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+from __future__ import print_function
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+from backend.packed_trajs import pack_file
+from backend.web_datasets import SPECTRUM_DTYPES, storage_dtypes
+
+
+def main():
+  ap = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter,
+                      description=('Converts a trajectory dataset HDF5 file '
+                                   'to the packed layout, which loads faster.'))
+  ap.add_argument('infile', help='HDF5 file with /spectra/<pkey> datasets.')
+  ap.add_argument('outfile', help='Where to write the packed HDF5 file.')
+  ap.add_argument('--dtype', choices=SPECTRUM_DTYPES,
+                  help=('Store trajectories as this type, or float32 for '
+                        'float16 (default: unchanged).'))
+  args = ap.parse_args()
+  # trajectories hold wavelengths too, so they're never stored as float16
+  _, traj_dtype = storage_dtypes(args.dtype)
+  n = pack_file(args.infile, args.outfile, dtype=traj_dtype)
+  print('Packed %d trajectories into %s' % (n, args.outfile))
+
+
+if __name__ == '__main__':
+  main()
@@ -14,7 +14,8 @@ function find_server_pid() {
 
 function start_server() {
   echo "Starting new server..."
-  nohup python3 superman_server.py &>logs/errors.out &
+  # start from the dataset snapshot, instead of loading every dataset
+  nohup python3 superman_server.py --snapshot &>logs/errors.out &
   $follow_log || echo "Use 'tail -f logs/server.log' to check on it"
   sleep 1
   if [[ -z "$(find_server_pid)" ]]; then
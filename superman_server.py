@@ -3,7 +3,9 @@ import base64
 import logging
 import os.path
 import shutil
+import threading
 import time
+import tornado.ioloop
 import tornado.web
 import uuid
 import yaml
@@ -11,7 +13,15 @@ from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 
 from backend import MatplotlibServer, all_routes
 from backend.handlers.common import BaseHandler
-from backend.web_datasets import DATASETS
+from backend.executors import configure_pools
+from backend.lazy_arrays import BLOCK_CACHE
+from backend.memory import MEMORY
+from backend.profiling import PROFILER
+from backend.registry_snapshot import REGISTRY_SNAPSHOT
+from backend.sidecar import SIDECAR
+from backend.watcher import WATCHER
+from backend.web_datasets import DATASETS, wait_for_datasets
+from backend.workers import run_workers
 from backend.dataset_loaders import load_datasets
 
 # User-supplied dataset loader functions
@@ -26,25 +36,53 @@ def main():
                   help='YAML file with configuration options.')
   ap.add_argument('--debug', action='store_true',
                   help='Start an IPython shell instead of starting the server.')
+  ap.add_argument('--workers', type=int, default=1,
+                  help=('Number of server processes. With more than one, '
+                        'requests are routed to workers by figure number.'))
+  ap.add_argument('--snapshot', action='store_true',
+                  help=('Restore datasets from the snapshot file (see '
+                        'snapshot_file in config.yml) where they are still '
+                        'current, and update it once all datasets load.'))
   args = ap.parse_args()
   config = yaml.safe_load(args.config)
 
+  logfile = os.path.join(webserver_dir,
+                         config.get('logfile', 'logs/server.log'))
+  PROFILER.outdir = os.path.join(os.path.dirname(logfile), 'profiles')
   if not args.debug:
-    logfile = os.path.join(webserver_dir,
-                           config.get('logfile', 'logs/server.log'))
     if os.path.isfile(logfile):
       shutil.move(logfile, '%s.%d' % (logfile, time.time()))
-    logging.basicConfig(filename=logfile,
-                        format='[%(asctime)s] %(levelname)s: %(message)s',
+    log_format = '[%(asctime)s] %(levelname)s: %(message)s'
+    if args.workers > 1:
+      log_format = '[%(asctime)s] %(process)d %(levelname)s: %(message)s'
+    logging.basicConfig(filename=logfile, format=log_format,
                         filemode='w',
                         level=logging.INFO)
 
-  ds_config = config.get('datasets', 'datasets.yml')
+  # Pool sizes must be set before datasets start loading.
+  configure_pools(config.get('thread_pools', {}))
+  BLOCK_CACHE.max_bytes = int(config.get('lazy_cache_mb', 256)) * 2**20
+  MEMORY.max_bytes = int(config.get('memory_budget_mb', 0)) * 2**20
+  sidecar_dir = config.get('sidecar_cache_dir', 'cache')
+  if sidecar_dir:
+    SIDECAR.cache_dir = os.path.join(webserver_dir, sidecar_dir)
+  ds_config = os.path.join(webserver_dir,
+                           config.get('datasets', 'datasets.yml'))
+  user_datasets = os.path.join(webserver_dir, 'uploads/user_data.yml')
+  if args.snapshot:
+    REGISTRY_SNAPSHOT.path = os.path.join(
+        webserver_dir, config.get('snapshot_file', 'cache/datasets.snapshot'))
+    # changes to any of these invalidate the whole snapshot
+    REGISTRY_SNAPSHOT.config_files = [
+        p for p in (ds_config, user_datasets,
+                    os.path.join(webserver_dir, 'custom_datasets.py'))
+        if os.path.exists(p)]
+    REGISTRY_SNAPSHOT.read()
+
   password = config.get('password', None)
-  with open(os.path.join(webserver_dir, ds_config)) as datasets_fh:
+  with open(ds_config) as datasets_fh:
     load_datasets(datasets_fh, custom_datasets, public_only=(password is None))
 
-  user_datasets = os.path.join(webserver_dir, 'uploads/user_data.yml')
   if password is not None and os.path.exists(user_datasets):
     with open(user_datasets) as datasets_fh:
       load_datasets(datasets_fh, None, user_added=True)
@@ -60,13 +98,54 @@ def main():
     cookie_secret = base64.b64encode(uuid.uuid4().bytes + uuid.uuid4().bytes)
     logging.info('Using fresh cookie_secret: %s', cookie_secret)
 
-  logging.info('Starting server...')
-  server = MatplotlibServer(
-      all_routes, password=password, login_url=r'/login',
+  server_kwargs = dict(
+      password=password, login_url=r'/login',
       template_path=os.path.join(webserver_dir, 'frontend', 'templates'),
       static_path=os.path.join(webserver_dir, 'frontend', 'static'),
-      cookie_secret=cookie_secret)
-  server.run_forever(int(config.get('port', 54321)))
+      cookie_secret=cookie_secret,
+      max_figures=int(config.get('max_figures', 500)),
+      max_figure_bytes=int(config.get('max_figure_memory_mb', 1024)) * 2**20,
+      figure_ttl=float(config.get('figure_ttl', 3600)),
+      ws_max_fps=float(config.get('max_fps', 30)),
+      ws_event_interval=float(config.get('event_interval', 0.03)),
+      download_cache_bytes=int(config.get('download_cache_mb', 64)) * 2**20,
+      slow_request_seconds=float(config.get('slow_request_seconds', 2)),
+      ready_min_priority=float(config.get('ready_min_priority', 0)),
+      ws_compression=({} if config.get('websocket_compression', False)
+                      else None))
+  port = int(config.get('port', 54321))
+
+  WATCHER.configure(poll_interval=float(config.get('watch_interval', 10)),
+                    debounce=float(config.get('watch_debounce', 5)),
+                    max_concurrent=int(config.get('refresh_concurrency', 2)))
+
+  if args.workers > 1:
+    # Load everything up front, so the forked workers share the dataset memory.
+    logging.info('Waiting for datasets to load...')
+    wait_for_datasets()
+    if args.snapshot:
+      write_snapshot()
+    logging.info('Starting %d server workers...', args.workers)
+
+    def make_server(worker_index):
+      # each worker has its own copy of the datasets to keep fresh
+      tornado.ioloop.IOLoop.current().add_callback(WATCHER.start)
+      return MatplotlibServer(all_routes, worker_index=worker_index,
+                              num_workers=args.workers, **server_kwargs)
+    run_workers(make_server, port, args.workers)
+  else:
+    logging.info('Starting server...')
+    if args.snapshot:
+      threading.Thread(target=write_snapshot, name='snapshot').start()
+    server = MatplotlibServer(all_routes, **server_kwargs)
+    tornado.ioloop.IOLoop.current().add_callback(WATCHER.start)
+    server.run_forever(port)
+
+
+def write_snapshot():
+  wait_for_datasets()
+  REGISTRY_SNAPSHOT.write(
+      [ds for dd in DATASETS.values() for ds in dd.values()])
 
 
 def debug():
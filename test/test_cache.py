@@ -0,0 +1,35 @@
+import unittest
+
+from backend.cache import ByteLRUCache
+
+
+class TestByteLRUCache(unittest.TestCase):
+  def test_lru(self):
+    cache = ByteLRUCache(10)
+    cache.put('a', b'1234')
+    cache.put('b', b'1234')
+    self.assertEqual(cache.get('a'), b'1234')  # b becomes the LRU entry
+    cache.put('c', b'1234')
+    self.assertNotIn('b', cache)
+    self.assertIn('a', cache)
+    self.assertEqual(cache.num_bytes, 8)
+    self.assertEqual(cache.evictions, 1)
+
+  def test_oversized(self):
+    cache = ByteLRUCache(10)
+    cache.put('a', b'x' * 11)
+    self.assertEqual(len(cache), 0)
+    self.assertIsNone(cache.get('a'))
+    self.assertEqual(cache.misses, 1)
+
+  def test_replace(self):
+    cache = ByteLRUCache(10)
+    cache.put('a', b'1234')
+    cache.put('a', b'12')
+    self.assertEqual(cache.num_bytes, 2)
+    cache.discard('a')
+    self.assertEqual(cache.num_bytes, 0)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,43 @@
+import numpy as np
+import unittest
+from numpy.testing import assert_array_equal
+
+from superman.dataset import BooleanMetadata, LookupMetadata
+
+from backend.compact_metadata import (
+    CompactLookupMetadata, PackedBooleanMetadata, compact_metadata)
+
+
+class TestCompactMetadata(unittest.TestCase):
+  def setUp(self):
+    self.values = ['b', 'a', 'c', 'a', 'b', 'b', 'c', 'a', 'c']
+    self.bools = [True, False, False, True, True, False, True, True, False]
+    self.meta = compact_metadata(dict(
+        lookup=LookupMetadata(self.values, display_name='Lookup'),
+        flag=BooleanMetadata(self.bools)))
+
+  def test_lookup(self):
+    m = self.meta['lookup']
+    self.assertIsInstance(m, CompactLookupMetadata)
+    self.assertEqual(m.labels.dtype, np.uint8)
+    self.assertEqual(m.display_name('lookup'), 'Lookup')
+    assert_array_equal(m.get_array(), self.values)
+    self.assertEqual(m.get_index(2), 'c')
+    assert_array_equal(m.filter(dict(select=[b'a', b'c'], search='')),
+                       [v != 'b' for v in self.values])
+    self.assertIs(m.filter(dict(select=[], search='')), True)
+    labels, uniques = m.codes(np.array([1, 2]))
+    assert_array_equal(uniques[labels], ['a', 'c'])
+
+  def test_boolean(self):
+    m = self.meta['flag']
+    self.assertIsInstance(m, PackedBooleanMetadata)
+    self.assertEqual(m.bits.nbytes, 2)
+    self.assertEqual(m.size(), len(self.bools))
+    assert_array_equal(m.get_array(), self.bools)
+    assert_array_equal(m.filter('no'), np.logical_not(self.bools))
+    self.assertEqual([m.get_index(i) for i in range(9)], self.bools)
+
+
+if __name__ == '__main__':
+  unittest.main()
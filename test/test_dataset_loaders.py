@@ -0,0 +1,295 @@
+import gc
+import h5py
+import numpy as np
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import weakref
+from mock import patch
+from numpy.testing import assert_array_equal
+
+from backend.dataset_loaders import (
+    _generic_traj_loader, _generic_vector_loader)
+from backend.mpl_server import FigData
+from backend.packed_trajs import PackedTrajectories, pack, write_packed
+from backend.web_datasets import (
+    DATASETS, WebTrajDataset, WebVectorDataset, NumericMetadata,
+    PrimaryKeyMetadata, wait_for_datasets)
+
+
+class TestAppendReload(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmpdir, 'data.hdf5')
+    with h5py.File(self.path, 'w') as fh:
+      fh.create_dataset('/meta/waves', data=np.arange(4.))
+      fh.create_dataset('/meta/pkey', data=[b'a', b'b', b'c'],
+                        maxshape=(None,))
+      fh.create_dataset('/meta/x', data=[1., 2., 3.], maxshape=(None,))
+      fh.create_dataset('/spectra', data=np.ones((3, 4)), maxshape=(None, 4))
+    loader = _generic_vector_loader([('pkey', PrimaryKeyMetadata, None),
+                                     ('x', NumericMetadata, 'X')],
+                                    append_only=True)
+    self.ds = WebVectorDataset('Append Test', 'NIR', loader, self.path)
+    wait_for_datasets()
+    self.ds.clear_data = self.fail  # full reloads would call this
+
+  def tearDown(self):
+    DATASETS['NIR'].pop('Append Test', None)
+    shutil.rmtree(self.tmpdir)
+
+  def _modify(self):
+    # HDF5 won't open a file for writing while we have it open for reading
+    self.ds.intensities.file.close()
+    return h5py.File(self.path, 'a')
+
+  def _touch(self):
+    mtime = os.path.getmtime(self.path) + 10
+    os.utime(self.path, (mtime, mtime))
+
+  def test_append(self):
+    old_pkey = self.ds.pkey
+    with self._modify() as fh:
+      for name, val in [('/meta/pkey', b'd'), ('/meta/x', 4.),
+                        ('/spectra', 2.)]:
+        fh[name].resize(4, axis=0)
+        fh[name][3] = val
+    self._touch()
+    self.assertTrue(self.ds.reload())
+    # the new data is in a new snapshot, and the old one is untouched
+    new_ds = DATASETS['NIR']['Append Test']
+    self.assertIsNot(new_ds, self.ds)
+    self.assertEqual(new_ds, self.ds)
+    self.assertEqual(self.ds.metadata['x'].size(), 3)
+    self.assertIs(self.ds.pkey, old_pkey)
+    self.assertEqual(old_pkey.size(), 3)
+    self.assertEqual(new_ds.num_spectra(), 4)
+    self.assertEqual(new_ds.pkey.key2index(u'd'), 3)
+    assert_array_equal(new_ds.metadata['x'].arr, [1, 2, 3, 4])
+    assert_array_equal(new_ds.intensities[3], [2, 2, 2, 2])
+
+  def test_dtype(self):
+    loader = _generic_vector_loader([('x', NumericMetadata, 'X')],
+                                    dtype='float16')
+    ds = WebVectorDataset('Float16 Test', 'NIR', loader, self.path)
+    wait_for_datasets()
+    try:
+      self.assertEqual(ds.intensities.dtype, np.float16)
+      self.assertEqual(ds.bands.dtype, np.float32)
+      assert_array_equal(ds.intensities, np.ones((3, 4)))
+    finally:
+      DATASETS['NIR'].pop('Float16 Test', None)
+
+  def test_append_dtype(self):
+    path = os.path.join(self.tmpdir, 'float32.hdf5')
+    with h5py.File(path, 'w') as fh:
+      fh['/meta/waves'] = np.arange(4.)
+      fh.create_dataset('/spectra', data=np.ones((20, 4)), maxshape=(None, 4))
+    loader = _generic_vector_loader([], dtype='float32', append_only=True)
+    ds = WebVectorDataset('Append Float32', 'NIR', loader, path)
+    wait_for_datasets()
+    try:
+      with h5py.File(path, 'a') as fh:
+        # row 1 isn't checked, and old rows aren't read again
+        fh['/spectra'][1] = 5.
+        fh['/spectra'].resize(21, axis=0)
+        fh['/spectra'][20] = 2.
+      mtime = os.path.getmtime(path) + 10
+      os.utime(path, (mtime, mtime))
+      self.assertTrue(ds.reload())
+      new_ds = DATASETS['NIR']['Append Float32']
+      self.assertEqual(new_ds.intensities.dtype, np.float32)
+      assert_array_equal(new_ds.intensities[1], [1, 1, 1, 1])
+      assert_array_equal(new_ds.intensities[20], [2, 2, 2, 2])
+    finally:
+      DATASETS['NIR'].pop('Append Float32', None)
+
+  def test_changed_rows(self):
+    with self._modify() as fh:
+      fh['/spectra'][0] = 5.
+    self._touch()
+    self.assertRaises(AssertionError, self.ds.reload)
+
+
+class TestFullReload(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmpdir, 'data.hdf5')
+    with h5py.File(self.path, 'w') as fh:
+      fh['/meta/waves'] = np.arange(4.)
+      fh.create_dataset('/spectra', data=np.ones((20, 4)), maxshape=(None, 4))
+    loader = _generic_vector_loader([], dtype='float32')
+    self.ds = WebVectorDataset('Reload Test', 'NIR', loader, self.path)
+    wait_for_datasets()
+
+  def tearDown(self):
+    DATASETS['NIR'].pop('Reload Test', None)
+    shutil.rmtree(self.tmpdir)
+
+  def test_changed_unsampled_row(self):
+    with h5py.File(self.path, 'a') as fh:
+      # row 1 isn't one of the rows that append_only datasets check
+      fh['/spectra'][1] = 5.
+      fh['/spectra'].resize(21, axis=0)
+      fh['/spectra'][20] = 2.
+    mtime = os.path.getmtime(self.path) + 10
+    os.utime(self.path, (mtime, mtime))
+    self.assertTrue(self.ds.reload())
+    new_ds = DATASETS['NIR']['Reload Test']
+    self.assertEqual(new_ds.num_spectra(), 21)
+    assert_array_equal(new_ds.intensities[1], [5, 5, 5, 5])
+    assert_array_equal(self.ds.intensities[1], [1, 1, 1, 1])
+
+  def test_changed_spectra_file(self):
+    npy_path = os.path.join(self.tmpdir, 'spectra.npy')
+    np.save(npy_path, np.ones((20, 4)))
+    loader = _generic_vector_loader([], spectra_file=npy_path)
+    ds = WebVectorDataset('Spectra File Test', 'NIR', loader, self.path)
+    wait_for_datasets()
+    try:
+      np.save(npy_path, np.zeros((20, 4)))
+      mtime = os.path.getmtime(self.path) + 10
+      os.utime(npy_path, (mtime, mtime))
+      # only the .npy file changed
+      self.assertTrue(ds.reload())
+      new_ds = DATASETS['NIR']['Spectra File Test']
+      self.assertIsNot(new_ds, ds)
+      assert_array_equal(new_ds.intensities, np.zeros((20, 4)))
+    finally:
+      DATASETS['NIR'].pop('Spectra File Test', None)
+
+
+class TestUnload(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmpdir, 'data.hdf5')
+    with h5py.File(self.path, 'w') as fh:
+      fh['/meta/waves'] = np.arange(4.)
+      fh['/spectra'] = np.ones((3, 4))
+    loader = _generic_vector_loader([])
+    WebVectorDataset('Unload Test', 'NIR', loader, self.path)
+    wait_for_datasets()
+
+  def tearDown(self):
+    DATASETS['NIR'].pop('Unload Test', None)
+    shutil.rmtree(self.tmpdir)
+
+  def test_figures_dont_keep_unloaded_data(self):
+    ds = DATASETS['NIR']['Unload Test']
+    fig_data = FigData(None, None)
+    fig_data.filter_mask[ds.kind, ds.name] = np.ones(3, dtype=bool)
+    old_ds = weakref.ref(ds)
+    self.assertTrue(ds.unload())
+    del ds
+    gc.collect()
+    self.assertIsNone(old_ds())
+    # the mask still applies to the reloaded dataset
+    ds = DATASETS['NIR']['Unload Test'].warm()
+    self.assertEqual(ds.num_spectra(), 3)
+    self.assertEqual(fig_data.filter_mask[ds.kind, ds.name].sum(), 3)
+
+  def test_wait_for_precompute(self):
+    done = []
+
+    def slow_precompute(ds):
+      time.sleep(0.2)
+      done.append(ds.name)
+    loader = _generic_vector_loader([])
+    with patch.object(WebVectorDataset, '_precompute', slow_precompute):
+      WebVectorDataset('Precompute Test', 'NIR', loader, self.path)
+      wait_for_datasets()
+    try:
+      self.assertEqual(done, ['Precompute Test'])
+    finally:
+      DATASETS['NIR'].pop('Precompute Test', None)
+
+  def test_warm_async(self):
+    self.assertTrue(DATASETS['NIR']['Unload Test'].unload())
+    cold = DATASETS['NIR']['Unload Test']
+    future = cold.warm_async()
+    ds = future.result()
+    self.assertFalse(ds.cold)
+    self.assertIs(DATASETS['NIR']['Unload Test'], ds)
+    assert_array_equal(ds.intensities, np.ones((3, 4)))
+    # finished calls aren't reused
+    next_future = cold.warm_async()
+    self.assertIsNot(next_future, future)
+    self.assertIs(next_future.result(), ds)
+
+
+class TestPackedTrajLoader(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmpdir, 'traj.hdf5')
+    self.trajs = [np.column_stack((np.arange(n), np.ones(n))) for n in (3, 5)]
+    with h5py.File(self.path, 'w') as fh:
+      fh['/meta/pkey'] = [b'a', b'b']
+      fh['/meta/x'] = [1., 2.]
+      write_packed(fh, pack([u'a', u'b'], self.trajs))
+    self.loader = _generic_traj_loader([('x', NumericMetadata, 'X')],
+                                       append_only=True)
+
+  def tearDown(self):
+    DATASETS['NIR'].pop('Packed Test', None)
+    shutil.rmtree(self.tmpdir)
+
+  def test_load(self):
+    ds = WebTrajDataset('Packed Test', 'NIR', self.loader, self.path)
+    wait_for_datasets()
+    self.assertIsInstance(ds.traj, PackedTrajectories)
+    self.assertEqual(ds.num_spectra(), 2)
+    assert_array_equal(ds.get_trajectory(u'b'), self.trajs[1])
+    a, b = ds.get_trajectories_by_index([0, 1])
+    assert_array_equal(a, self.trajs[0])
+    assert_array_equal(b, self.trajs[1])
+
+  def test_append(self):
+    ds = WebTrajDataset('Packed Test', 'NIR', self.loader, self.path)
+    wait_for_datasets()
+    new_traj = np.column_stack((np.arange(4), np.zeros(4)))
+    with h5py.File(self.path, 'a') as fh:
+      del fh['/meta/pkey'], fh['/meta/x']
+      fh['/meta/pkey'] = [b'a', b'b', b'c']
+      fh['/meta/x'] = [1., 2., 3.]
+      fh['/spectra_data'].resize(12, axis=0)
+      fh['/spectra_data'][8:] = new_traj
+      fh['/spectra_offsets'].resize(4, axis=0)
+      fh['/spectra_offsets'][3] = 12
+    mtime = os.path.getmtime(self.path) + 10
+    os.utime(self.path, (mtime, mtime))
+    self.assertTrue(ds.reload())
+    new_ds = DATASETS['NIR']['Packed Test']
+    self.assertEqual(new_ds.num_spectra(), 3)
+    assert_array_equal(new_ds.get_trajectories([u'c'])[0], new_traj)
+    self.assertEqual(ds.num_spectra(), 2)
+
+  def test_append_reads_new_part(self):
+    trajs = [np.column_stack((np.arange(3), np.ones(3)))] * 20
+    with h5py.File(self.path, 'w') as fh:
+      fh['/meta/pkey'] = np.arange(20).astype('S')
+      write_packed(fh, pack(np.arange(20).astype('U'), trajs, dtype='float32'))
+    loader = _generic_traj_loader([], dtype='float32', append_only=True)
+    ds = WebTrajDataset('Packed Test', 'NIR', loader, self.path)
+    wait_for_datasets()
+    with h5py.File(self.path, 'a') as fh:
+      # trajectory 1 isn't checked, and old ones aren't read again
+      fh['/spectra_data'][3:6, 1] = 5
+      del fh['/meta/pkey']
+      fh['/meta/pkey'] = np.arange(21).astype('S')
+      fh['/spectra_data'].resize(64, axis=0)
+      fh['/spectra_data'][60:] = np.column_stack((np.arange(4), np.zeros(4)))
+      fh['/spectra_offsets'].resize(22, axis=0)
+      fh['/spectra_offsets'][21] = 64
+    mtime = os.path.getmtime(self.path) + 10
+    os.utime(self.path, (mtime, mtime))
+    self.assertTrue(ds.reload())
+    new_ds = DATASETS['NIR']['Packed Test']
+    self.assertEqual(new_ds.num_spectra(), 21)
+    assert_array_equal(new_ds.get_trajectory(u'1'), trajs[1])
+    assert_array_equal(new_ds.get_trajectory(u'20')[:, 1], np.zeros(4))
+
+
+if __name__ == '__main__':
+  unittest.main()
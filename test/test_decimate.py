@@ -0,0 +1,52 @@
+import numpy as np
+import unittest
+from matplotlib.figure import Figure
+from numpy.testing import assert_array_equal
+
+from backend.decimate import decimate, full_data, plot_decimated
+
+
+class TestDecimate(unittest.TestCase):
+  def setUp(self):
+    x = np.linspace(0, 100, 10000)
+    y = np.sin(x) + np.random.random(len(x))
+    y[500:503] = np.nan
+    self.traj = np.column_stack((x, y))
+
+  def test_short_traj(self):
+    traj = self.traj[:100]
+    self.assertIs(decimate(traj, (0, 100), 100), traj)
+
+  def test_minmax(self):
+    res = decimate(self.traj, (0, 100), 200)
+    # two points per column (including the edges), plus the NaNs
+    self.assertLessEqual(len(res), 2 * 202 + 3)
+    self.assertEqual(np.nanmax(res[:,1]), np.nanmax(self.traj[:,1]))
+    self.assertEqual(np.nanmin(res[:,1]), np.nanmin(self.traj[:,1]))
+    # NaN gaps are preserved
+    self.assertEqual(np.isnan(res[:,1]).sum(), 3)
+
+  def test_zoomed(self):
+    res = decimate(self.traj, (10, 20), 1000)
+    self.assertLess(res[0,0], 10)
+    self.assertGreater(res[-1,0], 20)
+    self.assertEqual(len(res), np.count_nonzero(
+        (self.traj[:,0] >= 10) & (self.traj[:,0] <= 20)) + 2)
+
+  def test_reversed(self):
+    res = decimate(self.traj[::-1], (0, 100), 200)
+    self.assertTrue((np.diff(res[:,0]) <= 0).all())
+
+  def test_plot(self):
+    fig = Figure(figsize=(4, 3), dpi=80)
+    ax = fig.gca()
+    line = plot_decimated(ax, *self.traj.T)
+    num_points = len(line.get_xdata())
+    self.assertLess(num_points, len(self.traj))
+    assert_array_equal(full_data(line), self.traj)
+    ax.set_xlim((50, 51))
+    self.assertLess(len(line.get_xdata()), num_points)
+
+
+if __name__ == '__main__':
+  unittest.main()
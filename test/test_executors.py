@@ -0,0 +1,52 @@
+import os
+import unittest
+
+from backend.executors import MeteredPool, run_in_pool
+
+
+class TestMeteredPool(unittest.TestCase):
+  def test_submit(self):
+    pool = MeteredPool('test', 2)
+    futures = [pool.submit(pow, 2, i) for i in range(5)]
+    self.assertEqual([f.result() for f in futures], [1, 2, 4, 8, 16])
+    stats = pool.stats()
+    self.assertEqual(stats['num_tasks'], 5)
+    self.assertEqual(stats['queue_length'], 0)
+    self.assertEqual(stats['active'], 0)
+
+  def test_exception(self):
+    pool = MeteredPool('test', 1)
+    future = pool.submit(int, 'foo')
+    self.assertRaises(ValueError, future.result)
+    self.assertEqual(pool.stats()['num_tasks'], 1)
+
+  def test_resize(self):
+    pool = MeteredPool('test', 1)
+    pool.resize(3)
+    self.assertEqual(pool.num_threads, 3)
+    pool.submit(abs, -1).result()
+    self.assertRaises(RuntimeError, pool.resize, 4)
+
+
+class TestFork(unittest.TestCase):
+  @unittest.skipUnless(hasattr(os, 'register_at_fork'), 'needs os.fork hooks')
+  def test_submit_after_fork(self):
+    # start the pools' threads in this process
+    for name in ('cpu', 'load', 'io'):
+      run_in_pool(name, abs, -1).result()
+    pid = os.fork()
+    if pid == 0:
+      status = 1
+      try:
+        futures = [run_in_pool(name, abs, -2)
+                   for name in ('cpu', 'load', 'io')]
+        if all(f.result(timeout=5) == 2 for f in futures):
+          status = 0
+      finally:
+        os._exit(status)
+    _, status = os.waitpid(pid, 0)
+    self.assertEqual(status, 0)
+
+
+if __name__ == '__main__':
+  unittest.main()
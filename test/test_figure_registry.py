@@ -0,0 +1,67 @@
+import time
+import unittest
+from mock import Mock
+
+from backend.figure_registry import FigureRegistry
+
+
+def _fig_data(nbytes=0, num_sockets=0):
+  fd = Mock()
+  fd.nbytes.return_value = nbytes
+  fd.manager.web_sockets = set(Mock() for _ in range(num_sockets))
+  return fd
+
+
+class TestFigureRegistry(unittest.TestCase):
+  def test_lru_eviction(self):
+    reg = FigureRegistry(max_figures=2, max_bytes=None, idle_ttl=None)
+    reg[1] = _fig_data()
+    reg[2] = _fig_data()
+    reg[1]  # touch, so 2 becomes the LRU figure
+    reg[3] = _fig_data()
+    self.assertEqual(sorted(reg), [1, 3])
+    self.assertEqual(reg.evictions['lru'], 1)
+
+  def test_prefers_socketless(self):
+    reg = FigureRegistry(max_figures=2, max_bytes=None, idle_ttl=None)
+    reg[1] = _fig_data(num_sockets=1)
+    reg[2] = _fig_data()
+    reg[3] = _fig_data()
+    self.assertEqual(sorted(reg), [1, 3])
+
+  def test_keeps_new_figure(self):
+    reg = FigureRegistry(max_figures=2, max_bytes=None, idle_ttl=None)
+    reg[1] = _fig_data(num_sockets=1)
+    reg[2] = _fig_data(num_sockets=1)
+    # the new figure has no socket yet, but the oldest one goes instead
+    reg[3] = _fig_data()
+    self.assertEqual(sorted(reg), [2, 3])
+    self.assertEqual(reg.evictions['lru'], 1)
+
+  def test_memory_cap(self):
+    reg = FigureRegistry(max_figures=10, max_bytes=100, idle_ttl=None)
+    reg[1] = _fig_data(nbytes=60)
+    reg[2] = _fig_data(nbytes=60)
+    self.assertEqual(list(reg), [2])
+    self.assertEqual(reg.evictions['memory'], 1)
+
+  def test_idle_sweep(self):
+    reg = FigureRegistry(max_figures=10, max_bytes=None, idle_ttl=0.01)
+    reg[1] = _fig_data()
+    reg[2] = _fig_data(num_sockets=1)
+    time.sleep(0.02)
+    reg.sweep()
+    self.assertEqual(list(reg), [2])
+    self.assertEqual(reg.evictions['idle'], 1)
+
+  def test_closed(self):
+    reg = FigureRegistry()
+    reg[1] = _fig_data()
+    reg.pop(1)
+    self.assertIsNone(reg.pop(1, None))
+    self.assertEqual(reg.evictions['closed'], 1)
+    self.assertEqual(len(reg), 0)
+
+
+if __name__ == '__main__':
+  unittest.main()
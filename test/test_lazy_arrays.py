@@ -0,0 +1,47 @@
+import numpy as np
+import unittest
+from numpy.testing import assert_array_equal
+
+from backend.lazy_arrays import LazyMatrix, BLOCK_CACHE
+
+
+class TestLazyMatrix(unittest.TestCase):
+  def setUp(self):
+    self.data = np.arange(300, dtype=float).reshape((50, 6))
+    # blocks of 4 rows
+    self.lazy = LazyMatrix(self.data, block_bytes=4 * 6 * 8)
+
+  def test_shape(self):
+    self.assertEqual(self.lazy.shape, (50, 6))
+    self.assertEqual(len(self.lazy), 50)
+    self.assertEqual(self.lazy.block_rows, 4)
+    assert_array_equal(np.asarray(self.lazy), self.data)
+
+  def test_indexing(self):
+    mask = self.data[:, 0] % 3 == 0
+    idx = np.array([17, 3, 49, 3, -1])
+    for key in [5, -2, slice(3, 11), slice(None, None, 7), mask, idx,
+                (slice(2, 9), slice(1, 3)), (mask, 2), (idx, slice(1, 4)),
+                (slice(idx[0], idx[0] + 1), slice(None))]:
+      assert_array_equal(self.lazy[key], self.data[key], err_msg=str(key))
+    self.assertEqual(self.lazy[np.zeros(50, dtype=bool), :].shape, (0, 6))
+
+  def test_cached_blocks(self):
+    BLOCK_CACHE.clear()
+    self.lazy[[0, 1, 9]]
+    self.assertEqual(len(BLOCK_CACHE), 2)
+    hits = BLOCK_CACHE.hits
+    self.lazy[2]
+    self.assertEqual(BLOCK_CACHE.hits, hits + 1)
+
+  def test_dtype(self):
+    lazy = LazyMatrix(self.data, block_bytes=4 * 6 * 8, dtype=np.float32)
+    self.assertEqual(lazy.dtype, np.float32)
+    # blocks are sized by the stored type
+    self.assertEqual(lazy.block_rows, 8)
+    self.assertEqual(lazy[3:12].dtype, np.float32)
+    assert_array_equal(lazy[3:12], self.data[3:12])
+
+
+if __name__ == '__main__':
+  unittest.main()
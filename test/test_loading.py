@@ -0,0 +1,78 @@
+import threading
+import time
+import unittest
+
+from backend.executors import MeteredPool
+from backend.loading import DatasetLoader
+
+
+class FakeDataset(object):
+  def __init__(self, name, log, ok=True, gate=None):
+    self.name = name
+    self.kind = 'Raman'
+    self.loader_args = ()
+    self.log = log
+    self.ok = ok
+    self.gate = gate
+
+  def __str__(self):
+    return self.name
+
+  def reload(self):
+    if self.gate is not None:
+      self.gate.wait()
+    self.log.append(self.name)
+    return self.ok
+
+
+class TestDatasetLoader(unittest.TestCase):
+  def setUp(self):
+    self.loader = DatasetLoader()
+    self.loader.pool = MeteredPool('test', 1)
+
+  def test_priority_order(self):
+    log, gate = [], threading.Event()
+    # the first load blocks the only thread while the rest are queued
+    self.loader.submit(FakeDataset('first', log, gate=gate))
+    while self.loader.progress()[0]['state'] == 'queued':
+      time.sleep(0.01)
+    self.loader.submit(FakeDataset('low', log), priority=-1)
+    self.loader.submit(FakeDataset('high', log), priority=5)
+    self.loader.submit(FakeDataset('mid', log, ok=False))
+    self.assertFalse(self.loader.is_ready())
+    gate.set()
+    self.loader.wait()
+    self.assertEqual(log, ['first', 'high', 'mid', 'low'])
+    states = {p['name']: p['state'] for p in self.loader.progress()}
+    self.assertEqual(states['mid'], 'failed')
+    self.assertEqual(states['high'], 'ready')
+    self.assertTrue(self.loader.is_ready())
+
+  def test_pause(self):
+    log = []
+    self.loader.pause()
+    # the pool has a free thread, but nothing starts until start()
+    for name, priority in [('low', -1), ('mid', 0), ('high', 5)]:
+      self.loader.submit(FakeDataset(name, log), priority=priority)
+    time.sleep(0.05)
+    self.assertEqual(log, [])
+    self.loader.start()
+    self.loader.wait()
+    self.assertEqual(log, ['high', 'mid', 'low'])
+
+  def test_min_priority(self):
+    log, gate = [], threading.Event()
+    self.loader.submit(FakeDataset('important', log), priority=1)
+    self.loader.submit(FakeDataset('blocked', log, gate=gate))
+    self.loader.submit(FakeDataset('optional', log))
+    # wait for the important dataset, which loads first
+    while not self.loader.is_ready(min_priority=1):
+      time.sleep(0.01)
+    self.assertFalse(self.loader.is_ready())
+    gate.set()
+    self.loader.wait()
+    self.assertTrue(self.loader.is_ready())
+
+
+if __name__ == '__main__':
+  unittest.main()
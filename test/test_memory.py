@@ -0,0 +1,63 @@
+import numpy as np
+import sys
+import unittest
+
+from backend.memory import MemoryBudget, nbytes
+
+
+class FakeDataset(object):
+  def __init__(self, name, size):
+    self.kind = 'Raman'
+    self.name = name
+    self.size = size
+    self.cold = False
+
+  def memory_usage(self):
+    return dict(total=0 if self.cold else self.size)
+
+  def can_unload(self):
+    return True
+
+  def unload(self):
+    self.cold = True
+    return True
+
+
+class TestMemoryBudget(unittest.TestCase):
+  def test_nbytes(self):
+    arr = np.zeros(1000)
+    self.assertEqual(nbytes(arr), 8000)
+    # views and repeats are counted once
+    total = nbytes(dict(a=arr, b=arr[:10], c=[arr]))
+    self.assertGreater(total, 8000)
+    self.assertLess(total, 9000)
+    # big containers are sampled, close to their exact size
+    keys = dict(('key%d' % i, i) for i in range(50000))
+    exact = sys.getsizeof(keys) + sum(sys.getsizeof(k) + sys.getsizeof(v)
+                                      for k, v in keys.items())
+    self.assertAlmostEqual(nbytes(keys) / float(exact), 1, delta=0.05)
+
+  def test_unloads_least_recent(self):
+    budget = MemoryBudget(max_bytes=250)
+    datasets = [FakeDataset(name, 100) for name in 'abc']
+    for t, ds in enumerate([datasets[1], datasets[0], datasets[2]]):
+      budget.touch(ds, now=t + 1)
+    budget.enforce(datasets, keep=datasets[2])
+    self.assertEqual([ds.cold for ds in datasets], [False, True, False])
+    self.assertEqual(budget.num_unloads, 1)
+    stats = budget.stats(datasets)
+    self.assertEqual(stats['total'], 200)
+    self.assertEqual(stats['num_cold'], 1)
+
+  def test_keeps_requested(self):
+    budget = MemoryBudget(max_bytes=50)
+    datasets = [FakeDataset('big', 100)]
+    budget.enforce(datasets, keep=datasets[0])
+    self.assertFalse(datasets[0].cold)
+    # without a budget, nothing is unloaded
+    MemoryBudget().enforce(datasets)
+    self.assertFalse(datasets[0].cold)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+from backend.metrics import LatencyHistogram, RouteMetrics
+
+
+class TestMetrics(unittest.TestCase):
+  def test_histogram(self):
+    hist = LatencyHistogram(buckets=(0.1, 1, 10))
+    for t in (0.05, 0.5, 0.5, 5):
+      hist.observe(t)
+    self.assertEqual(hist.counts, [1, 2, 1, 0])
+    self.assertEqual(hist.count, 4)
+    self.assertAlmostEqual(hist.mean(), 1.5125)
+    self.assertEqual(hist.quantile(0.5), 1)
+    self.assertEqual(hist.quantile(1), 5)
+
+  def test_prometheus(self):
+    metrics = RouteMetrics(buckets=(0.1, 1))
+    metrics.observe('FooHandler', 'GET', 'total', 0.5)
+    metrics.observe('FooHandler', 'GET', 'total', 2)
+    text = metrics.prometheus_text(name='x')
+    labels = 'route="FooHandler",method="GET",phase="total"'
+    self.assertIn('x_bucket{%s,le="0.1"} 0\n' % labels, text)
+    self.assertIn('x_bucket{%s,le="1"} 1\n' % labels, text)
+    self.assertIn('x_bucket{%s,le="+Inf"} 2\n' % labels, text)
+    self.assertIn('x_count{%s} 2\n' % labels, text)
+
+  def test_summary(self):
+    metrics = RouteMetrics()
+    metrics.observe('Fast', 'GET', 'total', 0.1)
+    metrics.observe('Slow', 'POST', 'total', 3)
+    (route, method, hists), _ = metrics.summary()
+    self.assertEqual((route, method), ('Slow', 'POST'))
+    self.assertEqual(hists['total'].count, 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,76 @@
+import h5py
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+from numpy.testing import assert_array_equal
+
+from backend.packed_trajs import pack, pack_file, read_packed
+
+
+def _traj(n, start=0):
+  return np.column_stack((np.arange(n) + start, np.random.random(n)))
+
+
+class TestPackedTrajectories(unittest.TestCase):
+  def setUp(self):
+    self.keys = np.array([u'b', u'c', u'a'])
+    self.trajs = [_traj(3), _traj(5), _traj(2, start=10)]
+    self.packed = pack(self.keys, self.trajs)
+
+  def test_lookup(self):
+    self.assertEqual(len(self.packed), 3)
+    self.assertEqual(list(self.packed), list(self.keys))
+    for key, traj in zip(self.keys, self.trajs):
+      assert_array_equal(self.packed[key], traj)
+    self.assertIn(u'a', self.packed)
+    self.assertNotIn(u'd', self.packed)
+    assert_array_equal(self.packed.positions([u'a', u'b']), [2, 0])
+    self.assertRaises(KeyError, self.packed.positions, [u'a', u'zz'])
+
+  def test_views(self):
+    traj = self.packed.at(1)
+    self.assertIs(traj.base, self.packed.data)
+
+  def test_backwards(self):
+    self.assertEqual(len(self.packed.backwards()), 0)
+    packed = pack([u'x', u'y'], [_traj(3), _traj(3)[::-1]])
+    assert_array_equal(packed.backwards(), [u'y'])
+
+  def test_extend(self):
+    more = self.packed.extend([u'd'], [_traj(4)])
+    self.assertEqual(len(more), 4)
+    assert_array_equal(more[u'a'], self.trajs[2])
+    self.assertEqual(len(more[u'd']), 4)
+    self.assertNotIn(u'd', self.packed)
+
+
+class TestPackFile(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test_convert(self):
+    in_path = os.path.join(self.tmpdir, 'in.hdf5')
+    out_path = os.path.join(self.tmpdir, 'out.hdf5')
+    trajs = dict(foo=_traj(3), bar=_traj(6))
+    with h5py.File(in_path, 'w') as fh:
+      fh['/meta/pkey'] = np.array([b'foo', b'bar'])
+      fh['/meta/size'] = np.array([1., 2.])
+      for key, traj in trajs.items():
+        fh['/spectra/' + key] = traj
+    self.assertEqual(pack_file(in_path, out_path, dtype='float32'), 2)
+    with h5py.File(out_path, 'r') as fh:
+      self.assertNotIn('spectra', fh)
+      assert_array_equal(fh['/meta/size'], [1., 2.])
+      packed = read_packed(fh, [u'foo', u'bar'])
+    self.assertEqual(packed.data.dtype, np.float32)
+    for key, traj in trajs.items():
+      assert_array_equal(packed[key], traj.astype(np.float32))
+
+
+if __name__ == '__main__':
+  unittest.main()
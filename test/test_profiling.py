@@ -0,0 +1,59 @@
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.profiling import Profiler
+
+
+def _pool_job(n):
+  return sum(range(n))
+
+
+class TestProfiler(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.profiler = Profiler(outdir=self.tmpdir)
+    self.pool = ThreadPoolExecutor(1)
+
+  def tearDown(self):
+    self.pool.shutdown()
+    shutil.rmtree(self.tmpdir)
+
+  def test_not_selected(self):
+    self.assertIsNone(self.profiler.start('OtherHandler', 'GET', '/'))
+    # nothing to profile, so jobs aren't wrapped
+    self.assertIs(self.profiler.wrap(_pool_job), _pool_job)
+
+  def test_profile_with_pool_job(self):
+    self.profiler.configure(routes=['TestHandler'])
+    prof = self.profiler.start('TestHandler', 'POST', '/_test?x=1')
+    self.assertIsNotNone(prof)
+    # only one request is profiled at a time
+    self.assertIsNone(self.profiler.start('TestHandler', 'GET', '/'))
+    job = self.profiler.wrap(_pool_job)
+    self.assertEqual(self.pool.submit(job, 1000).result(), 499500)
+    self.profiler.finish(prof)
+
+    self.assertEqual(prof.num_jobs, 1)
+    self.assertEqual(list(self.profiler.recent), [prof])
+    files = sorted(os.listdir(self.tmpdir))
+    self.assertEqual(len(files), 2)
+    self.assertTrue(files[0].endswith('_TestHandler_POST.pstats'))
+    self.assertTrue(files[1].endswith('_TestHandler_POST.txt'))
+    self.assertEqual(files[0], prof.filename)
+    # the pool job shows up in the saved stats
+    stats = pstats.Stats(os.path.join(self.tmpdir, prof.filename))
+    self.assertIn('_pool_job', [fn for _, _, fn in stats.stats])
+    with open(os.path.join(self.tmpdir, files[1])) as fh:
+      header = fh.readline()
+      self.assertEqual(fh.read(), prof.summary)
+    self.assertTrue(header.startswith('POST /_test?x=1 ('))
+    self.assertTrue(header.endswith(', 1 background jobs)\n'))
+    self.assertIn('_pool_job', prof.summary)
+
+
+if __name__ == '__main__':
+  unittest.main()
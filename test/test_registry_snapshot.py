@@ -0,0 +1,107 @@
+import h5py
+import numpy as np
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from numpy.testing import assert_array_equal
+
+from backend.dataset_loaders import _generic_vector_loader
+from backend.registry_snapshot import RegistrySnapshot
+from backend import web_datasets
+from backend.web_datasets import (
+    DATASETS, WebVectorDataset, NumericMetadata, wait_for_datasets)
+
+
+class TestRegistrySnapshot(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmpdir, 'data.hdf5')
+    self.spectra = np.random.random((50, 100))
+    with h5py.File(self.path, 'w') as fh:
+      fh['/meta/waves'] = np.arange(100.)
+      fh['/meta/x'] = np.arange(50.)
+      fh['/spectra'] = self.spectra
+    self.loader = _generic_vector_loader([('x', NumericMetadata, 'X')])
+    self.snapshot = RegistrySnapshot(os.path.join(self.tmpdir, 'snap'))
+    # datasets are restored from the module's singleton
+    self.old_snapshot = web_datasets.REGISTRY_SNAPSHOT
+    web_datasets.REGISTRY_SNAPSHOT = self.snapshot
+
+  def tearDown(self):
+    web_datasets.REGISTRY_SNAPSHOT = self.old_snapshot
+    DATASETS['NIR'].pop('Snapshot Test', None)
+    shutil.rmtree(self.tmpdir)
+
+  def _load(self):
+    ds = WebVectorDataset('Snapshot Test', 'NIR', self.loader, self.path)
+    wait_for_datasets()
+    return DATASETS['NIR']['Snapshot Test']
+
+  def test_restore(self):
+    old_ds = self._load()
+    self.snapshot.write([old_ds])
+    self.assertEqual(self.snapshot.read(), 1)
+    ds = self._load()
+    self.assertIsNot(ds, old_ds)
+    self.assertEqual(self.snapshot.num_restored, 1)
+    # spectra are read from the HDF5 file on demand, as before
+    self.assertIsInstance(ds.intensities, h5py.Dataset)
+    assert_array_equal(ds.intensities, self.spectra)
+    assert_array_equal(ds.bands, np.arange(100.))
+    assert_array_equal(ds.metadata['x'].arr, np.arange(50.))
+    self.assertEqual(ds.load_time, old_ds.load_time)
+    # nothing new to save
+    mtime = os.path.getmtime(self.snapshot.path)
+    self.snapshot.write([ds])
+    self.assertEqual(os.path.getmtime(self.snapshot.path), mtime)
+
+  def test_mapped_arrays(self):
+    self.loader = _generic_vector_loader([], dtype='float32')
+    self.snapshot.write([self._load()])
+    self.snapshot.read()
+    ds = self._load()
+    self.assertEqual(self.snapshot.num_restored, 1)
+    self.assertIsInstance(ds.intensities, np.memmap)
+    assert_array_equal(ds.intensities, self.spectra.astype(np.float32))
+
+  def test_changed_files(self):
+    self.snapshot.write([self._load()])
+    mtime = os.path.getmtime(self.path) + 10
+    os.utime(self.path, (mtime, mtime))
+    self.snapshot.read()
+    self._load()
+    self.assertEqual(self.snapshot.num_restored, 0)
+
+  def test_changed_spectra_file(self):
+    npy_path = os.path.join(self.tmpdir, 'spectra.npy')
+    np.save(npy_path, self.spectra)
+    self.loader = _generic_vector_loader([], spectra_file=npy_path)
+    self.snapshot.write([self._load()])
+    np.save(npy_path, self.spectra * 2)
+    mtime = os.path.getmtime(npy_path) + 10
+    os.utime(npy_path, (mtime, mtime))
+    self.snapshot.read()
+    ds = self._load()
+    self.assertEqual(self.snapshot.num_restored, 0)
+    assert_array_equal(ds.intensities, self.spectra * 2)
+
+  def test_changed_config(self):
+    config = os.path.join(self.tmpdir, 'datasets.yml')
+    with open(config, 'w') as fh:
+      fh.write('NIR: {}\n')
+    self.snapshot.config_files = [config]
+    self.snapshot.write([self._load()])
+    os.utime(config, (0, 0))
+    self.assertEqual(self.snapshot.read(), 0)
+
+  def test_unsaveable(self):
+    ds = self._load()
+    ds.snapshot_state = lambda: dict(lock=threading.Lock())
+    self.snapshot.write([ds])
+    self.assertEqual(self.snapshot.read(), 0)
+
+
+if __name__ == '__main__':
+  unittest.main()
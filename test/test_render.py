@@ -0,0 +1,92 @@
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from mock import Mock
+
+from backend.executors import MeteredPool
+from backend.profiling import PROFILER
+from backend.render import RenderPool
+
+
+def _draw_job(n):
+  return sum(range(n))
+
+
+class TestRenderPool(unittest.TestCase):
+  def setUp(self):
+    self.renderer = RenderPool()
+    self.renderer.pool = MeteredPool('test', 2)
+
+  def test_one_figure_in_order(self):
+    fig_data, log, active = Mock(), [], []
+
+    def job(i):
+      active.append(i)
+      self.assertEqual(len(active), 1)
+      time.sleep(0.01)
+      log.append(i)
+      active.remove(i)
+      return i
+
+    futures = [self.renderer.submit(fig_data, job, i) for i in range(5)]
+    self.assertEqual([f.result(timeout=5) for f in futures], list(range(5)))
+    self.assertEqual(log, list(range(5)))
+    self.assertEqual(self.renderer.stats()['queue_depth'], 0)
+    self.assertEqual(self.renderer.stats()['active_figures'], 0)
+
+  def test_figures_in_parallel(self):
+    # each job waits for the other, so they must run at the same time
+    first, second = threading.Event(), threading.Event()
+
+    def job(mine, other):
+      mine.set()
+      return other.wait(5)
+
+    f1 = self.renderer.submit(Mock(), job, first, second)
+    f2 = self.renderer.submit(Mock(), job, second, first)
+    self.assertTrue(f1.result(timeout=5))
+    self.assertTrue(f2.result(timeout=5))
+
+  def test_draw_stats(self):
+    fig_data = Mock(version=0)
+    futures = [self.renderer.draw(fig_data, abs, -i) for i in range(4)]
+    self.assertEqual([f.result(timeout=5) for f in futures], [0, 1, 2, 3])
+    self.assertEqual(fig_data.version, 4)
+    self.assertEqual(fig_data.manager.canvas.draw.call_count, 4)
+    stats = self.renderer.stats()
+    self.assertEqual(stats['num_draws'], 4)
+    self.assertEqual(stats['num_jobs'], 4)
+
+
+class TestProfiledRender(unittest.TestCase):
+  def setUp(self):
+    self.renderer = RenderPool()
+    self.renderer.pool = MeteredPool('test', 1)
+    self.old_outdir = PROFILER.outdir
+    PROFILER.outdir = tempfile.mkdtemp()
+    PROFILER.configure(routes=['TestHandler'])
+
+  def tearDown(self):
+    PROFILER.configure()
+    shutil.rmtree(PROFILER.outdir)
+    PROFILER.outdir = self.old_outdir
+
+  def test_job_profiled_once(self):
+    prof = PROFILER.start('TestHandler', 'POST', '/_test')
+    future = self.renderer.submit(Mock(), _draw_job, 1000)
+    self.assertEqual(future.result(timeout=5), 499500)
+    PROFILER.finish(prof)
+    self.assertEqual(prof.num_jobs, 1)
+    stats = pstats.Stats(os.path.join(PROFILER.outdir, prof.filename))
+    names = [fn for _, _, fn in stats.stats]
+    self.assertIn('_draw_job', names)
+    # the render queue's loop isn't profiled as another job
+    self.assertNotIn('_run_queue', names)
+
+
+if __name__ == '__main__':
+  unittest.main()
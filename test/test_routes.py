@@ -1,12 +1,17 @@
 import numpy as np
 import time
+import tornado.ioloop
 import unittest
+from concurrent.futures import Future
 from mock import Mock
 from numpy.testing import assert_array_equal
 
 from backend import MatplotlibServer
 from backend.handlers.single_spectrum import BaselineHandler, SelectHandler
-from backend.handlers.common import BaseHandler
+from backend.handlers.common import BaseHandler, DatasetLoading
+from backend.handlers.filterplots import (
+    ColorData, PlotData, encode_plot_data)
+from backend.workers import worker_for_fignum
 from backend.web_datasets import (
     DATASETS, WebTrajDataset, WebVectorDataset,
     LookupMetadata, NumericMetadata, BooleanMetadata, PrimaryKeyMetadata,
@@ -62,6 +67,36 @@ class TestGenericRoutes(RouteTester):
     datasets = h.all_datasets()
     self.assertEqual(len(datasets), 2)
 
+  def test_cold_dataset(self):
+    warm = Mock(cold=False)
+    cold = Mock(cold=True, is_public=True)
+    cold.name = 'Cold Set'
+    cold.warm_async.return_value = Future()
+    cold.warm_async.return_value.set_result(warm)
+    DATASETS['Raman']['Cold Set'] = cold
+    try:
+      req = Mock(cookies=dict(), method='GET', uri='/', _start_time=time.time())
+      req.arguments = dict(ds_kind=['Raman'], ds_name=['Cold Set'])
+      h = BaseHandler(self.app, req)
+      # prepare loads it in the background, instead of blocking the IOLoop
+      tornado.ioloop.IOLoop.current().run_sync(h.prepare)
+      cold.warm_async.assert_called_once_with()
+      cold.warm.assert_not_called()
+      self.assertIs(h.get_dataset('Raman', 'Cold Set'), warm)
+      # datasets that the request doesn't name can't be loaded in time
+      h = BaseHandler(self.app, Mock(cookies=dict()))
+      self.assertRaises(DatasetLoading, h.get_dataset, 'Raman', 'Cold Set')
+    finally:
+      del DATASETS['Raman']['Cold Set']
+
+  def test_worker_fignums(self):
+    app = MatplotlibServer([], cookie_secret='foobar', worker_index=2,
+                           num_workers=3)
+    fignums = [app.register_new_figure((1,1)) for _ in range(4)]
+    self.assertEqual(len(set(fignums)), 4)
+    for fignum in fignums:
+      self.assertEqual(worker_for_fignum(str(fignum), 3), 2)
+
   def test_select(self):
     fignum = self.app.register_new_figure((1,1))
     req = Mock(cookies=dict())
@@ -69,7 +104,7 @@ class TestGenericRoutes(RouteTester):
                          ds_kind=['Raman'], name=['a'])
     h = SelectHandler(self.app, req)
     h.write = Mock()
-    h.post()
+    tornado.ioloop.IOLoop.current().run_sync(h.post)
     self.assertEqual(len(h.write.call_args_list), 1)
     args, kwargs = h.write.call_args
     self.assertRegex(args[0], '\[-?\d+.\d+, \d+.\d+, \d+.\d+, \d+.\d+]')
@@ -95,12 +130,14 @@ class TestBaselineRoutes(RouteTester):
     req = Mock(cookies=dict())
     req.arguments = dict(fignum=[str(self.fignum)], blr_method=['median'],
                          blr_window_=['3'])
-    BaselineHandler(self.app, req).post()
+    h = BaselineHandler(self.app, req)
+    tornado.ioloop.IOLoop.current().run_sync(h.post)
 
   def test_baseline_1axis(self):
     req = Mock(cookies=dict())
     req.arguments = dict(fignum=[str(self.fignum)], blr_method=['polyfit'])
-    BaselineHandler(self.app, req).post()
+    h = BaselineHandler(self.app, req)
+    tornado.ioloop.IOLoop.current().run_sync(h.post)
 
   def test_baseline_download(self):
     req = Mock()
@@ -113,5 +150,45 @@ class TestBaselineRoutes(RouteTester):
     self.assertEqual(len(h.finish.call_args_list), 1)
 
 
+class TestPlotDataEncoding(unittest.TestCase):
+  def test_encode(self):
+    trajs = [np.ones((3,2)), np.zeros((2,2))]
+    plot_data = PlotData(trajs=trajs, xlabel='x', ylabel='y', xticks=None,
+                         yticks=None, scatter=False)
+    color_data = ColorData(color=np.array([1, 2]), label='c', names=None,
+                           needs_cbar=True, is_categorical=False)
+    buf = encode_plot_data(plot_data, color_data, ['a', 'b'], lw=1)
+    header_len, = np.frombuffer(buf[:4], dtype='<u4')
+    self.assertEqual(header_len % 4, 0)
+    pos = 4 + header_len
+    xy = np.frombuffer(buf, dtype='<f4', count=10, offset=pos)
+    assert_array_equal(xy.reshape((5,2)), np.vstack(trajs))
+    offsets = np.frombuffer(buf, dtype='<u4', count=3, offset=pos + 40)
+    assert_array_equal(offsets, [0, 3, 5])
+    colors = np.frombuffer(buf, dtype='<f4', offset=pos + 52)
+    assert_array_equal(colors, [1, 2])
+
+
+class TestDatasetFilters(unittest.TestCase):
+  def test_histogram_png(self):
+    ds = DATASETS['Raman']['Test Set']
+    png = ds.histogram_png('numeric')
+    self.assertTrue(png.startswith(b'\x89PNG\r\n\x1a\n'))
+    self.assertIs(ds.histogram_png('comps$x'), ds.histogram_png('comps$x'))
+    self.assertRaises(KeyError, ds.histogram_png, 'lookup')
+
+  def test_value_index(self):
+    ds = DATASETS['Raman']['Test Set']
+    self.assertEqual(ds.value_index('lookup').search('b')[0], ['Test B'])
+    self.assertEqual(len(ds.value_index('pkey')), 2)
+    self.assertRaises(KeyError, ds.value_index, 'numeric')
+
+  def test_keys_with_prefix(self):
+    ds = DATASETS['NIR']['Test 2']
+    self.assertEqual(ds.keys_with_prefix('b'), (['b'], False))
+    self.assertEqual(ds.keys_with_prefix('', limit=2), (['a', 'b'], True))
+    self.assertEqual(ds.keys_with_prefix('', offset=2, limit=2), (['c'], False))
+
+
 if __name__ == '__main__':
   unittest.main()
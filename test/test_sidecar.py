@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from backend.sidecar import SidecarCache
+
+
+class FakeDataset(object):
+  kind = 'Raman'
+  name = 'Fake'
+
+  def __init__(self, *loader_args, **kwargs):
+    self.loader_args = loader_args
+    self.loader_config = kwargs.get('config')
+    self.extra_sources = kwargs.get('extra_sources', [])
+
+  def source_files(self):
+    return list(self.loader_args) + self.extra_sources
+
+
+class TestSidecarCache(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.cache = SidecarCache(os.path.join(self.tmpdir, 'cache'))
+    self.datafile = os.path.join(self.tmpdir, 'data.hdf5')
+    with open(self.datafile, 'w') as fh:
+      fh.write('data')
+    self.calls = 0
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _compute(self):
+    self.calls += 1
+    return {'answer': 42}
+
+  def test_persists(self):
+    ds = FakeDataset(self.datafile)
+    self.assertEqual(self.cache.open(ds).get('x', self._compute),
+                     {'answer': 42})
+    # a fresh load reads it back from disk
+    self.assertEqual(self.cache.open(ds).get('x', self._compute),
+                     {'answer': 42})
+    self.assertEqual(self.calls, 1)
+    self.assertEqual(self.cache.hits, 1)
+
+  def test_invalidated(self):
+    ds = FakeDataset(self.datafile)
+    self.cache.open(ds).get('x', self._compute)
+    mtime = os.path.getmtime(self.datafile)
+    os.utime(self.datafile, (mtime + 10, mtime + 10))
+    self.cache.open(ds).get('x', self._compute)
+    self.assertEqual(self.calls, 2)
+
+  def test_config_changed(self):
+    config = dict(metadata=[['x', 'NumericMetadata', 'X']])
+    self.cache.open(FakeDataset(self.datafile, config=config)).get(
+        'x', self._compute)
+    config['metadata'][0][2] = 'New X'
+    self.cache.open(FakeDataset(self.datafile, config=config)).get(
+        'x', self._compute)
+    self.assertEqual(self.calls, 2)
+
+  def test_extra_sources(self):
+    # e.g. a vector dataset's spectra_file
+    npy_file = os.path.join(self.tmpdir, 'spectra.npy')
+    with open(npy_file, 'w') as fh:
+      fh.write('spectra')
+    ds = FakeDataset(self.datafile, extra_sources=[npy_file])
+    self.cache.open(ds).get('x', self._compute)
+    mtime = os.path.getmtime(npy_file)
+    os.utime(npy_file, (mtime + 10, mtime + 10))
+    self.cache.open(ds).get('x', self._compute)
+    self.assertEqual(self.calls, 2)
+
+  def test_uncacheable(self):
+    self.assertIsNone(self.cache.open(FakeDataset()))
+    self.assertIsNone(SidecarCache().open(FakeDataset(self.datafile)))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+
+from backend.value_index import ValueIndex
+
+
+class TestValueIndex(unittest.TestCase):
+  def setUp(self):
+    self.index = ValueIndex(['Basalt', 'andesite', 'Olivine basalt',
+                             'basanite', 'Granite', b'quartz'])
+
+  def test_prefix_then_substring(self):
+    vals, more = self.index.search('bas')
+    self.assertEqual(vals, ['Basalt', 'basanite', 'Olivine basalt'])
+    self.assertFalse(more)
+    vals, _ = self.index.search('ANITE')
+    self.assertEqual(vals, ['basanite', 'Granite'])
+    self.assertEqual(self.index.search('it')[0],
+                     ['andesite', 'basanite', 'Granite'])
+    self.assertEqual(self.index.search('xyz')[0], [])
+    # all trigrams are present, but not in order
+    self.assertEqual(self.index.search('asalbas')[0], [])
+
+  def test_pages(self):
+    vals, more = self.index.search('', offset=0, limit=4)
+    self.assertEqual(vals, ['andesite', 'Basalt', 'basanite', 'Granite'])
+    self.assertTrue(more)
+    vals, more = self.index.search('', offset=4, limit=4)
+    self.assertEqual(vals, ['Olivine basalt', 'quartz'])
+    self.assertFalse(more)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from tornado import gen
+from tornado.testing import AsyncTestCase, gen_test
+
+from backend.watcher import DatasetWatcher
+from backend.web_datasets import DATASETS
+
+
+class FakeDataset(object):
+  kind = 'Raman'
+  name = 'Watched'
+  cold = False
+
+  def __init__(self, path):
+    self.loader_args = (path,)
+    self.load_time = time.time()
+    self.reloads = 0
+
+  def source_files(self):
+    return list(self.loader_args)
+
+  def reload(self):
+    self.reloads += 1
+    self.load_time = time.time()
+    return True
+
+
+class TestDatasetWatcher(AsyncTestCase):
+  def setUp(self):
+    AsyncTestCase.setUp(self)
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmpdir, 'data.txt')
+    with open(self.path, 'w') as fh:
+      fh.write('data')
+    self.ds = FakeDataset(self.path)
+    DATASETS['Raman']['Watched'] = self.ds
+    self.watcher = DatasetWatcher(debounce=0)
+    self.watcher.io_loop = self.io_loop
+
+  def tearDown(self):
+    DATASETS['Raman'].pop('Watched', None)
+    shutil.rmtree(self.tmpdir)
+    AsyncTestCase.tearDown(self)
+
+  @gen_test
+  def test_debounced_refresh(self):
+    yield self.watcher.poll()
+    self.assertEqual(self.ds.reloads, 0)
+    mtime = self.ds.load_time + 10
+    os.utime(self.path, (mtime, mtime))
+    # the first poll sees the change, the next one sees it has settled
+    yield self.watcher.poll()
+    self.assertEqual(self.ds.reloads, 0)
+    yield self.watcher.poll()
+    yield gen.moment
+    self.assertEqual(self.ds.reloads, 1)
+    self.assertEqual(self.watcher.history[0]['trigger'], 'watcher')
+    self.assertEqual(self.watcher.history[0]['result'], 'unchanged')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,116 @@
+import json
+import unittest
+from collections import Counter
+from mock import Mock, patch
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.testing import AsyncTestCase, gen_test
+
+from backend.mpl_server import MatplotlibServer
+
+
+class FakeSocket(MatplotlibServer.WebSocket):
+  '''The websocket handler, without a real connection.'''
+  def __init__(self, application):
+    self.application = application
+    self.ws_connection = object()
+    self.sent = []
+    self.write_future = None
+    self.close = Mock()
+    self.set_nodelay = Mock()
+
+  def write_message(self, message, binary=False):
+    self.sent.append(message)
+    return self.write_future
+
+
+class WebSocketTester(AsyncTestCase):
+  def setUp(self):
+    AsyncTestCase.setUp(self)
+    self.fig_data = Mock(ws_stats=Counter())
+    self.app = Mock(figure_data={1: self.fig_data}, ws_max_fps=0,
+                    ws_event_interval=0.01)
+    self.ws = FakeSocket(self.app)
+    self.ws.open('1')
+
+
+class TestFrameQueue(WebSocketTester):
+  def test_drops_stale_frames(self):
+    self.ws.write_future = Future()
+    self.ws._enqueue_frame(b'frame1', True)
+    # the first frame is still being written, so these wait
+    self.ws._enqueue_frame(b'frame2', True)
+    self.ws._enqueue_frame(b'frame3', True)
+    self.assertEqual(self.ws.sent, [b'frame1'])
+    self.ws.write_future, pending = None, self.ws.write_future
+    pending.set_result(None)
+    self.io_loop.run_sync(lambda: gen.sleep(0.01))
+    self.assertEqual(self.ws.sent, [b'frame1', b'frame3'])
+    self.assertEqual(self.fig_data.ws_stats['frames_dropped'], 1)
+    self.assertEqual(self.fig_data.ws_stats['frames_sent'], 2)
+
+  def test_keeps_diff_frames(self):
+    self.ws._enqueue_json(dict(type='image_mode', mode='diff'))
+    self.ws.write_future = Future()
+    self.ws._enqueue_frame(b'frame1', True)
+    self.ws._enqueue_frame(b'frame2', True)
+    self.ws._enqueue_frame(b'frame3', True)
+    self.ws.write_future, pending = None, self.ws.write_future
+    pending.set_result(None)
+    self.io_loop.run_sync(lambda: gen.sleep(0.01))
+    self.assertEqual(json.loads(self.ws.sent[0])['mode'], 'diff')
+    self.assertEqual(self.ws.sent[1:], [b'frame1', b'frame2', b'frame3'])
+    self.assertEqual(self.fig_data.ws_stats['frames_dropped'], 0)
+
+  @gen_test
+  def test_max_fps(self):
+    self.app.ws_max_fps = 10
+    self.ws._enqueue_frame(b'frame1', True)
+    self.ws._enqueue_frame(b'frame2', True)
+    # other messages stay in order, behind the delayed frame
+    self.ws._enqueue_json(dict(type='refresh'))
+    self.assertEqual(self.ws.sent, [b'frame1'])
+    yield gen.sleep(0.05)
+    self.assertEqual(self.ws.sent, [b'frame1'])
+    yield gen.sleep(0.1)
+    self.assertEqual(self.ws.sent[1], b'frame2')
+    self.assertEqual(json.loads(self.ws.sent[2])['type'], 'refresh')
+
+
+class TestInboundEvents(WebSocketTester):
+  def _send(self, ws, event_type, **kwargs):
+    ws.on_message(json.dumps(dict(type=event_type, figure_id=1, **kwargs)))
+
+  @gen_test
+  def test_batching(self):
+    with patch('backend.mpl_server.RENDERER') as renderer:
+      self._send(self.ws, 'motion_notify', x=1)
+      self._send(self.ws, 'motion_notify', x=2)
+      self._send(self.ws, 'button_press', x=2)
+      self._send(self.ws, 'motion_notify', x=3)
+      self.assertFalse(renderer.submit.called)
+      yield gen.sleep(0.05)
+    self.assertEqual(renderer.submit.call_count, 1)
+    events = renderer.submit.call_args[0][-1]
+    self.assertEqual([(e['type'], e['x']) for e in events],
+                     [('motion_notify', 2), ('button_press', 2),
+                      ('motion_notify', 3)])
+    stats = self.ws.event_stats()
+    self.assertEqual(stats['received'], 4)
+    self.assertEqual(stats['coalesced'], 1)
+    self.assertEqual(stats['dispatched'], 3)
+
+  @gen_test
+  def test_evicted_figure(self):
+    ws = FakeSocket(self.app)
+    ws.open('2')
+    self.assertTrue(ws.close.called)
+    with patch('backend.mpl_server.RENDERER') as renderer:
+      # messages can arrive before the close handshake is done
+      self._send(ws, 'motion_notify', x=1)
+      yield gen.sleep(0.05)
+    self.assertFalse(renderer.submit.called)
+
+
+if __name__ == '__main__':
+  unittest.main()